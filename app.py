@@ -6,30 +6,309 @@ from flask import (
     url_for,
     flash,
     session,
-    send_from_directory,
+    send_file,
+    g,
+    jsonify,
+    Response,
+    stream_with_context,
+    abort,
 )
-import mysql.connector
-from mysql.connector import Error
-from config import DB_CONFIG, SECRET_KEY
+from mysql.connector import Error, IntegrityError, InterfaceError, OperationalError
+from mysql.connector.errors import PoolError
+from config import (
+    DB_CONFIG,
+    SECRET_KEY,
+    DB_POOL_SIZE,
+    DB_POOL_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DOCUMENTS_PAGE_SIZE,
+    DOCUMENTS_MAX_PAGE_SIZE,
+    DOCUMENTS_BULK_CHUNK_SIZE,
+    DOCUMENTS_BULK_MAX_IDS,
+    REF_CACHE_TTL,
+    REF_CACHE_CHECK_INTERVAL,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_CHUNK_SIZE,
+    FILE_SENDFILE_MODE,
+    FILE_ACCEL_PREFIX,
+    RESUMABLE_UPLOAD_MAX_BYTES,
+    RESUMABLE_UPLOAD_TTL,
+    SEARCH_PAGE_SIZE,
+    SEARCH_MAX_PAGE,
+    EXTRACTION_WORKERS,
+    EXTRACTION_MAX_ATTEMPTS,
+    EXTRACTION_POLL_INTERVAL,
+    GC_BATCH_SIZE,
+    GC_GRACE_PERIOD,
+    GC_INTERVAL,
+    THUMBNAIL_CACHE_DIR,
+    THUMBNAIL_CACHE_MAX_BYTES,
+    THUMBNAIL_WORKERS,
+    THUMBNAIL_WAIT,
+    SLOW_QUERY_THRESHOLD_MS,
+    METRICS_ALLOW_FROM,
+    DB_REPLICAS,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_REPLICA_MAX_LAG,
+    READ_YOUR_WRITES_WINDOW,
+    DB_CONNECT_TIMEOUT,
+    DB_BREAKER_FAILURES,
+    DB_BREAKER_RESET_TIMEOUT,
+    DB_MAX_CONCURRENCY,
+    DB_MAX_QUEUE,
+    DB_QUEUE_TIMEOUT,
+    LIVE_POLL_INTERVAL,
+    LIVE_HEARTBEAT_INTERVAL,
+    LIVE_CLIENT_BUFFER,
+    PAGE_CACHE_ENABLED,
+    PAGE_CACHE_MAX_ENTRIES,
+    PAGE_CACHE_CHECK_INTERVAL,
+    PAGE_CACHE_MAX_AGE,
+    COMPRESS_ENABLED,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_LEVEL,
+    COMPRESS_BROTLI_QUALITY,
+)
+from db_pool import ConnectionPool
+from replicas import ReplicaSet
+from circuit import CircuitBreaker, AdmissionLimiter, DatabaseUnavailable, STATE_VALUES
+import counters
+import bulk_documents
+import datagen
+import migrations
+import query_plans
+import repository
+from ref_cache import RefCache
+from uploads import receive_upload, UploadError, UploadTooLarge
+import blob_store
+from file_serving import send_stored_file, content_disposition
+import resumable
+from folder_zip import iter_folder_entries, stream_folder_zip
+import search
+import storage_gc
+import extraction
+import thumbnails
+import live_updates
+from page_cache import PageCache
+import metrics
+import compression
+import static_assets
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 from functools import wraps
+from concurrent.futures import TimeoutError
+import click
+import logging
 import os
+import time
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+logger = logging.getLogger("app")
+metrics.init_app(app, SLOW_QUERY_THRESHOLD_MS / 1000.0)
+static_assets.init_app(app)
+if COMPRESS_ENABLED:
+    compression.init_app(
+        app, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY
+    )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_ROOT = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
+BLOB_ROOT = os.path.join(UPLOAD_ROOT, blob_store.BLOB_DIR)
+os.makedirs(BLOB_ROOT, exist_ok=True)
+
+thumbnail_cache = thumbnails.ThumbnailCache(
+    THUMBNAIL_CACHE_DIR or os.path.join(BASE_DIR, "cache", "thumbnails"),
+    THUMBNAIL_CACHE_MAX_BYTES,
+    workers=THUMBNAIL_WORKERS,
+)
+
+
+# a dead server should fail the connect quickly, not after the OS timeout
+DB_CONNECT_CONFIG = dict(DB_CONFIG, connection_timeout=DB_CONNECT_TIMEOUT)
+db_pool = ConnectionPool(
+    DB_CONNECT_CONFIG,
+    size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_MAX_OVERFLOW,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    pre_ping=DB_POOL_PRE_PING,
+    cursor_wrapper=metrics.TimedCursor,
+)
+replica_set = ReplicaSet(
+    DB_CONNECT_CONFIG,
+    DB_REPLICAS,
+    check_interval=DB_REPLICA_CHECK_INTERVAL,
+    max_lag=DB_REPLICA_MAX_LAG,
+    size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_MAX_OVERFLOW,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    pre_ping=DB_POOL_PRE_PING,
+    cursor_wrapper=metrics.TimedCursor,
+)
+db_breaker = CircuitBreaker("mysql", failure_threshold=DB_BREAKER_FAILURES, reset_timeout=DB_BREAKER_RESET_TIMEOUT)
+db_limiter = AdmissionLimiter(DB_MAX_CONCURRENCY, max_queue=DB_MAX_QUEUE, queue_timeout=DB_QUEUE_TIMEOUT)
+
+
+def _live_updates_connection():
+    # the poller runs outside any request: no admission slot, but it still
+    # respects the circuit breaker so it does not hammer a dead server
+    db_breaker.allow()
+    try:
+        connection = db_pool.acquire()
+    except PoolError:
+        db_breaker.cancel()
+        raise
+    except Error:
+        db_breaker.record_failure()
+        raise
+    db_breaker.record_success()
+    return connection
+
+
+live_dashboard = live_updates.Broadcaster(
+    _live_updates_connection,
+    poll_interval=LIVE_POLL_INTERVAL,
+    max_buffer=LIVE_CLIENT_BUFFER,
+)
+
+
+def _admit():
+    """Take the current request's database slot; held until teardown."""
+    if not g.get("db_admitted"):
+        db_limiter.acquire()
+        g.db_admitted = True
 
 
 def get_db_connection():
+    """Return the connection borrowed for the current request.
+
+    The first call borrows a connection from the pool and keeps it on ``g``;
+    later calls in the same request get the same connection back. It is
+    returned to the pool by release_db_connection() when the request ends.
+
+    Raises DatabaseUnavailable (answered with a 503) when the process is
+    already running DB_MAX_CONCURRENCY requests and the queue is full, when
+    the circuit breaker is open, or when no connection can be made.
+    """
+    if "db_conn" in g:
+        return g.db_conn
+    _admit()
+    db_breaker.allow()
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        connection = db_pool.acquire()
+    except PoolError as e:
+        # every pooled connection is busy: the server is slow, not down
+        db_breaker.cancel()
+        raise DatabaseUnavailable(str(e))
     except Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+        db_breaker.record_failure()
+        logger.error("Error connecting to MySQL: %s", e)
+        raise DatabaseUnavailable("Database connection error")
+    db_breaker.record_success()
+    g.db_conn = connection
+    return connection
+
+
+def get_read_connection():
+    """Return a connection for the read-only queries of the current request.
+
+    GET requests read from a healthy replica when replicas are configured,
+    unless this session wrote something in the last READ_YOUR_WRITES_WINDOW
+    seconds (see pin_reads_to_primary()). Everything else, and every request
+    when no replica is usable, reads from the primary connection.
+    """
+    if "db_read_conn" in g:
+        return g.db_read_conn
+    _admit()
+    connection = None
+    if replica_set and request.method in ("GET", "HEAD") and session.get("read_primary_until", 0) < time.time():
+        connection = replica_set.acquire()
+    if connection is None:
+        return get_db_connection()
+    g.db_read_conn = connection
+    return connection
+
+
+@app.after_request
+def pin_reads_to_primary(response):
+    # replicas may not have this request's writes yet; keep the writer's
+    # own reads on the primary until they have caught up
+    if replica_set and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        session["read_primary_until"] = time.time() + READ_YOUR_WRITES_WINDOW
+    return response
+
+
+@app.teardown_appcontext
+def release_db_connection(exc=None):
+    """Return the request's connections to their pools and free its slot.
+
+    Runs when the request ends; a route that is done with the database but
+    still has slow work ahead may call it early, after which it must not
+    use the connections it got.
+    """
+    # a request that died on a lost or timed-out primary connection counts
+    # towards opening the circuit
+    if "db_conn" in g and isinstance(exc, (OperationalError, InterfaceError)):
+        db_breaker.record_failure()
+    for key in ("db_conn", "db_read_conn"):
+        connection = g.pop(key, None)
+        if connection is not None:
+            connection.release()
+    if g.pop("db_admitted", False):
+        db_limiter.release()
+
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    if request.accept_mimetypes.best == "application/json" or request.is_json:
+        rv = jsonify({"error": "Service temporarily unavailable"})
+        rv.status_code = 503
+    else:
+        rv = Response("Service temporarily unavailable, please try again shortly.\n", status=503, mimetype="text/plain")
+    rv.headers["Retry-After"] = str(e.retry_after)
+    rv.headers["Cache-Control"] = "no-store"
+    return rv
+
+
+# Reference data used for dropdowns and list pages. Write routes call
+# invalidate() inside their transaction, so the change is visible right after
+# the commit. The caches are process-wide, so they always load through the
+# primary connection: a lagging replica must not hide a user's own write.
+categories_cache = RefCache(
+    "categories",
+    "SELECT id, name, description FROM categories ORDER BY name",
+    ttl=REF_CACHE_TTL,
+    check_interval=REF_CACHE_CHECK_INTERVAL,
+)
+departments_cache = RefCache(
+    "departments",
+    "SELECT id, name, description FROM departments ORDER BY name",
+    ttl=REF_CACHE_TTL,
+    check_interval=REF_CACHE_CHECK_INTERVAL,
+)
+users_cache = RefCache(
+    "users",
+    "SELECT id, name, email, role FROM users ORDER BY id",
+    ttl=REF_CACHE_TTL,
+    check_interval=REF_CACHE_CHECK_INTERVAL,
+)
+REF_CACHES = [categories_cache, departments_cache, users_cache]
+
+page_cache = PageCache(
+    max_entries=PAGE_CACHE_MAX_ENTRIES,
+    check_interval=PAGE_CACHE_CHECK_INTERVAL,
+    max_age=PAGE_CACHE_MAX_AGE,
+)
+
+
+def public_page(view_func):
+    """Serve the view from page_cache to visitors without a session."""
+    return page_cache.cached(view_func) if PAGE_CACHE_ENABLED else view_func
 
 
 def login_required(view_func):
@@ -42,6 +321,85 @@ def login_required(view_func):
     return wrapper
 
 
+@app.route("/system/db-pool")
+@login_required
+def db_pool_stats():
+    stats = db_pool.stats()
+    stats["replicas"] = replica_set.stats()
+    stats["breaker"] = db_breaker.stats()
+    stats["admission"] = db_limiter.stats()
+    stats["live_updates"] = live_dashboard.stats()
+    return jsonify(stats)
+
+
+@app.route("/system/caches")
+@login_required
+def ref_cache_stats():
+    stats = {cache.name: cache.stats() for cache in REF_CACHES}
+    stats["pages"] = page_cache.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metrics_page():
+    """Prometheus scrape endpoint for this worker process."""
+    if METRICS_ALLOW_FROM and request.remote_addr not in METRICS_ALLOW_FROM:
+        abort(403)
+    pool_stats = db_pool.stats()
+    extra = metrics.gauge_lines(
+        "app_db_pool",
+        "Connection pool state and counters.",
+        ("stat",),
+        {(key,): value for key, value in pool_stats.items() if key != "pid"},
+    )
+    cache_stats = {}
+    for cache in REF_CACHES:
+        for key, value in cache.stats().items():
+            if key != "version":
+                cache_stats[(cache.name, key)] = value
+    replica_stats = {}
+    for name, stats in replica_set.stats().items():
+        for key in ("open", "idle", "in_use", "timeouts", "failures"):
+            replica_stats[(name, key)] = stats[key]
+        replica_stats[(name, "healthy")] = int(stats["healthy"])
+        if stats["lag"] is not None:
+            replica_stats[(name, "lag_seconds")] = stats["lag"]
+    extra += metrics.gauge_lines("app_db_replica", "Read replica pool and health state.", ("replica", "stat"), replica_stats)
+    breaker_stats = db_breaker.stats()
+    extra += metrics.gauge_lines(
+        "app_db_breaker_state",
+        "Circuit breaker state (0 closed, 1 half open, 2 open).",
+        (),
+        {(): STATE_VALUES[breaker_stats["state"]]},
+    )
+    extra += metrics.gauge_lines(
+        "app_db_breaker",
+        "Circuit breaker counters.",
+        ("stat",),
+        {(key,): breaker_stats[key] for key in ("opened", "rejected", "failures", "successes", "consecutive_failures")},
+    )
+    extra += metrics.gauge_lines(
+        "app_db_admission",
+        "Database admission control state and counters.",
+        ("stat",),
+        {(key,): value for key, value in db_limiter.stats().items()},
+    )
+    extra += metrics.gauge_lines(
+        "app_live_updates",
+        "Live dashboard stream subscribers and counters.",
+        ("stat",),
+        {(key,): value for key, value in live_dashboard.stats().items()},
+    )
+    extra += metrics.gauge_lines("app_ref_cache", "Reference data cache counters.", ("cache", "stat"), cache_stats)
+    extra += metrics.gauge_lines(
+        "app_page_cache",
+        "Full-page cache for anonymous visitors.",
+        ("stat",),
+        {(key,): value for key, value in page_cache.stats().items()},
+    )
+    return Response(metrics.render_all(extra), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/signup", methods=["GET", "POST"])
 def signup():
     if request.method == "POST":
@@ -54,28 +412,19 @@ def signup():
             return render_template("signup.html")
 
         conn = get_db_connection()
-        if not conn:
-            flash("Database connection error", "error")
+        if repository.find_user_by_email(conn, email):
+            flash("Email already registered", "error")
             return render_template("signup.html")
 
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        existing = cursor.fetchone()
-        if existing:
-            cursor.close()
-            conn.close()
+        try:
+            with repository.transaction(conn):
+                repository.create_user(conn, name, email, "user", generate_password_hash(password))
+                counters.user_added(conn, "user")
+                users_cache.invalidate(conn)
+        except IntegrityError:
+            # lost a race with another signup for the same email (uq_users_email)
             flash("Email already registered", "error")
             return render_template("signup.html")
-
-        password_hash = generate_password_hash(password)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (name, email, role, password_hash) VALUES (%s, %s, %s, %s)",
-            (name, email, "user", password_hash),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
         flash("Signup successful. You can now log in.", "success")
         return redirect(url_for("login"))
 
@@ -89,15 +438,7 @@ def login():
         password = request.form.get("password")
 
         conn = get_db_connection()
-        if not conn:
-            flash("Database connection error", "error")
-            return render_template("login.html")
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, email, role, password_hash FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        user = repository.find_user_by_email(conn, email)
 
         if not user or not user.get("password_hash") or not check_password_hash(
             user["password_hash"], password
@@ -123,64 +464,31 @@ def logout():
 
 
 @app.route("/")
+@public_page
 def index():
     """If the user is not logged in show the public landing page.
     If logged in, show the dashboard with real-time stats."""
     if 'user_id' not in session:
         # Public landing page (no login required)
         return render_template('landing.html')
+
+    conn = get_read_connection()
+    totals = counters.read_totals(conn)
     stats = {
-        "total_documents": 0,
-        "total_categories": 0,
+        "total_documents": totals["documents"],
+        "total_categories": totals["categories"],
     }
+
+    # documents per category (for chart)
     category_labels = []
     category_counts = []
-    summary_labels = []
-    summary_counts = []
+    for label, total in counters.documents_per_category(conn):
+        category_labels.append(label or "Uncategorized")
+        category_counts.append(total)
 
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        # total documents
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        stats["total_documents"] = cursor.fetchone()[0]
-
-        # total categories
-        cursor.execute("SELECT COUNT(*) FROM categories")
-        stats["total_categories"] = cursor.fetchone()[0]
-
-        # documents per category (for chart)
-        cursor.execute(
-            """
-            SELECT COALESCE(c.name, 'Uncategorized') AS label, COUNT(d.id) AS total
-            FROM categories c
-            LEFT JOIN documents d ON d.category_id = c.id
-            GROUP BY c.id, c.name
-            ORDER BY label
-            """
-        )
-        rows = cursor.fetchall()
-        for label, total in rows:
-            category_labels.append(label or "Uncategorized")
-            category_counts.append(total)
-
-        # overall summary counts (documents, categories, users, departments)
-        try:
-            cursor.execute("SELECT COUNT(*) FROM users")
-            total_users = cursor.fetchone()[0]
-        except Exception:
-            total_users = 0
-        try:
-            cursor.execute("SELECT COUNT(*) FROM departments")
-            total_departments = cursor.fetchone()[0]
-        except Exception:
-            total_departments = 0
-
-        summary_labels = ["Documents", "Categories", "Users", "Departments"]
-        summary_counts = [stats["total_documents"], stats["total_categories"], total_users, total_departments]
-
-        cursor.close()
-        conn.close()
+    # overall summary counts (documents, categories, users, departments)
+    summary_labels = ["Documents", "Categories", "Users", "Departments"]
+    summary_counts = [totals["documents"], totals["categories"], totals["users"], totals["departments"]]
 
     return render_template(
         "index.html",
@@ -192,20 +500,44 @@ def index():
     )
 
 
+@app.route("/events/dashboard")
+@login_required
+def dashboard_events():
+    """Server-Sent Events stream of dashboard changes (see live_updates.py).
+
+    The stream never touches the request's database connection or admission
+    slot, so an open dashboard costs one idle thread and no MySQL resources;
+    the shared poller does the reading for every client.
+    """
+    def generate():
+        # subscribed only once the server starts the stream: a client gone
+        # before then never runs the generator, and so never reaches the
+        # finally that would unsubscribe it
+        subscriber = live_dashboard.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                events = subscriber.wait(LIVE_HEARTBEAT_INTERVAL)
+                if not events:
+                    yield ": heartbeat\n\n"
+                for event, data in events:
+                    yield live_updates.format_event(event, data)
+        finally:
+            subscriber.close()
+
+    rv = Response(generate(), mimetype="text/event-stream")
+    rv.headers["Cache-Control"] = "no-cache"
+    rv.headers["X-Accel-Buffering"] = "no"  # nginx must not buffer the stream
+    return rv
+
+
 @app.route("/users")
 @login_required
 def users_page():
-    conn = get_db_connection()
-    users = []
-    stats = {"total_users": 0, "admin_users": 0}
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, email, role FROM users ORDER BY id")
-        users = cursor.fetchall()
-        stats["total_users"] = len(users)
-        stats["admin_users"] = sum(1 for u in users if str(u.get("role", "")).lower().startswith("admin"))
-        cursor.close()
-        conn.close()
+    conn = get_read_connection()
+    users = users_cache.get(get_db_connection())
+    totals = counters.read_totals(conn)
+    stats = {"total_users": totals["users"], "admin_users": totals["admin_users"]}
     return render_template("users.html", users=users, stats=stats)
 
 
@@ -222,17 +554,16 @@ def user_create():
             return render_template("user_form.html", user=None)
 
         conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (name, email, role) VALUES (%s, %s, %s)",
-                (name, email, role),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash("User created", "success")
-            return redirect(url_for("users_page"))
+        try:
+            with repository.transaction(conn):
+                repository.create_user(conn, name, email, role)
+                counters.user_added(conn, role)
+                users_cache.invalidate(conn)
+        except IntegrityError:
+            flash("Email already registered", "error")
+            return render_template("user_form.html", user=None)
+        flash("User created", "success")
+        return redirect(url_for("users_page"))
 
     return render_template("user_form.html", user=None)
 
@@ -241,17 +572,8 @@ def user_create():
 @login_required
 def user_edit(user_id):
     conn = get_db_connection()
-    if not conn:
-        flash("Database connection error", "error")
-        return redirect(url_for("users_page"))
-
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-
+    user = repository.get_user(conn, user_id)
     if not user:
-        cursor.close()
-        conn.close()
         flash("User not found", "error")
         return redirect(url_for("users_page"))
 
@@ -264,18 +586,18 @@ def user_edit(user_id):
             flash("Name, email and role are required", "error")
             return render_template("user_form.html", user=user)
 
-        cursor.execute(
-            "UPDATE users SET name = %s, email = %s, role = %s WHERE id = %s",
-            (name, email, role, user_id),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        try:
+            with repository.transaction(conn):
+                old_role = repository.lock_user_role(conn, user_id)
+                repository.update_user(conn, user_id, name, email, role)
+                counters.user_role_changed(conn, old_role, role)
+                users_cache.invalidate(conn)
+        except IntegrityError:
+            flash("Email already registered", "error")
+            return render_template("user_form.html", user=user)
         flash("User updated", "success")
         return redirect(url_for("users_page"))
 
-    cursor.close()
-    conn.close()
     return render_template("user_form.html", user=user)
 
 
@@ -283,13 +605,13 @@ def user_edit(user_id):
 @login_required
 def user_delete(user_id):
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("User deleted", "success")
+    with repository.transaction(conn):
+        role = repository.lock_user_role(conn, user_id)
+        if role is not None:
+            repository.delete_user(conn, user_id)
+            counters.user_removed(conn, user_id, role)
+            users_cache.invalidate(conn)
+    flash("User deleted", "success")
     return redirect(url_for("users_page"))
 
 
@@ -297,15 +619,8 @@ def user_delete(user_id):
 @login_required
 def departments_page():
     conn = get_db_connection()
-    departments = []
-    stats = {"total_departments": 0}
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, description FROM departments ORDER BY name")
-        departments = cursor.fetchall()
-        stats["total_departments"] = len(departments)
-        cursor.close()
-        conn.close()
+    departments = departments_cache.get(conn)
+    stats = {"total_departments": len(departments)}
     return render_template("departments.html", departments=departments, stats=stats)
 
 
@@ -321,17 +636,12 @@ def department_create():
             return render_template("department_form.html", department=None)
 
         conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO departments (name, description) VALUES (%s, %s)",
-                (name, description),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash("Department created", "success")
-            return redirect(url_for("departments_page"))
+        with repository.transaction(conn):
+            repository.create_department(conn, name, description)
+            counters.department_added(conn)
+            departments_cache.invalidate(conn)
+        flash("Department created", "success")
+        return redirect(url_for("departments_page"))
 
     return render_template("department_form.html", department=None)
 
@@ -340,17 +650,8 @@ def department_create():
 @login_required
 def department_edit(dept_id):
     conn = get_db_connection()
-    if not conn:
-        flash("Database connection error", "error")
-        return redirect(url_for("departments_page"))
-
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM departments WHERE id = %s", (dept_id,))
-    department = cursor.fetchone()
-
+    department = repository.get_department(conn, dept_id)
     if not department:
-        cursor.close()
-        conn.close()
         flash("Department not found", "error")
         return redirect(url_for("departments_page"))
 
@@ -362,18 +663,12 @@ def department_edit(dept_id):
             flash("Name is required", "error")
             return render_template("department_form.html", department=department)
 
-        cursor.execute(
-            "UPDATE departments SET name = %s, description = %s WHERE id = %s",
-            (name, description, dept_id),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with repository.transaction(conn):
+            repository.update_department(conn, dept_id, name, description)
+            departments_cache.invalidate(conn)
         flash("Department updated", "success")
         return redirect(url_for("departments_page"))
 
-    cursor.close()
-    conn.close()
     return render_template("department_form.html", department=department)
 
 
@@ -381,13 +676,11 @@ def department_edit(dept_id):
 @login_required
 def department_delete(dept_id):
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM departments WHERE id = %s", (dept_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("Department deleted", "success")
+    with repository.transaction(conn):
+        if repository.delete_department(conn, dept_id):
+            counters.department_added(conn, delta=-1)
+            departments_cache.invalidate(conn)
+    flash("Department deleted", "success")
     return redirect(url_for("departments_page"))
 
 
@@ -395,61 +688,47 @@ def department_delete(dept_id):
 @login_required
 def reports_page():
     """Simple dynamic reports using summary counts from the database."""
+    conn = get_read_connection()
+    totals = counters.read_totals(conn)
     summary = {
-        "total_documents": 0,
-        "total_categories": 0,
-        "total_departments": 0,
-        "total_users": 0,
+        "total_documents": totals["documents"],
+        "total_categories": totals["categories"],
+        "total_departments": totals["departments"],
+        "total_users": totals["users"],
     }
-    docs_by_category = []
 
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-
-        # basic counts
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        summary["total_documents"] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM categories")
-        summary["total_categories"] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM departments")
-        summary["total_departments"] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users")
-        summary["total_users"] = cursor.fetchone()[0]
-
-        # documents grouped by category
-        cursor.execute(
-            """
-            SELECT COALESCE(c.name, 'Uncategorized') AS category_name,
-                   COUNT(d.id) AS document_count
-            FROM categories c
-            LEFT JOIN documents d ON d.category_id = c.id
-            GROUP BY c.id, c.name
-            ORDER BY category_name
-            """
-        )
-        docs_by_category = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
+    # documents grouped by category
+    docs_by_category = counters.documents_per_category(conn)
 
     return render_template("reports.html", summary=summary, docs_by_category=docs_by_category)
 
 
+@app.cli.command("reconcile-counters")
+@click.option("--dry-run", is_flag=True, help="Only report drift, do not rewrite the counters.")
+def reconcile_counters_command(dry_run):
+    """Rebuild summary_counters from the base tables and report any drift."""
+    conn = get_db_connection()
+    drift = counters.reconcile(conn, apply=not dry_run)
+    for scope, scope_key, name, stored, expected in drift:
+        click.echo(f"{scope}:{scope_key}:{name} stored={stored} expected={expected}")
+    action = "found" if dry_run else "fixed"
+    click.echo(f"{len(drift)} counter(s) with drift {action}")
+
+
 @app.route('/about')
+@public_page
 def about_page():
     return render_template('about.html')
 
 
 @app.route('/contact')
+@public_page
 def contact_page():
     return render_template('contact.html')
 
 
 @app.route('/team')
+@public_page
 def team_page():
     # Sample team members — replace or extend as needed
     members = [
@@ -478,31 +757,61 @@ def team_page():
     return render_template('team.html', members=members)
 
 
+def _int_arg(name):
+    try:
+        return int(request.args.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_documents_page(conn, owner_id=None):
+    """Fetch one page of documents, newest first, using keyset pagination.
+
+    ``?before=<id>`` returns the page after that id and ``?after=<id>`` the
+    page before it, so each page is an index range scan on the primary key
+    instead of an OFFSET over the whole table.
+    Returns ``(documents, pagination)``.
+    """
+    page_size = _int_arg("per_page") or DOCUMENTS_PAGE_SIZE
+    page_size = max(1, min(page_size, DOCUMENTS_MAX_PAGE_SIZE))
+    before = _int_arg("before")
+    after = _int_arg("after")
+
+    documents = repository.list_documents(conn, page_size + 1, before=before, after=after, owner_id=owner_id)
+
+    has_more = len(documents) > page_size
+    documents = documents[:page_size]
+    if after is not None:
+        documents.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = before is not None, has_more
+
+    pagination = {
+        "page_size": page_size,
+        "prev_cursor": documents[0]["id"] if documents and has_newer else None,
+        "next_cursor": documents[-1]["id"] if documents and has_older else None,
+    }
+    return documents, pagination
+
+
 @app.route("/documents")
 @login_required
 def documents_list():
-    conn = get_db_connection()
-    documents = []
-    stats = {"total_documents": 0, "uncategorized": 0}
-    categories = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        query = """SELECT d.id, d.title, d.description, d.file_path, d.created_at, c.name AS category_name
-                   FROM documents d
-                   LEFT JOIN categories c ON d.category_id = c.id
-                   ORDER BY d.id DESC"""
-        cursor.execute(query)
-        documents = cursor.fetchall()
-        stats["total_documents"] = len(documents)
-        stats["uncategorized"] = sum(1 for d in documents if not d.get("category_name"))
-
-        # fetch categories for the create modal dropdown
-        cursor.execute("SELECT id, name FROM categories ORDER BY name")
-        categories = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-    return render_template("documents_list.html", documents=documents, stats=stats, categories=categories)
+    conn = get_read_connection()
+    documents, pagination = fetch_documents_page(conn)
+    totals = counters.read_totals(conn)
+    stats = {"total_documents": totals["documents"], "uncategorized": totals["uncategorized_documents"]}
+
+    # categories for the create modal dropdown
+    categories = categories_cache.get(get_db_connection())
+    return render_template(
+        "documents_list.html",
+        documents=documents,
+        stats=stats,
+        categories=categories,
+        pagination=pagination,
+    )
 
 
 @app.route("/my-dashboard")
@@ -511,36 +820,24 @@ def user_dashboard():
     """Per-user dashboard showing only the current user's documents."""
     user_id = session.get("user_id")
     stats = {"total_documents": 0, "uncategorized": 0}
+    pagination = {"page_size": DOCUMENTS_PAGE_SIZE, "prev_cursor": None, "next_cursor": None}
     documents = []
 
-    conn = get_db_connection()
-    if conn and user_id:
-        cursor = conn.cursor(dictionary=True)
-        query = """SELECT d.id, d.title, d.description, d.file_path, d.created_at, c.name AS category_name
-                   FROM documents d
-                   LEFT JOIN categories c ON d.category_id = c.id
-                   WHERE d.owner_id = %s
-                   ORDER BY d.id DESC"""
-        cursor.execute(query, (user_id,))
-        documents = cursor.fetchall()
-        stats["total_documents"] = len(documents)
-        stats["uncategorized"] = sum(1 for d in documents if not d.get("category_name"))
-        cursor.close()
-        conn.close()
-
-    return render_template("user_dashboard.html", documents=documents, stats=stats)
+    conn = get_read_connection()
+    if user_id:
+        documents, pagination = fetch_documents_page(conn, owner_id=user_id)
+        owner_counts = counters.read_scope(conn, "owner", user_id)
+        stats["total_documents"] = owner_counts.get("documents", 0)
+        stats["uncategorized"] = owner_counts.get("uncategorized_documents", 0)
+
+    return render_template("user_dashboard.html", documents=documents, stats=stats, pagination=pagination)
 
 
 @app.route("/documents/create", methods=["GET", "POST"])
 @login_required
 def document_create():
     conn = get_db_connection()
-    categories = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name FROM categories ORDER BY name")
-        categories = cursor.fetchall()
-        cursor.close()
+    categories = categories_cache.get(conn)
 
     if request.method == "POST":
         title = request.form.get("title")
@@ -553,16 +850,11 @@ def document_create():
             flash("Title is required", "error")
             return render_template("document_form.html", categories=categories, document=None)
 
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            insert_query = "INSERT INTO documents (title, description, file_path, category_id, owner_id) VALUES (%s, %s, %s, %s, %s)"
-            cursor.execute(insert_query, (title, description, file_path, category_id, owner_id))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash("Document created successfully", "success")
-            return redirect(url_for("documents_list"))
+        with repository.transaction(conn):
+            repository.create_document(conn, title, description, file_path, category_id, owner_id)
+            counters.document_added(conn, category_id, owner_id)
+        flash("Document created successfully", "success")
+        return redirect(url_for("documents_list"))
 
     return render_template("document_form.html", categories=categories, document=None)
 
@@ -571,23 +863,13 @@ def document_create():
 @login_required
 def document_edit(doc_id):
     conn = get_db_connection()
-    if not conn:
-        flash("Database connection error", "error")
-        return redirect(url_for("documents_list"))
-
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM documents WHERE id = %s", (doc_id,))
-    document = cursor.fetchone()
-
-    cursor.execute("SELECT id, name FROM categories ORDER BY name")
-    categories = cursor.fetchall()
-
+    document = repository.get_document(conn, doc_id)
     if not document:
-        cursor.close()
-        conn.close()
         flash("Document not found", "error")
         return redirect(url_for("documents_list"))
 
+    categories = categories_cache.get(conn)
+
     if request.method == "POST":
         title = request.form.get("title")
         description = request.form.get("description")
@@ -598,18 +880,18 @@ def document_edit(doc_id):
             flash("Title is required", "error")
             return render_template("document_form.html", categories=categories, document=document)
 
-        update_query = """UPDATE documents
-                         SET title = %s, description = %s, file_path = %s, category_id = %s
-                         WHERE id = %s"""
-        cursor.execute(update_query, (title, description, file_path, category_id, doc_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with repository.transaction(conn):
+            old = repository.lock_document(conn, doc_id)
+            if old:
+                repository.update_document(conn, doc_id, title, description, file_path, category_id)
+                counters.document_recategorized(conn, old["category_id"], category_id, old["owner_id"])
+        if not old:
+            # deleted since the form was loaded
+            flash("Document not found", "error")
+            return redirect(url_for("documents_list"))
         flash("Document updated successfully", "success")
         return redirect(url_for("documents_list"))
 
-    cursor.close()
-    conn.close()
     return render_template("document_form.html", categories=categories, document=document)
 
 
@@ -617,40 +899,91 @@ def document_edit(doc_id):
 @login_required
 def document_delete(doc_id):
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("Document deleted", "success")
+    with repository.transaction(conn):
+        row = repository.lock_document(conn, doc_id)
+        if row:
+            repository.delete_document(conn, doc_id)
+            counters.document_removed(conn, row["category_id"], row["owner_id"])
+    flash("Document deleted", "success")
     return redirect(url_for("documents_list"))
 
 
-@app.route("/categories")
+@app.route("/documents/bulk", methods=["POST"])
 @login_required
-def categories_list():
-    conn = get_db_connection()
-    categories = []
-    stats = {"total_categories": 0, "empty_categories": 0}
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, description FROM categories ORDER BY name")
-        categories = cursor.fetchall()
-        stats["total_categories"] = len(categories)
-
-        # count documents per category to know which categories are empty
-        cursor.execute(
-            """SELECT category_id, COUNT(*) AS total
-                FROM documents
-                WHERE category_id IS NOT NULL
-                GROUP BY category_id"""
+def documents_bulk():
+    """Delete, recategorize or reassign many documents at once.
+
+    JSON body: ``{"action": "delete" | "recategorize" | "reassign",
+    "ids": [...]`` or ``"filter": {"category_id", "owner_id",
+    "created_before"}``, plus ``"category_id"`` (null for uncategorized) or
+    ``"owner_id"`` as the new value}. Form posts use the same names with
+    ``filter_`` prefixed to the filter fields and get a flash message
+    instead of the JSON summary.
+    """
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                raise bulk_documents.BulkOperationError("Expected a JSON object")
+            raw_filters = data.get("filter") or {}
+            ids = bulk_documents.parse_ids(data.get("ids"))
+        else:
+            data = request.form
+            raw_filters = {key[len("filter_"):]: value for key, value in data.items() if key.startswith("filter_")}
+            ids = bulk_documents.parse_ids(",".join(data.getlist("ids")))
+        action = data.get("action")
+        value = data.get("owner_id") if action == "reassign" else data.get("category_id")
+        summary = bulk_documents.run(
+            get_db_connection(),
+            action,
+            ids=ids,
+            filters=bulk_documents.parse_filters(raw_filters),
+            value=value,
+            chunk_size=DOCUMENTS_BULK_CHUNK_SIZE,
+            max_ids=DOCUMENTS_BULK_MAX_IDS,
         )
-        counts = {row["category_id"]: row["total"] for row in cursor.fetchall()}
-        stats["empty_categories"] = sum(1 for c in categories if counts.get(c["id"], 0) == 0)
+    except bulk_documents.BulkOperationError as e:
+        if request.is_json:
+            return jsonify({"error": str(e), "summary": e.summary}), 400
+        flash(str(e), "error")
+        return redirect(url_for("documents_list"))
+
+    if request.is_json:
+        return jsonify(summary)
+    verb = {"delete": "deleted", "recategorize": "recategorized", "reassign": "reassigned"}[action]
+    flash(f"{summary['affected']} document(s) {verb}", "success")
+    return redirect(url_for("documents_list"))
+
+
+@app.route("/search")
+@login_required
+def search_page():
+    """Ranked full-text search over documents and uploaded files."""
+    q = (request.args.get("q") or "").strip()
+    page = min(max(request.args.get("page", 1, type=int), 1), SEARCH_MAX_PAGE)
+    results = []
+    has_next = False
 
-        cursor.close()
-        conn.close()
+    if q:
+        conn = get_read_connection()
+        results, has_next = search.search(conn, q, page, SEARCH_PAGE_SIZE)
+
+    return render_template(
+        "search.html",
+        q=q,
+        results=results,
+        page=page,
+        has_next=has_next and page < SEARCH_MAX_PAGE,
+    )
+
+
+@app.route("/categories")
+@login_required
+def categories_list():
+    conn = get_read_connection()
+    categories = categories_cache.get(get_db_connection())
+    totals = counters.read_totals(conn)
+    stats = {"total_categories": totals["categories"], "empty_categories": totals["empty_categories"]}
     return render_template("categories_list.html", categories=categories, stats=stats)
 
 
@@ -658,16 +991,8 @@ def categories_list():
 @login_required
 def activity_page():
     """Simple activity page showing recent documents."""
-    conn = get_db_connection()
-    recent_docs = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, title, created_at FROM documents ORDER BY created_at DESC LIMIT 10"
-        )
-        recent_docs = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    conn = get_read_connection()
+    recent_docs = repository.recent_documents(conn, limit=10)
     return render_template("activity.html", recent_docs=recent_docs)
 
 
@@ -683,17 +1008,12 @@ def category_create():
             return render_template("category_form.html", category=None)
 
         conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO categories (name, description) VALUES (%s, %s)",
-                (name, description),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash("Category created", "success")
-            return redirect(url_for("categories_list"))
+        with repository.transaction(conn):
+            repository.create_category(conn, name, description)
+            counters.category_added(conn)
+            categories_cache.invalidate(conn)
+        flash("Category created", "success")
+        return redirect(url_for("categories_list"))
 
     return render_template("category_form.html", category=None)
 
@@ -702,17 +1022,8 @@ def category_create():
 @login_required
 def category_edit(cat_id):
     conn = get_db_connection()
-    if not conn:
-        flash("Database connection error", "error")
-        return redirect(url_for("categories_list"))
-
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM categories WHERE id = %s", (cat_id,))
-    category = cursor.fetchone()
-
+    category = repository.get_category(conn, cat_id)
     if not category:
-        cursor.close()
-        conn.close()
         flash("Category not found", "error")
         return redirect(url_for("categories_list"))
 
@@ -724,18 +1035,12 @@ def category_edit(cat_id):
             flash("Name is required", "error")
             return render_template("category_form.html", category=category)
 
-        cursor.execute(
-            "UPDATE categories SET name = %s, description = %s WHERE id = %s",
-            (name, description, cat_id),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with repository.transaction(conn):
+            repository.update_category(conn, cat_id, name, description)
+            categories_cache.invalidate(conn)
         flash("Category updated", "success")
         return redirect(url_for("categories_list"))
 
-    cursor.close()
-    conn.close()
     return render_template("category_form.html", category=category)
 
 
@@ -743,13 +1048,12 @@ def category_edit(cat_id):
 @login_required
 def category_delete(cat_id):
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM categories WHERE id = %s", (cat_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("Category deleted", "success")
+    with repository.transaction(conn):
+        if repository.lock_category(conn, cat_id):
+            counters.category_removed(conn, cat_id)
+            repository.delete_category(conn, cat_id)
+            categories_cache.invalidate(conn)
+    flash("Category deleted", "success")
     return redirect(url_for("categories_list"))
 
 
@@ -757,16 +1061,8 @@ def category_delete(cat_id):
 @login_required
 def file_manager_root():
     """Show top-level folders for the file manager."""
-    conn = get_db_connection()
-    folders = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, name, parent_id, created_at FROM file_folders WHERE parent_id IS NULL ORDER BY created_at DESC"
-        )
-        folders = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    conn = get_read_connection()
+    folders = repository.list_root_folders(conn)
     return render_template("file_manager.html", folders=folders, current_folder=None, files=[])
 
 
@@ -774,34 +1070,19 @@ def file_manager_root():
 @login_required
 def file_manager_folder(folder_id):
     """Show a specific folder and its files."""
-    conn = get_db_connection()
-    folder = None
-    folders = []
-    files = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, parent_id, created_at FROM file_folders WHERE id = %s", (folder_id,))
-        folder = cursor.fetchone()
-
-        cursor.execute(
-            "SELECT id, name, parent_id, created_at FROM file_folders WHERE parent_id = %s ORDER BY created_at DESC",
-            (folder_id,),
-        )
-        folders = cursor.fetchall()
-
-        cursor.execute(
-            "SELECT id, title, filename, stored_path, uploaded_at FROM folder_files WHERE folder_id = %s ORDER BY uploaded_at DESC",
-            (folder_id,),
-        )
-        files = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
+    conn = get_read_connection()
+    folder = repository.get_folder(conn, folder_id)
     if not folder:
         flash("Folder not found", "error")
         return redirect(url_for("file_manager_root"))
 
+    folders = repository.list_subfolders(conn, folder_id)
+    files = repository.list_folder_files(conn, folder_id)
+
+    # the page only links to thumbnails; nothing is rendered while listing
+    for f in files:
+        f["has_preview"] = bool(f["sha256"]) and thumbnails.can_preview(f["filename"])
+
     return render_template("file_manager.html", folders=folders, current_folder=folder, files=files)
 
 
@@ -816,16 +1097,9 @@ def file_manager_create_folder():
         return redirect(request.referrer or url_for("file_manager_root"))
 
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO file_folders (name, parent_id) VALUES (%s, %s)",
-            (name, parent_id),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("Folder created", "success")
+    with repository.transaction(conn):
+        repository.create_folder(conn, name, parent_id)
+    flash("Folder created", "success")
 
     if parent_id:
         return redirect(url_for("file_manager_folder", folder_id=parent_id))
@@ -835,63 +1109,393 @@ def file_manager_create_folder():
 @app.route("/file-manager/folder/<int:folder_id>/upload", methods=["POST"])
 @login_required
 def file_manager_upload(folder_id):
-    title = request.form.get("title")
-    file = request.files.get("file")
+    # read the body ourselves so the file streams to disk instead of going
+    # through request.files (do not touch request.form before this)
+    try:
+        fields, received = receive_upload(request, BLOB_ROOT, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE)
+    except UploadTooLarge:
+        flash(f"File is too large (limit is {UPLOAD_MAX_BYTES // (1024 * 1024)} MB)", "error")
+        return redirect(url_for("file_manager_folder", folder_id=folder_id))
+    except UploadError as e:
+        flash(str(e), "error")
+        return redirect(url_for("file_manager_folder", folder_id=folder_id))
 
-    if not title or not file:
+    title = fields.get("title")
+    if not title or not received or not received.filename:
+        if received:
+            received.discard()
         flash("Title and file are required", "error")
         return redirect(url_for("file_manager_folder", folder_id=folder_id))
 
-    from werkzeug.utils import secure_filename
-
-    filename = secure_filename(file.filename)
+    filename = secure_filename(received.filename)
     if not filename:
+        received.discard()
         flash("Invalid file name", "error")
         return redirect(url_for("file_manager_folder", folder_id=folder_id))
 
-    folder_dir = os.path.join(UPLOAD_ROOT, str(folder_id))
-    os.makedirs(folder_dir, exist_ok=True)
-    stored_path = os.path.join(str(folder_id), filename)
-    save_path = os.path.join(UPLOAD_ROOT, stored_path)
-    file.save(save_path)
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        received.discard()
+        raise
+    # identical content uploaded anywhere else shares one blob on disk
+    with blob_store.transaction(conn, UPLOAD_ROOT) as changes:
+        stored_path = blob_store.add_received(conn, UPLOAD_ROOT, received, changes)
+        insert_folder_file(conn, folder_id, title, filename, stored_path, received.sha256, received.size)
+    flash("File uploaded", "success")
+
+    return redirect(url_for("file_manager_folder", folder_id=folder_id))
+
+
+def insert_folder_file(conn, folder_id, title, filename, stored_path, sha256, size):
+    """Insert the folder_files row for a stored upload; the caller commits."""
+    file_id = repository.create_folder_file(conn, folder_id, title, filename, stored_path, sha256, size)
+    # text extraction happens later in the extraction worker, not in this request
+    extraction.enqueue(conn, file_id, sha256)
+    return file_id
+
+
+# Resumable upload API (JSON). A client creates a session, PUTs chunks at
+# byte offsets, can GET the session to see which bytes arrived, and finally
+# POSTs to /complete, which stores the file exactly like file_manager_upload().
+
+
+@app.errorhandler(resumable.UploadSessionError)
+def upload_session_error(e):
+    return jsonify({"error": str(e)}), e.status_code
+
+
+@app.route("/file-manager/folder/<int:folder_id>/uploads", methods=["POST"])
+@login_required
+def upload_session_create(folder_id):
+    data = request.get_json(silent=True) or {}
+    title = data.get("title")
+    filename = secure_filename(data.get("filename") or "")
+    total_size = data.get("size")
+    if not title or not filename or not isinstance(total_size, int) or total_size < 0:
+        return jsonify({"error": "title, filename and size are required"}), 400
+    if total_size > RESUMABLE_UPLOAD_MAX_BYTES:
+        return jsonify({"error": "File is too large"}), 413
 
     conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO folder_files (folder_id, title, filename, stored_path) VALUES (%s, %s, %s, %s)",
-            (folder_id, title, filename, stored_path),
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash("File uploaded", "success")
+    if not repository.get_folder(conn, folder_id):
+        return jsonify({"error": "Folder not found"}), 404
+
+    upload_id = resumable.create_session(
+        conn,
+        BLOB_ROOT,
+        folder_id,
+        session["user_id"],
+        title,
+        filename,
+        total_size,
+        RESUMABLE_UPLOAD_TTL,
+        sha256=data.get("sha256"),
+    )
+    upload = resumable.get_session(conn, upload_id, session["user_id"])
+    return jsonify(resumable.session_status(conn, upload)), 201
 
-    return redirect(url_for("file_manager_folder", folder_id=folder_id))
 
+@app.route("/file-manager/uploads/<upload_id>", methods=["GET"])
+@login_required
+def upload_session_status(upload_id):
+    conn = get_db_connection()
+    upload = resumable.get_session(conn, upload_id, session["user_id"])
+    return jsonify(resumable.session_status(conn, upload))
 
-@app.route("/file-manager/files/<int:file_id>/download")
+
+@app.route("/file-manager/uploads/<upload_id>", methods=["PUT"])
 @login_required
-def file_manager_download(file_id):
+def upload_session_put_chunk(upload_id):
+    """Write one chunk. The offset comes from ``Content-Range: bytes a-b/total``
+    or ``?offset=``; the body length must be given in Content-Length."""
+    length = request.content_length
+    if length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    content_range = request.content_range
+    if content_range is not None and content_range.start is not None:
+        offset = content_range.start
+        if content_range.stop - content_range.start != length:
+            return jsonify({"error": "Content-Range does not match Content-Length"}), 400
+    else:
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            return jsonify({"error": "offset is required"}), 400
+
     conn = get_db_connection()
-    file_rec = None
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, title, filename, stored_path FROM folder_files WHERE id = %s",
-            (file_id,),
+    upload = resumable.get_session(conn, upload_id, session["user_id"])
+    resumable.write_chunk(conn, BLOB_ROOT, upload, offset, length, request.stream, RESUMABLE_UPLOAD_TTL, UPLOAD_CHUNK_SIZE)
+    return jsonify(resumable.session_status(conn, upload))
+
+
+@app.route("/file-manager/uploads/<upload_id>/complete", methods=["POST"])
+@login_required
+def upload_session_complete(upload_id):
+    conn = get_db_connection()
+    upload = resumable.get_session(conn, upload_id, session["user_id"], for_update=True)
+    if upload["status"] == "completed":
+        conn.rollback()
+        return jsonify(resumable.session_status(conn, upload))
+
+    with blob_store.transaction(conn, UPLOAD_ROOT) as changes:
+        with resumable.finish_session(conn, BLOB_ROOT, upload) as (temp_path, sha256, size):
+            stored_path = blob_store.add_temp_file(conn, UPLOAD_ROOT, temp_path, sha256, size, changes)
+        file_id = insert_folder_file(
+            conn, upload["folder_id"], upload["title"], upload["filename"], stored_path, sha256, size
         )
-        file_rec = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        resumable.mark_completed(conn, upload_id, file_id)
+    upload = resumable.get_session(conn, upload_id, session["user_id"])
+    return jsonify(resumable.session_status(conn, upload))
+
+
+@app.cli.command("extraction-worker")
+@click.option("--workers", default=EXTRACTION_WORKERS, show_default=True, help="Size of the process pool.")
+def extraction_worker_command(workers):
+    """Extract text from uploaded files in the background (runs until stopped)."""
+    click.echo(f"extraction worker started with {workers} process(es)")
+    extraction.run_worker(
+        db_pool.acquire,
+        UPLOAD_ROOT,
+        workers=workers,
+        max_attempts=EXTRACTION_MAX_ATTEMPTS,
+        poll_interval=EXTRACTION_POLL_INTERVAL,
+        log=click.echo,
+    )
+
 
+@app.cli.command("expire-upload-sessions")
+def expire_upload_sessions_command():
+    """Remove resumable upload sessions that passed their expiry time."""
+    conn = get_db_connection()
+    removed = resumable.expire_sessions(conn, BLOB_ROOT)
+    click.echo(f"{removed} upload session(s) removed")
+
+
+@app.route("/file-manager/files/<int:file_id>/download")
+@login_required
+def file_manager_download(file_id):
+    conn = get_read_connection()
+    file_rec = repository.get_folder_file(conn, file_id)
     if not file_rec:
         flash("File not found", "error")
         return redirect(url_for("file_manager_root"))
 
-    stored_path = file_rec["stored_path"]
-    directory = UPLOAD_ROOT
-    return send_from_directory(directory, stored_path, as_attachment=True, download_name=file_rec["filename"])
+    return send_stored_file(
+        request,
+        UPLOAD_ROOT,
+        file_rec["stored_path"],
+        file_rec["filename"],
+        sha256=file_rec["sha256"],
+        sendfile_mode=FILE_SENDFILE_MODE,
+        accel_prefix=FILE_ACCEL_PREFIX,
+    )
+
+
+@app.route("/file-manager/folder/<int:folder_id>/download")
+@login_required
+def file_manager_download_folder(folder_id):
+    """Stream the folder, its subfolders and all their files as one ZIP."""
+    conn = get_read_connection()
+    folder = repository.get_folder(conn, folder_id)
+    if not folder:
+        flash("Folder not found", "error")
+        return redirect(url_for("file_manager_root"))
+
+    # the walk runs lazily while the archive streams, so keep the request
+    # context (and its pooled connection) alive until the last byte
+    entries = iter_folder_entries(conn, folder["id"], folder["name"])
+    rv = Response(stream_with_context(stream_folder_zip(entries, UPLOAD_ROOT)), mimetype="application/zip")
+    rv.headers.set("Content-Disposition", "attachment", **content_disposition(f"{folder['name']}.zip"))
+    rv.headers["X-Accel-Buffering"] = "no"
+    return rv
+
+
+@app.route("/file-manager/previews/<sha256>/<kind>.jpg")
+@login_required
+def file_manager_preview(sha256, kind):
+    """Serve a thumbnail or first-page preview for a stored blob.
+
+    The URL is keyed by content hash, so the response never changes and can be
+    cached by the browser for a year.
+    """
+    if kind not in thumbnails.SIZES or len(sha256) != 64:
+        abort(404)
+
+    path = thumbnail_cache.lookup(sha256, kind)
+    if path is False:
+        conn = get_read_connection()
+        stored_path = repository.get_blob_path(conn, sha256)
+        # the render needs no database; waiting for it must not hold a pooled
+        # connection and an admission slot other requests could use
+        release_db_connection()
+        if not stored_path:
+            abort(404)
+        future = thumbnail_cache.request(sha256, kind, os.path.join(UPLOAD_ROOT, stored_path))
+        try:
+            path = future.result(timeout=THUMBNAIL_WAIT)
+        except TimeoutError:
+            rv = Response(status=503)
+            rv.headers["Retry-After"] = "2"
+            rv.headers["Cache-Control"] = "no-store"
+            return rv
+
+    if not path:
+        abort(404)
+    rv = send_file(path, mimetype="image/jpeg", etag=f"{sha256}-{kind}", conditional=True)
+    rv.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return rv
+
+
+@app.route("/file-manager/files/<int:file_id>/delete", methods=["POST"])
+@login_required
+def file_manager_delete_file(file_id):
+    conn = get_db_connection()
+    folder_id = None
+    # the blob file, if this was its last reference, goes only after the commit
+    with blob_store.transaction(conn, UPLOAD_ROOT) as changes:
+        row = repository.lock_folder_file(conn, file_id)
+        if row:
+            folder_id = row["folder_id"]
+            repository.delete_folder_file(conn, file_id)
+            if row["sha256"]:
+                blob_store.release_reference(conn, UPLOAD_ROOT, row["sha256"], changes)
+    if row:
+        flash("File deleted", "success")
+
+    if folder_id:
+        return redirect(url_for("file_manager_folder", folder_id=folder_id))
+    return redirect(url_for("file_manager_root"))
+
+
+@app.cli.command("dedup-uploads")
+@click.option("--dry-run", is_flag=True, help="Only report how much space would be reclaimed.")
+@click.option("--batch-size", default=500, show_default=True)
+def dedup_uploads_command(dry_run, batch_size):
+    """Move legacy uploads/<folder_id>/<name> files into the shared blob store."""
+    conn = get_db_connection()
+    report = blob_store.migrate_legacy_files(conn, UPLOAD_ROOT, batch_size=batch_size, dry_run=dry_run, log=click.echo)
+    if not dry_run:
+        blob_store.recount_references(conn)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+    click.echo(f"reclaimed: {report['bytes_reclaimed'] / (1024 * 1024):.1f} MB")
+
+
+@app.cli.command("reshard-uploads")
+@click.option("--dry-run", is_flag=True, help="Only count the blobs that would move.")
+@click.option("--batch-size", default=500, show_default=True)
+def reshard_uploads_command(dry_run, batch_size):
+    """Move blobs from uploads/blobs/<sha256> to the sharded layout while the app keeps running."""
+    conn = get_db_connection()
+    report = blob_store.reshard_blobs(conn, UPLOAD_ROOT, batch_size=batch_size, dry_run=dry_run, log=click.echo)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
+@app.cli.command("gc-uploads")
+@click.option("--dry-run", is_flag=True, help="Only report orphans; delete nothing and keep the checkpoints.")
+@click.option("--batch-size", default=GC_BATCH_SIZE, show_default=True)
+@click.option("--grace-period", default=GC_GRACE_PERIOD, show_default=True, help="Seconds an unreferenced file is kept.")
+@click.option("--batches", default=1, show_default=True, help="Batches to run; 0 runs until both scans finish a pass.")
+@click.option("--verify", is_flag=True, help="Also re-hash files and report ones that no longer match their sha256.")
+@click.option("--forever", is_flag=True, help="Keep sweeping, one batch every --interval seconds (runs until stopped).")
+@click.option("--interval", default=GC_INTERVAL, show_default=True)
+def gc_uploads_command(dry_run, batch_size, grace_period, batches, verify, forever, interval):
+    """Delete orphaned upload files and report missing ones, resuming from the last checkpoint."""
+    sweeper = storage_gc.Sweeper(
+        db_pool.acquire,
+        UPLOAD_ROOT,
+        batch_size=batch_size,
+        grace_period=grace_period,
+        dry_run=dry_run,
+        verify=verify,
+        log=click.echo,
+    )
+    totals = {}
+    files_done = rows_done = False
+    run = 0
+    while True:
+        try:
+            report = sweeper.run_batch()
+        except Error as e:
+            if not forever:
+                raise click.ClickException(f"Database error: {e}")
+            click.echo(f"gc batch failed: {e}")
+            time.sleep(interval)
+            continue
+        run += 1
+        files_done = files_done or report.pop("files_pass_complete")
+        rows_done = rows_done or report.pop("rows_pass_complete")
+        if forever:
+            click.echo(", ".join(f"{key}: {value}" for key, value in report.items() if value) or "nothing to do")
+            time.sleep(interval)
+            continue
+        for key, value in report.items():
+            totals[key] = totals.get(key, 0) + value
+        if (batches and run >= batches) or (not batches and files_done and rows_done):
+            break
+    for key, value in totals.items():
+        click.echo(f"{key}: {value}")
+    click.echo(f"reclaimable: {totals['orphan_bytes'] / (1024 * 1024):.1f} MB")
+
+
+@app.cli.command("migrate")
+@click.option("--dry-run", is_flag=True, help="Only list the pending migrations.")
+def migrate_command(dry_run):
+    """Apply pending schema migrations (see migrations.py)."""
+    conn = get_db_connection()
+    if dry_run:
+        todo = migrations.pending(conn)
+        for version, name, _ in todo:
+            click.echo(f"pending {version:04d}_{name}")
+        click.echo(f"{len(todo)} migration(s) pending")
+        return
+    try:
+        applied = migrations.migrate(conn, log=click.echo)
+    except migrations.MigrationError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{applied} migration(s) applied")
+
+
+@app.cli.command("build-static")
+@click.option("--prune", is_flag=True, help="Remove fingerprinted files from earlier builds.")
+def build_static_command(prune):
+    """Fingerprint and precompress static/ (see static_assets.py); restart the app afterwards."""
+    if not os.path.isdir(app.static_folder):
+        raise click.ClickException(f"No static folder at {app.static_folder}")
+    manifest = static_assets.build(app.static_folder, prune=prune, log=click.echo)
+    click.echo(f"{len(manifest)} files in {static_assets.BUILD_DIR}/{static_assets.MANIFEST}")
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """EXPLAIN every hot query and fail on full table scans."""
+    conn = get_db_connection()
+    problems = query_plans.check(conn)
+    for name, table, row in problems:
+        click.echo(f"{name}: full scan of {table} (rows={row.get('rows')}, extra={row.get('Extra')})")
+    if problems:
+        raise click.ClickException(f"{len(problems)} full table scan(s) in hot queries")
+    click.echo(f"{len(query_plans.HOT_QUERIES)} hot queries use indexes")
+
+
+@app.cli.command("generate-data")
+@click.option("--scale", type=click.Choice(sorted(datagen.SCALES)), default="1k", show_default=True)
+@click.option("--documents", type=int, help="Override the number of documents for the scale.")
+@click.option("--users", type=int, help="Override the number of users for the scale.")
+@click.option("--seed", default=42, show_default=True, help="Same seed, same data.")
+@click.option("--batch-size", default=5000, show_default=True, help="Rows per multi-row INSERT.")
+def generate_data_command(scale, documents, users, seed, batch_size):
+    """Bulk-load deterministic synthetic data for scale testing."""
+    conn = get_db_connection()
+    spec = dict(datagen.SCALES[scale])
+    if documents is not None:
+        spec["documents"] = documents
+    if users is not None:
+        spec["users"] = users
+    loaded = datagen.generate(conn, UPLOAD_ROOT, spec, seed=seed, batch_size=batch_size, log=click.echo)
+    for table, count in loaded.items():
+        click.echo(f"{table}: {count}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,408 @@
+"""Route benchmark for app.py.
+
+Boots the app in-process (Flask test clients, no network) against a local
+MySQL benchmark database, seeds it with datagen.py at one of its scales and
+drives every route with concurrent clients. For each route it reports
+throughput, p50/p95/p99 latency and DB queries per request, and can save the
+results as JSON and compare them against a saved baseline.
+
+    python bench/run.py --scale 1k --output bench/results.json
+    python bench/run.py --skip-seed --baseline bench/baseline.json --threshold 0.15
+
+Exits with status 1 when a route regressed past the threshold.
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import mysql.connector  # noqa: E402
+
+import config  # noqa: E402
+import datagen  # noqa: E402
+
+# scenarios run without a logged-in session, and the one that ends it
+ANONYMOUS = {"index_anonymous", "login_form", "signup_form", "signup", "login"}
+RELOGIN = {"logout"}
+UPLOAD_SESSION_SIZE = 256 * 1024
+
+
+def schema_statements(database):
+    with open(os.path.join(BASE_DIR, "schema.sql"), encoding="utf-8") as f:
+        sql = f.read().replace("document_db", database)
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def create_database(db_config, database):
+    """(Re)create ``database`` from schema.sql; never the one in config.py."""
+    server = {k: v for k, v in db_config.items() if k != "database"}
+    conn = mysql.connector.connect(**server)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    for statement in schema_statements(database):
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def load_fixtures(conn):
+    cursor = conn.cursor()
+
+    def one(query):
+        cursor.execute(query)
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    fixtures = {
+        "user_id": one("SELECT MIN(id) FROM users WHERE role LIKE 'admin%'"),
+        "user_email": one("SELECT email FROM users WHERE role LIKE 'admin%' ORDER BY id LIMIT 1"),
+        "doc_id": one("SELECT MAX(id) FROM documents"),
+        "category_id": one("SELECT MIN(id) FROM categories"),
+        "dept_id": one("SELECT MIN(id) FROM departments"),
+        "root_folder_id": one("SELECT MIN(id) FROM file_folders WHERE parent_id IS NULL"),
+        "leaf_folder_id": one("SELECT MAX(id) FROM file_folders"),
+        "file_id": one("SELECT MIN(id) FROM folder_files"),
+    }
+    cursor.close()
+    return fixtures
+
+
+def make_deletable(conn, table, count):
+    """Insert rows that the delete scenarios can consume; returns their ids."""
+    cursor = conn.cursor()
+    ids = []
+    token = uuid.uuid4().hex[:8]  # unique across --skip-seed runs
+    for i in range(count):
+        if table == "users":
+            cursor.execute(
+                "INSERT INTO users (name, email, role) VALUES (%s, %s, 'user')",
+                (f"bench delete {i}", f"bench-delete-{token}-{i}@bench.local"),
+            )
+        elif table == "documents":
+            cursor.execute("INSERT INTO documents (title) VALUES (%s)", (f"bench delete {i}",))
+        elif table == "folder_files":
+            cursor.execute(
+                """INSERT INTO folder_files (folder_id, title, filename, stored_path, sha256, size_bytes)
+                   SELECT folder_id, title, filename, stored_path, sha256, size_bytes FROM folder_files LIMIT 1"""
+            )
+            cursor.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE stored_path = (SELECT stored_path FROM folder_files WHERE id = %s)", (cursor.lastrowid,))
+        else:
+            cursor.execute(f"INSERT INTO {table} (name) VALUES (%s)", (f"bench delete {i}",))
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    cursor.close()
+    return iter(ids)
+
+
+def png_bytes(width=512, height=512):
+    """A grayscale gradient PNG, built without Pillow."""
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + bytes((x + y) & 0xFF for x in range(width)) for y in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_preview_file(app_module, conn, folder_id):
+    """Store an image for the preview scenario; returns its sha256."""
+    data = png_bytes()
+    sha256 = hashlib.sha256(data).hexdigest()
+    fd, temp_path = tempfile.mkstemp(dir=app_module.BLOB_ROOT, prefix=".bench-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    with app_module.blob_store.transaction(conn, app_module.UPLOAD_ROOT) as changes:
+        stored_path = app_module.blob_store.add_temp_file(conn, app_module.UPLOAD_ROOT, temp_path, sha256, len(data), changes)
+        app_module.repository.create_folder_file(conn, folder_id, "bench image", "bench.png", stored_path, sha256, len(data))
+    return sha256
+
+
+def make_upload_sessions(app_module, conn, user_id, folder_id, count, filled):
+    """Open resumable upload sessions; with ``filled`` every byte is already
+    received, so the complete scenario only has to store them."""
+    resumable = app_module.resumable
+    ids = []
+    for i in range(count):
+        upload_id = resumable.create_session(
+            conn, app_module.BLOB_ROOT, folder_id, user_id, "bench resumable", f"bench{i}.bin",
+            UPLOAD_SESSION_SIZE, app_module.RESUMABLE_UPLOAD_TTL,
+        )
+        if filled:
+            upload = resumable.get_session(conn, upload_id, user_id)
+            resumable.write_chunk(
+                conn, app_module.BLOB_ROOT, upload, 0, UPLOAD_SESSION_SIZE,
+                io.BytesIO(os.urandom(UPLOAD_SESSION_SIZE)), app_module.RESUMABLE_UPLOAD_TTL,
+            )
+        ids.append(upload_id)
+    return iter(ids)
+
+
+class Body:
+    """A request body other than form data, as client.open() keyword
+    arguments (``json=...`` or ``data=...`` plus ``headers=...``)."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+def scenarios(fx, deletable):
+    """``(name, method, path, data)``; path/data may be callables and data is
+    form data or a Body."""
+    lock = threading.Lock()
+    token = uuid.uuid4().hex[:8]  # new emails must not collide with earlier runs
+    serial = itertools.count()
+
+    def take(name):
+        def next_id():
+            with lock:
+                return next(deletable[name])
+        return next_id
+
+    def email(kind):
+        return f"bench-{kind}-{token}-{next(serial)}@bench.local"
+
+    upload = lambda: {"title": "bench upload", "file": (io.BytesIO(os.urandom(32 * 1024)), "bench.bin")}  # noqa: E731
+    signup = lambda: {"name": "Bench Signup", "email": email("signup"), "password": "bench-password"}  # noqa: E731
+    new_user = lambda: {"name": "Bench User", "email": email("user"), "role": "user"}  # noqa: E731
+    new_session = Body(json={"title": "bench resumable", "filename": "bench.bin", "size": UPLOAD_SESSION_SIZE})
+    chunk = Body(data=os.urandom(64 * 1024), headers={"Content-Type": "application/octet-stream"})
+    return [
+        ("index_anonymous", "GET", "/", None),
+        ("about", "GET", "/about", None),
+        ("contact", "GET", "/contact", None),
+        ("team", "GET", "/team", None),
+        ("login_form", "GET", "/login", None),
+        ("login", "POST", "/login", {"email": fx["user_email"], "password": datagen.DEFAULT_PASSWORD}),
+        ("signup_form", "GET", "/signup", None),
+        ("signup", "POST", "/signup", signup),
+        ("logout", "GET", "/logout", None),
+        ("dashboard", "GET", "/", None),
+        ("reports", "GET", "/reports", None),
+        ("activity", "GET", "/activity", None),
+        ("users", "GET", "/users", None),
+        ("departments", "GET", "/departments", None),
+        ("categories", "GET", "/categories", None),
+        ("documents", "GET", "/documents", None),
+        ("documents_page_2", "GET", f"/documents?before={fx['doc_id'] - 50}", None),
+        ("my_dashboard", "GET", "/my-dashboard", None),
+        ("search", "GET", "/search?q=document", None),
+        ("document_create_form", "GET", "/documents/create", None),
+        ("document_create", "POST", "/documents/create", {"title": "bench doc", "category_id": fx["category_id"]}),
+        ("document_edit", "POST", f"/documents/{fx['doc_id']}/edit", {"title": "bench edit", "category_id": fx["category_id"]}),
+        ("document_delete", "POST", lambda: f"/documents/{take('documents')()}/delete", None),
+        ("documents_bulk", "POST", "/documents/bulk",
+         Body(json={"action": "recategorize", "ids": list(range(fx["doc_id"] - 99, fx["doc_id"] + 1)), "category_id": fx["category_id"]})),
+        ("category_create", "POST", "/categories/create", {"name": "bench category"}),
+        ("category_edit", "POST", f"/categories/{fx['category_id']}/edit", {"name": "bench category"}),
+        ("category_delete", "POST", lambda: f"/categories/{take('categories')()}/delete", None),
+        ("department_create", "POST", "/departments/create", {"name": "bench department"}),
+        ("department_edit", "POST", f"/departments/{fx['dept_id']}/edit", {"name": "bench department"}),
+        ("department_delete", "POST", lambda: f"/departments/{take('departments')()}/delete", None),
+        ("user_create", "POST", "/users/create", new_user),
+        ("user_edit", "POST", f"/users/{fx['user_id']}/edit", {"name": "Bench Admin", "email": "admin@bench.local", "role": "admin"}),
+        ("user_delete", "POST", lambda: f"/users/{take('users')()}/delete", None),
+        ("file_manager_root", "GET", "/file-manager", None),
+        ("file_manager_folder", "GET", f"/file-manager/folder/{fx['leaf_folder_id']}", None),
+        ("folder_create", "POST", "/file-manager/folders/create", {"name": "bench folder", "parent_id": fx["leaf_folder_id"]}),
+        ("file_upload", "POST", f"/file-manager/folder/{fx['leaf_folder_id']}/upload", upload),
+        ("file_download", "GET", f"/file-manager/files/{fx['file_id']}/download", None),
+        ("folder_zip", "GET", f"/file-manager/folder/{fx['root_folder_id']}/download", None),
+        ("file_delete", "POST", lambda: f"/file-manager/files/{take('folder_files')()}/delete", None),
+        ("file_preview", "GET", f"/file-manager/previews/{fx['preview_sha256']}/thumb.jpg", None),
+        ("upload_session_create", "POST", f"/file-manager/folder/{fx['leaf_folder_id']}/uploads", new_session),
+        ("upload_session_status", "GET", f"/file-manager/uploads/{fx['upload_id']}", None),
+        ("upload_chunk", "PUT", f"/file-manager/uploads/{fx['upload_id']}?offset=0", chunk),
+        ("upload_complete", "POST", lambda: f"/file-manager/uploads/{take('upload_sessions')()}/complete", None),
+        ("system_db_pool", "GET", "/system/db-pool", None),
+        ("system_caches", "GET", "/system/caches", None),
+        ("metrics", "GET", "/metrics", None),
+    ]
+
+
+def run_scenario(app, user_id, scenario, total, concurrency):
+    name, method, path, data = scenario
+    results = []
+    results_lock = threading.Lock()
+    per_client = max(1, total // concurrency)
+
+    def log_in(client):
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+            sess["user_name"] = "Bench Admin"
+            sess["user_role"] = "admin"
+
+    def client_loop(_):
+        client = app.test_client()
+        if name not in ANONYMOUS:
+            log_in(client)
+        local = []
+        for _ in range(per_client):
+            if name in RELOGIN:
+                log_in(client)
+            url = path() if callable(path) else path
+            body = data() if callable(data) else data
+            kwargs = body.kwargs if isinstance(body, Body) else {"data": body}
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()  # drain streamed bodies
+            elapsed = time.perf_counter() - started
+            local.append((elapsed, response.status_code, int(response.headers.get("X-Bench-DB-Queries", 0))))
+            response.close()
+        with results_lock:
+            results.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client_loop, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if r[1] >= 500),
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_request": round(sum(r[2] for r in results) / len(results), 2) if results else 0.0,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Return a list of human-readable regressions."""
+    problems = []
+    for name, base in baseline["routes"].items():
+        now = current["routes"].get(name)
+        if now is None:
+            continue
+        if base["p95_ms"] and now["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            problems.append(f"{name}: p95 {base['p95_ms']} ms -> {now['p95_ms']} ms")
+        if base["throughput_rps"] and now["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            problems.append(f"{name}: throughput {base['throughput_rps']} -> {now['throughput_rps']} req/s")
+        if now["queries_per_request"] > base["queries_per_request"] + 0.5:
+            problems.append(f"{name}: queries/request {base['queries_per_request']} -> {now['queries_per_request']}")
+        if now["errors"] > base["errors"]:
+            problems.append(f"{name}: errors {base['errors']} -> {now['errors']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(datagen.SCALES), default="1k")
+    parser.add_argument("--database", default="document_db_bench")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded benchmark database")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--only", help="comma-separated route names to run")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    # point the app at the benchmark database before it is imported
+    config.DB_CONFIG["database"] = args.database
+    # blobs must survive between runs for --skip-seed
+    upload_root = os.path.join(tempfile.gettempdir(), f"{args.database}-uploads")
+    if not args.skip_seed:
+        shutil.rmtree(upload_root, ignore_errors=True)
+        print(f"creating {args.database} and seeding scale {args.scale} ...")
+        create_database(config.DB_CONFIG, args.database)
+
+    import app as app_module
+    from flask import g
+
+    app_module.UPLOAD_ROOT = upload_root
+    app_module.BLOB_ROOT = os.path.join(upload_root, "blobs")
+    os.makedirs(app_module.BLOB_ROOT, exist_ok=True)
+    app = app_module.app
+
+    @app.after_request
+    def expose_query_count(response):
+        response.headers["X-Bench-DB-Queries"] = str(g.get("db_queries", 0))
+        return response
+
+    conn = app_module.db_pool.acquire()
+    if not args.skip_seed:
+        datagen.generate(conn, upload_root, datagen.SCALES[args.scale])
+    fx = load_fixtures(conn)
+    count = args.requests + args.concurrency
+    deletable = {table: make_deletable(conn, table, count)
+                 for table in ("documents", "categories", "departments", "users", "folder_files")}
+    fx["preview_sha256"] = make_preview_file(app_module, conn, fx["leaf_folder_id"])
+    fx["upload_id"] = next(make_upload_sessions(app_module, conn, fx["user_id"], fx["leaf_folder_id"], 1, filled=False))
+    deletable["upload_sessions"] = make_upload_sessions(app_module, conn, fx["user_id"], fx["leaf_folder_id"], count, filled=True)
+    app_module.counters.reconcile(conn)
+    conn.release()
+
+    selected = set(args.only.split(",")) if args.only else None
+    results = {}
+    for scenario in scenarios(fx, deletable):
+        if selected and scenario[0] not in selected:
+            continue
+        results[scenario[0]] = stats = run_scenario(app, fx["user_id"], scenario, args.requests, args.concurrency)
+        print(f"{scenario[0]:<22} {stats['throughput_rps']:>9.1f} req/s  p50 {stats['p50_ms']:>8.2f}  "
+              f"p95 {stats['p95_ms']:>8.2f}  p99 {stats['p99_ms']:>8.2f} ms  "
+              f"{stats['queries_per_request']:>5.1f} q/req  {stats['errors']} errors")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.threshold)
+        if problems:
+            print("regressions:")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""Content-addressed storage for file manager uploads.
+
+Every distinct file body is stored once under
+``<UPLOAD_ROOT>/blobs/<sha256[0:2]>/<sha256[2:4]>/<sha256>`` and has a row in
+the ``blobs`` table with a reference count. Each
+``folder_files`` row that points at a blob holds one reference; the blob file
+is deleted only when the last reference is released.
+
+Both add_reference() and release_reference() lock the ``blobs`` row before
+touching the file, so an upload and a delete of the same content cannot race
+each other into a row without a file.
+
+Files are only ever deleted after the database work is final: run uploads
+and deletes inside ``with blob_store.transaction(conn, upload_root) as
+changes:`` and pass ``changes`` along. A file placed by a transaction that
+rolls back is removed afterwards, and a released blob's file is removed only
+once the delete has committed.
+
+The path of a blob is whatever its ``blobs.stored_path`` says; only new blobs
+get the sharded path from blob_stored_path(). Blobs written before sharding
+(``blobs/<sha256>``) keep working and are moved with reshard_blobs().
+"""
+import hashlib
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+from mysql.connector import Error
+
+logger = logging.getLogger("app.blob_store")
+
+BLOB_DIR = "blobs"
+
+
+def blob_stored_path(sha256):
+    """Path of a new blob relative to the upload root (what folder_files
+    stores). Two levels of hex prefixes keep every directory small."""
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def flat_blob_stored_path(sha256):
+    """Where blobs were stored before sharding."""
+    return f"{BLOB_DIR}/{sha256}"
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class BlobChanges:
+    """Blob files touched by one transaction (see transaction())."""
+
+    def __init__(self):
+        self.created = []   # (sha256, stored_path) placed by add_reference()
+        self.released = []  # (sha256, stored_path) whose last reference went
+
+
+def remove_if_unreferenced(conn, upload_root, sha256, stored_path):
+    """Delete a blob file unless a ``blobs`` row (still, or again) claims it.
+
+    Runs in its own short transaction holding the row lock, so an upload of
+    the same content either sees the row gone and places a new file after
+    this, or has already re-created the row and keeps the file.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT stored_path FROM blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+        row = cursor.fetchone()
+        if row is None or row[0] != stored_path:
+            path = os.path.join(upload_root, stored_path)
+            if os.path.exists(path):
+                os.remove(path)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _cleanup(conn, upload_root, files):
+    for sha256, stored_path in files:
+        try:
+            remove_if_unreferenced(conn, upload_root, sha256, stored_path)
+        except Error as e:
+            # the file is left behind unreferenced; gc-uploads removes it later
+            logger.warning("could not remove blob %s: %s", stored_path, e)
+
+
+@contextmanager
+def transaction(conn, upload_root):
+    """Like repository.transaction(), yielding a BlobChanges to pass to
+    add_*() and release_reference(); blob files are removed only once the
+    outcome is known."""
+    changes = BlobChanges()
+    try:
+        yield changes
+    except BaseException:
+        conn.rollback()
+        _cleanup(conn, upload_root, changes.created)
+        raise
+    conn.commit()
+    _cleanup(conn, upload_root, changes.released)
+
+
+def add_reference(conn, upload_root, sha256, size, place_file, changes=None):
+    """Take a reference on a blob, creating it if needed.
+
+    ``place_file(final_path)`` is called while the blob row is locked when the
+    blob file does not exist yet; it must put the bytes at ``final_path``.
+    Returns ``(stored_path, created)``. The caller commits; a created file is
+    recorded in ``changes`` so a rollback removes it again.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """INSERT INTO blobs (sha256, size_bytes, stored_path, ref_count) VALUES (%s, %s, %s, 1)
+           ON DUPLICATE KEY UPDATE ref_count = ref_count + 1""",
+        (sha256, size, blob_stored_path(sha256)),
+    )
+    # an existing blob may still be at its pre-sharding path
+    cursor.execute("SELECT stored_path FROM blobs WHERE sha256 = %s", (sha256,))
+    stored_path = cursor.fetchone()[0]
+    cursor.close()
+
+    final_path = os.path.join(upload_root, stored_path)
+    created = not os.path.exists(final_path)
+    if created:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        place_file(final_path)
+        if changes is not None:
+            changes.created.append((sha256, stored_path))
+    return stored_path, created
+
+
+def add_temp_file(conn, upload_root, temp_path, sha256, size, changes=None):
+    """Store a fully written temp file as a blob; the temp file is consumed."""
+    stored_path, created = add_reference(
+        conn, upload_root, sha256, size, lambda final_path: os.replace(temp_path, final_path), changes
+    )
+    if not created:
+        os.remove(temp_path)
+    return stored_path
+
+
+def add_received(conn, upload_root, received, changes=None):
+    """Store a ReceivedFile from uploads.receive_upload() as a blob."""
+    stored_path, created = add_reference(conn, upload_root, received.sha256, received.size, received.move_to, changes)
+    if not created:
+        received.discard()
+    return stored_path
+
+
+def release_reference(conn, upload_root, sha256, changes):
+    """Drop one reference; deletes the blob row when none are left and
+    records the file in ``changes`` for removal after the commit.
+
+    Returns True when the blob was removed. The caller commits.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT ref_count, stored_path FROM blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+    row = cursor.fetchone()
+    if not row:
+        cursor.close()
+        return False
+    ref_count, stored_path = row
+    if ref_count > 1:
+        cursor.execute("UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = %s", (sha256,))
+        cursor.close()
+        return False
+
+    cursor.execute("DELETE FROM blobs WHERE sha256 = %s", (sha256,))
+    cursor.close()
+    changes.released.append((sha256, stored_path))
+    return True
+
+
+def _link_or_copy(src):
+    def place(final_path):
+        try:
+            os.link(src, final_path)
+        except OSError:
+            temp_path = final_path + ".tmp"
+            shutil.copyfile(src, temp_path)
+            os.replace(temp_path, final_path)
+
+    return place
+
+
+def recount_references(conn):
+    """Reset every blob's ref_count from the folder_files rows that use it."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """UPDATE blobs b
+           SET ref_count = (SELECT COUNT(*) FROM folder_files f WHERE f.stored_path = b.stored_path)"""
+    )
+    cursor.close()
+    conn.commit()
+
+
+def migrate_legacy_files(conn, upload_root, batch_size=500, dry_run=False, log=print):
+    """Move ``folder_files`` rows that still point at ``<folder_id>/<name>``
+    files onto shared blobs, removing duplicate copies.
+
+    Works in batches ordered by id, committing after each one, and removes a
+    legacy file only once no row references it any more. Returns a report dict.
+    """
+    report = {
+        "rows": 0,
+        "missing": 0,
+        "legacy_bytes": 0,
+        "blob_bytes_written": 0,
+        "legacy_files_removed": 0,
+    }
+    hashed = {}  # legacy stored_path -> (sha256, size)
+    new_blobs = set()
+    last_id = 0
+    cursor = conn.cursor()
+
+    while True:
+        cursor.execute(
+            """SELECT id, stored_path FROM folder_files
+               WHERE id > %s AND stored_path NOT LIKE %s
+               ORDER BY id LIMIT %s""",
+            (last_id, BLOB_DIR + "/%", batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        touched = set()
+
+        for file_id, legacy_path in rows:
+            if legacy_path not in hashed:
+                full_path = os.path.join(upload_root, legacy_path)
+                if not os.path.isfile(full_path):
+                    report["missing"] += 1
+                    log(f"missing: folder_files.id={file_id} {legacy_path}")
+                    continue
+                hashed[legacy_path] = hash_file(full_path)
+                report["legacy_bytes"] += hashed[legacy_path][1]
+            sha256, size = hashed[legacy_path]
+            report["rows"] += 1
+
+            blob_exists = os.path.exists(os.path.join(upload_root, blob_stored_path(sha256))) or os.path.exists(
+                os.path.join(upload_root, flat_blob_stored_path(sha256))
+            )
+            if sha256 not in new_blobs and not blob_exists:
+                new_blobs.add(sha256)
+                report["blob_bytes_written"] += size
+            if dry_run:
+                continue
+
+            stored_path, _ = add_reference(
+                conn, upload_root, sha256, size, _link_or_copy(os.path.join(upload_root, legacy_path))
+            )
+            cursor.execute(
+                "UPDATE folder_files SET stored_path = %s, sha256 = %s, size_bytes = %s WHERE id = %s",
+                (stored_path, sha256, size, file_id),
+            )
+            touched.add(legacy_path)
+
+        if dry_run:
+            continue
+        conn.commit()
+
+        for legacy_path in touched:
+            cursor.execute("SELECT 1 FROM folder_files WHERE stored_path = %s LIMIT 1", (legacy_path,))
+            full_path = os.path.join(upload_root, legacy_path)
+            if cursor.fetchone() is None and os.path.exists(full_path):
+                os.remove(full_path)
+                report["legacy_files_removed"] += 1
+
+    cursor.close()
+    report["bytes_reclaimed"] = report["legacy_bytes"] - report["blob_bytes_written"]
+    return report
+
+
+def reshard_blobs(conn, upload_root, batch_size=500, dry_run=False, log=print):
+    """Move blobs still stored as ``blobs/<sha256>`` to the sharded layout,
+    online.
+
+    Blobs are visited in sha256 order, a batch at a time. Each one is moved
+    in its own short transaction holding the ``blobs`` row lock, so uploads
+    and deletes of that content wait for it rather than race it: the file is
+    hard-linked (or copied) to the new path and ``blobs`` and ``folder_files``
+    rows are pointed at it. The old name is left in place for replicas that
+    still return it and requests already serving it; nothing references it
+    any more, so ``gc-uploads`` removes it once the grace period has passed.
+    Safe to interrupt and re-run. Returns a report dict.
+    """
+    report = {"checked": 0, "moved": 0, "rows_updated": 0, "missing": 0}
+    last_sha = ""
+    cursor = conn.cursor()
+
+    while True:
+        cursor.execute(
+            "SELECT sha256, stored_path FROM blobs WHERE sha256 > %s ORDER BY sha256 LIMIT %s",
+            (last_sha, batch_size),
+        )
+        rows = cursor.fetchall()
+        conn.commit()
+        if not rows:
+            break
+        last_sha = rows[-1][0]
+        report["checked"] += len(rows)
+
+        for sha256, stored_path in rows:
+            new_path = blob_stored_path(sha256)
+            if stored_path == new_path:
+                continue
+            if dry_run:
+                report["moved"] += 1
+                continue
+            try:
+                cursor.execute("SELECT stored_path FROM blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+                row = cursor.fetchone()
+                if not row or row[0] == new_path:
+                    conn.rollback()  # deleted or moved since the batch was read
+                    continue
+                old_path = row[0]
+                old_full_path = os.path.join(upload_root, old_path)
+                new_full_path = os.path.join(upload_root, new_path)
+                if not os.path.exists(new_full_path):
+                    if not os.path.isfile(old_full_path):
+                        conn.rollback()
+                        report["missing"] += 1
+                        log(f"missing: blob {sha256} at {old_path}")
+                        continue
+                    os.makedirs(os.path.dirname(new_full_path), exist_ok=True)
+                    _link_or_copy(old_full_path)(new_full_path)
+                if os.path.isfile(old_full_path):
+                    # the sweeper's grace period runs from the mtime, and a hard
+                    # link shares the original upload's
+                    os.utime(old_full_path)
+                cursor.execute("UPDATE blobs SET stored_path = %s WHERE sha256 = %s", (new_path, sha256))
+                cursor.execute("UPDATE folder_files SET stored_path = %s WHERE stored_path = %s", (new_path, old_path))
+                report["rows_updated"] += cursor.rowcount
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            report["moved"] += 1
+        log(f"resharded {report['moved']} of {report['checked']} blobs checked")
+
+    cursor.close()
+    return report
@@ -0,0 +1,170 @@
+"""Bulk delete, recategorize and reassign for documents.
+
+The documents are chosen either by an explicit list of ids or by a filter
+(category or "none" for uncategorized, owner, created before a date). They
+are processed ``chunk_size`` at a time, each chunk in its own transaction:
+the chunk's rows are locked (re-checking the filter), changed with one
+statement and the summary counters are adjusted with one bump per
+(category, owner) group. A huge selection therefore never holds its locks
+for long, and an interruption leaves every finished chunk committed and
+counted correctly.
+"""
+from collections import Counter
+from collections.abc import Mapping
+from datetime import datetime
+
+import counters
+import repository
+
+ACTIONS = ("delete", "recategorize", "reassign")
+
+
+class BulkOperationError(Exception):
+    def __init__(self, message, summary=None):
+        super().__init__(message)
+        self.summary = summary
+
+
+def _int(value, name):
+    """A positive id from an int or a numeric string."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise BulkOperationError(f"Invalid {name}: {value!r}")
+    try:
+        number = int(value)
+    except ValueError:
+        raise BulkOperationError(f"Invalid {name}: {value!r}")
+    if number <= 0:
+        raise BulkOperationError(f"Invalid {name}: {value!r}")
+    return number
+
+
+def parse_ids(value):
+    """Ids from a list or a comma/space separated string."""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = value.replace(",", " ").split()
+    elif not isinstance(value, (list, tuple)):
+        raise BulkOperationError("ids must be a list of document ids")
+    return sorted({_int(item, "document id") for item in value})
+
+
+def parse_filters(data):
+    """Filter keyword arguments for repository.list_document_ids() from
+    request data; an empty dict means no filter was given."""
+    if not isinstance(data, Mapping):
+        raise BulkOperationError("filter must be an object")
+    filters = {}
+    category = data.get("category_id")
+    if category not in (None, ""):
+        if str(category).lower() == "none":
+            filters["uncategorized"] = True
+        else:
+            filters["category_id"] = _int(category, "category_id")
+    owner = data.get("owner_id")
+    if owner not in (None, ""):
+        filters["owner_id"] = _int(owner, "owner_id")
+    created_before = data.get("created_before")
+    if created_before not in (None, ""):
+        if not isinstance(created_before, str):
+            raise BulkOperationError(f"Invalid created_before: {created_before!r}")
+        try:
+            filters["created_before"] = datetime.fromisoformat(created_before)
+        except ValueError:
+            raise BulkOperationError(f"Invalid created_before: {created_before!r}")
+    return filters
+
+
+def parse_value(action, value):
+    """The new category id (None for uncategorized) or owner id."""
+    if action == "recategorize" and (value is None or value == "" or str(value).lower() == "none"):
+        return None
+    if action == "reassign" and (value is None or value == ""):
+        raise BulkOperationError("owner_id is required to reassign documents")
+    if action == "delete":
+        return None
+    return _int(value, "owner_id" if action == "reassign" else "category_id")
+
+
+def _normalize(value):
+    return int(value) if value is not None else None
+
+
+def _apply(conn, action, rows, value):
+    """Change the locked ``rows``; returns the number of rows affected."""
+    if action == "delete":
+        changed = rows
+    elif action == "recategorize":
+        changed = [row for row in rows if _normalize(row["category_id"]) != value]
+    else:
+        changed = [row for row in rows if _normalize(row["owner_id"]) != value]
+    if not changed:
+        return 0
+    ids = [row["id"] for row in changed]
+
+    # one counter bump per group, in a fixed order so concurrent chunks
+    # touch the counter rows in the same sequence
+    groups = Counter((_normalize(row["category_id"]), _normalize(row["owner_id"])) for row in changed)
+    if action == "delete":
+        affected = repository.delete_documents(conn, ids)
+        for (category_id, owner_id), count in sorted(groups.items(), key=str):
+            counters.document_added(conn, category_id, owner_id, delta=-count)
+    elif action == "recategorize":
+        affected = repository.set_documents_category(conn, ids, value)
+        for (category_id, owner_id), count in sorted(groups.items(), key=str):
+            counters.document_added(conn, category_id, owner_id, delta=-count)
+            counters.document_added(conn, value, owner_id, delta=count)
+    else:
+        affected = repository.set_documents_owner(conn, ids, value)
+        for (category_id, owner_id), count in sorted(groups.items(), key=str):
+            counters.document_reassigned(conn, category_id, owner_id, value, count)
+    return affected
+
+
+def run(conn, action, ids=None, filters=None, value=None, chunk_size=500, max_ids=10000):
+    """Apply ``action`` to the documents in ``ids`` or matching ``filters``.
+
+    ``value`` is the new category id (None for uncategorized) or the new
+    owner id. Returns a summary dict; raises BulkOperationError (carrying the
+    summary of the chunks already committed) on invalid input or when the
+    target category or owner does not exist or disappears half way.
+    """
+    if action not in ACTIONS:
+        raise BulkOperationError(f"Unknown action: {action!r}")
+    if bool(ids) == bool(filters):
+        raise BulkOperationError("Give either document ids or a filter")
+    if ids and len(ids) > max_ids:
+        raise BulkOperationError(f"Too many ids ({len(ids)}); the limit is {max_ids}, use a filter instead")
+    value = parse_value(action, value)
+    filters = filters or {}
+
+    summary = {"action": action, "matched": 0, "affected": 0, "chunks": 0}
+    if ids:
+        summary["requested"] = len(ids)
+    position = 0
+    while True:
+        if ids:
+            chunk = ids[position:position + chunk_size]
+            position += chunk_size
+            if not chunk:
+                break
+        with repository.transaction(conn):
+            if not ids:
+                chunk = repository.list_document_ids(conn, chunk_size, after=position, **filters)
+                if not chunk:
+                    break
+                position = chunk[-1]
+            if action == "recategorize" and value is not None and not repository.lock_category(conn, value):
+                raise BulkOperationError("Category not found", summary)
+            if action == "reassign" and repository.lock_user_role(conn, value) is None:
+                raise BulkOperationError("Owner not found", summary)
+            rows = repository.lock_documents(conn, chunk, **filters)
+            affected = _apply(conn, action, rows, value)
+        summary["chunks"] += 1
+        summary["matched"] += len(rows)
+        summary["affected"] += affected
+
+    summary["unchanged"] = summary["matched"] - summary["affected"]
+    if ids:
+        summary["not_found"] = summary["requested"] - summary["matched"]
+    return summary
@@ -0,0 +1,164 @@
+"""Fail-fast protection for database access.
+
+CircuitBreaker stops a worker from waiting on a database that is down: after
+``failure_threshold`` consecutive failures it opens, and every request is
+refused immediately (a 503 from the app) for ``reset_timeout`` seconds. Then
+it lets ``half_open_max`` probe requests through; one success closes it
+again, one failure re-opens it.
+
+AdmissionLimiter caps how many requests per process hold database resources
+at once. Up to ``max_queue`` more wait (at most ``queue_timeout`` seconds)
+for a slot; anything beyond that is shed right away instead of piling up
+behind a slow database.
+"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of touching the database; the app answers 503."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class CircuitOpen(DatabaseUnavailable):
+    pass
+
+
+class Overloaded(DatabaseUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0, half_open_max=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._counters = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go ahead now.
+
+        Every allowed call must be followed by record_success(),
+        record_failure() or cancel().
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_max:
+                self._probes += 1
+                return
+            self._counters["rejected"] += 1
+            retry_after = self.reset_timeout - (now - self._opened_at) if state == OPEN else 1
+        raise CircuitOpen(f"{self.name} circuit is {state}", retry_after)
+
+    def cancel(self):
+        """The allowed call never reached the database; free its probe slot."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._counters["successes"] += 1
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._counters["opened"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(
+                state=self._current_state(time.monotonic()),
+                consecutive_failures=self._failures,
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout,
+            )
+        return stats
+
+
+class AdmissionLimiter:
+    def __init__(self, max_concurrent, max_queue=0, queue_timeout=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._counters = {"admitted": 0, "queued": 0, "shed": 0, "timeouts": 0}
+
+    def acquire(self):
+        """Take a slot or raise Overloaded; pair with release()."""
+        with self._cond:
+            if self._in_flight < self.max_concurrent:
+                self._in_flight += 1
+                self._counters["admitted"] += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._counters["shed"] += 1
+                raise Overloaded("Too many requests waiting for the database")
+            self._waiting += 1
+            self._counters["queued"] += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise Overloaded("Timed out waiting for a database slot")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(
+                in_flight=self._in_flight,
+                waiting=self._waiting,
+                max_concurrent=self.max_concurrent,
+                max_queue=self.max_queue,
+            )
+        return stats
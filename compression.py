@@ -0,0 +1,113 @@
+"""gzip/brotli compression of dynamic responses.
+
+init_app() registers an after_request hook that compresses a response when
+its content type is in the allowlist, it is at least ``min_size`` bytes (or
+streamed, with its length unknown) and the client accepts an encoding; brotli
+is preferred when the optional ``brotli`` package is installed. Streamed
+responses are compressed chunk by chunk, each chunk flushed so the browser
+can start rendering before the stream ends.
+
+Responses that already carry a Content-Encoding (the public page cache),
+file downloads (direct passthrough, byte ranges) and event streams are left
+alone.
+"""
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class Compressor:
+    def __init__(self, min_size=500, mimetypes=DEFAULT_MIMETYPES, level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, accept_encodings):
+        if brotli is not None and accept_encodings["br"]:
+            return "br"
+        if accept_encodings["gzip"]:
+            return "gzip"
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.flush, compressor.finish
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    def _stream(self, encoding, chunks):
+        compress, flush, finish = self._compressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if chunk:
+                    yield compress(chunk) + flush()
+            yield finish()
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def _compress(self, encoding, body):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+
+    def after_request(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add("Accept-Encoding")
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or request.method == "HEAD"
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "Content-Range" in response.headers
+        ):
+            return response
+        encoding = self._choose(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(encoding, response.response)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            response.set_data(self._compress(encoding, body))
+        response.headers["Content-Encoding"] = encoding
+        # the compressed bytes are a different representation of the resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def init_app(app, **kwargs):
+    compressor = Compressor(**kwargs)
+    app.after_request(compressor.after_request)
+    return compressor
@@ -6,3 +6,91 @@ DB_CONFIG = {
 }
 
 SECRET_KEY = "change-this-secret-key"  # replace with any random string
+
+# Connection pool used by get_db_connection()
+DB_POOL_SIZE = 5            # connections kept open per worker process
+DB_POOL_MAX_OVERFLOW = 10   # extra connections allowed during bursts
+DB_POOL_TIMEOUT = 10        # seconds to wait for a free connection
+DB_POOL_RECYCLE = 3600      # reconnect connections older than this (seconds)
+DB_POOL_PRE_PING = True     # ping a connection before handing it out
+
+# Keyset pagination for /documents and /my-dashboard
+DOCUMENTS_PAGE_SIZE = 50       # default rows per page
+DOCUMENTS_MAX_PAGE_SIZE = 200  # upper bound for ?per_page=
+DOCUMENTS_BULK_CHUNK_SIZE = 500  # rows changed per transaction by /documents/bulk
+DOCUMENTS_BULK_MAX_IDS = 10000   # explicit ids accepted by /documents/bulk (filters are unlimited)
+
+# In-process cache for categories / departments / users (see ref_cache.py)
+REF_CACHE_TTL = 300              # seconds before a cached list is reloaded anyway
+REF_CACHE_CHECK_INTERVAL = 1.0   # how often to re-read the shared version stamp
+
+# File manager uploads
+UPLOAD_MAX_BYTES = 512 * 1024 * 1024   # per-upload size limit, enforced while streaming
+UPLOAD_CHUNK_SIZE = 64 * 1024          # bytes read from the request body at a time
+
+# File manager downloads. Set FILE_SENDFILE_MODE to "x-accel-redirect" (nginx)
+# or "x-sendfile" (Apache/lighttpd) to let the front proxy send the bytes.
+# For nginx, map FILE_ACCEL_PREFIX to the uploads directory as an internal location.
+FILE_SENDFILE_MODE = None
+FILE_ACCEL_PREFIX = "/protected-uploads/"
+
+# Resumable chunked uploads (/file-manager/folder/<id>/uploads)
+RESUMABLE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024 * 1024  # largest file a session may declare
+RESUMABLE_UPLOAD_TTL = 24 * 60 * 60                   # seconds of inactivity before a session expires
+
+# Orphaned-upload garbage collection (flask --app app gc-uploads, see storage_gc.py)
+GC_BATCH_SIZE = 1000               # files / folder_files rows examined per batch
+GC_GRACE_PERIOD = 24 * 60 * 60     # unreferenced files younger than this are left alone
+GC_INTERVAL = 60                   # seconds between batches with --forever
+
+# Full-text search (/search)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50    # deeper pages cost an ever larger OFFSET; refine the query instead
+
+# Background text extraction (flask extraction-worker)
+EXTRACTION_WORKERS = 2          # size of the process pool
+EXTRACTION_MAX_ATTEMPTS = 3     # give up on a file after this many failures
+EXTRACTION_POLL_INTERVAL = 2.0  # seconds between queue polls when idle
+
+# Thumbnails and previews for the file manager (need Pillow; PDFs also need pypdfium2)
+THUMBNAIL_CACHE_DIR = None                 # defaults to <app dir>/cache/thumbnails
+THUMBNAIL_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+THUMBNAIL_WORKERS = 2                      # renders running at once per process
+THUMBNAIL_WAIT = 2.0                       # seconds a request waits for a queued render
+
+# Instrumentation (/metrics)
+SLOW_QUERY_THRESHOLD_MS = 200               # queries slower than this are logged to app.slow_query
+METRICS_ALLOW_FROM = ["127.0.0.1", "::1"]   # client addresses allowed to scrape /metrics; empty allows all
+
+# Read replicas for read-only pages. Each entry overrides keys of DB_CONFIG,
+# e.g. [{"host": "db-replica-1"}, {"host": "127.0.0.1", "port": 3307}].
+# Leave empty to send every query to the primary.
+DB_REPLICAS = []
+DB_REPLICA_CHECK_INTERVAL = 5.0   # seconds between replica health checks
+DB_REPLICA_MAX_LAG = 5            # skip replicas further behind than this (seconds)
+READ_YOUR_WRITES_WINDOW = 10      # seconds a user's reads stay on the primary after a write
+
+# Fail fast when MySQL is slow or down (see circuit.py)
+DB_CONNECT_TIMEOUT = 3           # seconds to wait for a new MySQL connection
+DB_BREAKER_FAILURES = 5          # consecutive failures that open the circuit
+DB_BREAKER_RESET_TIMEOUT = 10.0  # seconds the circuit stays open before a probe
+DB_MAX_CONCURRENCY = 15          # requests per process using the database at once
+DB_MAX_QUEUE = 30                # requests allowed to wait for a slot; more are shed
+DB_QUEUE_TIMEOUT = 2.0           # seconds a queued request waits before a 503
+
+# Live dashboard updates over Server-Sent Events (/events/dashboard)
+LIVE_POLL_INTERVAL = 1.0        # seconds between database polls while clients are connected
+LIVE_HEARTBEAT_INTERVAL = 15.0  # seconds between keep-alive comments on an idle stream
+LIVE_CLIENT_BUFFER = 100        # events buffered per client before it is resynced with a snapshot
+
+# Full-page cache for public pages served to anonymous visitors (see page_cache.py)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_MAX_ENTRIES = 256      # cached URLs per process
+PAGE_CACHE_CHECK_INTERVAL = 2.0   # seconds between template change checks
+PAGE_CACHE_MAX_AGE = 0            # browser max-age; 0 revalidates every time (cheap 304s)
+
+# gzip/brotli for dynamic responses (content types: compression.DEFAULT_MIMETYPES)
+COMPRESS_ENABLED = True
+COMPRESS_MIN_SIZE = 500          # bytes; smaller bodies are sent as is
+COMPRESS_LEVEL = 6               # gzip level
+COMPRESS_BROTLI_QUALITY = 4      # brotli quality for on-the-fly compression (needs `brotli`)
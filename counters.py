@@ -0,0 +1,289 @@
+"""Summary counters kept in the ``summary_counters`` table.
+
+Every create/edit/delete route calls one of the ``*_added``/``*_removed``
+helpers with its own connection before ``conn.commit()``, so the counters
+change in the same transaction as the rows they describe. Pages then read
+their stats with single-row lookups instead of COUNT(*) over whole tables.
+
+Rows are keyed by ``(scope, scope_key, name)``:
+
+- ``('total', '', <name>)`` for documents, categories, users, departments,
+  uncategorized_documents, empty_categories and admin_users
+- ``('category', <category id>, 'documents')``
+- ``('role', <role>, 'users')``
+- ``('owner', <user id>, 'documents' | 'uncategorized_documents')``
+"""
+
+TOTAL_NAMES = (
+    "documents",
+    "categories",
+    "users",
+    "departments",
+    "uncategorized_documents",
+    "empty_categories",
+    "admin_users",
+)
+
+
+def is_admin_role(role):
+    return str(role or "").lower().startswith("admin")
+
+
+def bump(conn, scope, scope_key, name, delta, fetch=False):
+    """Add ``delta`` to a counter; with ``fetch=True`` also return its new value."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """INSERT INTO summary_counters (scope, scope_key, name, value) VALUES (%s, %s, %s, %s)
+           ON DUPLICATE KEY UPDATE value = value + %s""",
+        (scope, str(scope_key), name, delta, delta),
+    )
+    value = None
+    if fetch:
+        # locking read, so we see the row we just updated rather than the snapshot
+        cursor.execute(
+            "SELECT value FROM summary_counters WHERE scope = %s AND scope_key = %s AND name = %s FOR UPDATE",
+            (scope, str(scope_key), name),
+        )
+        value = cursor.fetchone()[0]
+    cursor.close()
+    return value
+
+
+def bump_total(conn, name, delta):
+    bump(conn, "total", "", name, delta)
+
+
+def _bump_category(conn, category_id, delta):
+    value = bump(conn, "category", category_id, "documents", delta, fetch=True)
+    if delta > 0 and value == delta:
+        bump_total(conn, "empty_categories", -1)
+    elif delta < 0 and value == 0:
+        bump_total(conn, "empty_categories", 1)
+
+
+def document_added(conn, category_id, owner_id, delta=1):
+    """Count a new document (or un-count it with ``delta=-1``)."""
+    bump_total(conn, "documents", delta)
+    if category_id:
+        _bump_category(conn, category_id, delta)
+    else:
+        bump_total(conn, "uncategorized_documents", delta)
+    if owner_id:
+        bump(conn, "owner", owner_id, "documents", delta)
+        if not category_id:
+            bump(conn, "owner", owner_id, "uncategorized_documents", delta)
+
+
+def document_removed(conn, category_id, owner_id):
+    document_added(conn, category_id, owner_id, delta=-1)
+
+
+def document_recategorized(conn, old_category_id, new_category_id, owner_id):
+    old_category_id = int(old_category_id) if old_category_id else None
+    new_category_id = int(new_category_id) if new_category_id else None
+    if old_category_id == new_category_id:
+        return
+    document_removed(conn, old_category_id, owner_id)
+    document_added(conn, new_category_id, owner_id)
+
+
+def document_reassigned(conn, category_id, old_owner_id, new_owner_id, count=1):
+    """Move ``count`` documents of one category between owners."""
+    if old_owner_id == new_owner_id:
+        return
+    for owner_id, delta in ((old_owner_id, -count), (new_owner_id, count)):
+        if owner_id:
+            bump(conn, "owner", owner_id, "documents", delta)
+            if not category_id:
+                bump(conn, "owner", owner_id, "uncategorized_documents", delta)
+
+
+def category_added(conn):
+    bump_total(conn, "categories", 1)
+    bump_total(conn, "empty_categories", 1)
+
+
+def category_removed(conn, category_id):
+    """Account for a category delete; call before the DELETE runs.
+
+    The foreign key sets ``documents.category_id`` to NULL, so the category's
+    documents move to the uncategorized counters.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT owner_id, COUNT(*) FROM documents WHERE category_id = %s GROUP BY owner_id",
+        (category_id,),
+    )
+    per_owner = cursor.fetchall()
+    cursor.execute(
+        "DELETE FROM summary_counters WHERE scope = 'category' AND scope_key = %s",
+        (str(category_id),),
+    )
+    cursor.close()
+
+    moved = sum(count for _, count in per_owner)
+    bump_total(conn, "categories", -1)
+    if not moved:
+        bump_total(conn, "empty_categories", -1)
+    else:
+        bump_total(conn, "uncategorized_documents", moved)
+        for owner_id, count in per_owner:
+            if owner_id:
+                bump(conn, "owner", owner_id, "uncategorized_documents", count)
+
+
+def user_added(conn, role, delta=1):
+    bump_total(conn, "users", delta)
+    bump(conn, "role", role or "", "users", delta)
+    if is_admin_role(role):
+        bump_total(conn, "admin_users", delta)
+
+
+def user_role_changed(conn, old_role, new_role):
+    if (old_role or "") == (new_role or ""):
+        return
+    user_added(conn, old_role, delta=-1)
+    user_added(conn, new_role)
+
+
+def user_removed(conn, user_id, role):
+    """Account for a user delete; their documents keep existing without an owner."""
+    user_added(conn, role, delta=-1)
+    cursor = conn.cursor()
+    cursor.execute(
+        "DELETE FROM summary_counters WHERE scope = 'owner' AND scope_key = %s",
+        (str(user_id),),
+    )
+    cursor.close()
+
+
+def department_added(conn, delta=1):
+    bump_total(conn, "departments", delta)
+
+
+READ_SCOPE_SQL = "SELECT name, value FROM summary_counters WHERE scope = %s AND scope_key = %s"
+
+
+def read_scope(conn, scope, scope_key=""):
+    """Return ``{name: value}`` for every counter under one scope key."""
+    cursor = conn.cursor()
+    cursor.execute(READ_SCOPE_SQL, (scope, str(scope_key)))
+    values = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return values
+
+
+def read_totals(conn):
+    totals = dict.fromkeys(TOTAL_NAMES, 0)
+    totals.update(read_scope(conn, "total"))
+    return totals
+
+
+def documents_per_category(conn):
+    """Return ``[(category name, document count)]`` ordered by name."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """SELECT c.name, COALESCE(sc.value, 0)
+           FROM categories c
+           LEFT JOIN summary_counters sc
+                  ON sc.scope = 'category' AND sc.scope_key = CAST(c.id AS CHAR) AND sc.name = 'documents'
+           ORDER BY c.name"""
+    )
+    rows = [(name, int(total)) for name, total in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+
+# everything compute_expected() reads, with the aliases it reads them under;
+# LOCK TABLES only admits queries against tables (and aliases) it names
+_BASE_TABLES = ("documents", "documents AS d", "categories", "categories AS c", "users", "departments")
+
+
+def compute_expected(conn):
+    """Compute every counter from the base tables."""
+    cursor = conn.cursor()
+    expected = {}
+
+    def put(scope, scope_key, name, value):
+        expected[(scope, str(scope_key), name)] = int(value or 0)
+
+    queries = {
+        "documents": "SELECT COUNT(*) FROM documents",
+        "categories": "SELECT COUNT(*) FROM categories",
+        "users": "SELECT COUNT(*) FROM users",
+        "departments": "SELECT COUNT(*) FROM departments",
+        "uncategorized_documents": "SELECT COUNT(*) FROM documents WHERE category_id IS NULL",
+        "empty_categories": """SELECT COUNT(*) FROM categories c
+                               WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.category_id = c.id)""",
+    }
+    for name, query in queries.items():
+        cursor.execute(query)
+        put("total", "", name, cursor.fetchone()[0])
+
+    cursor.execute("SELECT c.id, COUNT(d.id) FROM categories c LEFT JOIN documents d ON d.category_id = c.id GROUP BY c.id")
+    for category_id, count in cursor.fetchall():
+        put("category", category_id, "documents", count)
+
+    admin_users = 0
+    cursor.execute("SELECT role, COUNT(*) FROM users GROUP BY role")
+    for role, count in cursor.fetchall():
+        put("role", role or "", "users", count)
+        if is_admin_role(role):
+            admin_users += count
+    put("total", "", "admin_users", admin_users)
+
+    cursor.execute(
+        """SELECT owner_id, COUNT(*), COALESCE(SUM(category_id IS NULL), 0)
+           FROM documents WHERE owner_id IS NOT NULL GROUP BY owner_id"""
+    )
+    for owner_id, count, uncategorized in cursor.fetchall():
+        put("owner", owner_id, "documents", count)
+        put("owner", owner_id, "uncategorized_documents", uncategorized)
+
+    cursor.close()
+    return expected
+
+
+def reconcile(conn, apply=True):
+    """Rebuild the counters from scratch and return the drift that was found.
+
+    The drift is a list of ``(scope, scope_key, name, stored, expected)``
+    tuples; zero-valued counters that are simply missing are not reported.
+
+    The base tables are read-locked for the whole step: a route's write
+    waits until the counters are rewritten, and transactions already under
+    way commit before the counts are taken, so no change can land between
+    counting and rewriting and be lost.
+    """
+    cursor = conn.cursor()
+    conn.commit()  # LOCK TABLES commits implicitly; make that explicit
+    tables = [f"{table} READ" for table in _BASE_TABLES]
+    tables.append("summary_counters " + ("WRITE" if apply else "READ"))
+    cursor.execute("LOCK TABLES " + ", ".join(tables))
+    try:
+        expected = compute_expected(conn)
+        cursor.execute("SELECT scope, scope_key, name, value FROM summary_counters")
+        stored = {(scope, key, name): int(value) for scope, key, name, value in cursor.fetchall()}
+
+        drift = []
+        for key in sorted(set(stored) | set(expected)):
+            have, want = stored.get(key, 0), expected.get(key, 0)
+            if have != want:
+                drift.append(key + (have, want))
+
+        if apply:
+            cursor.execute("DELETE FROM summary_counters")
+            cursor.executemany(
+                "INSERT INTO summary_counters (scope, scope_key, name, value) VALUES (%s, %s, %s, %s)",
+                [key + (value,) for key, value in expected.items()],
+            )
+            conn.commit()
+        else:
+            conn.rollback()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("UNLOCK TABLES")
+        cursor.close()
+    return drift
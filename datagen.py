@@ -0,0 +1,221 @@
+"""Deterministic synthetic data for scale testing.
+
+generate() appends realistic rows to every base table: users with a mix of
+roles, categories, departments, documents whose category and owner follow a
+Zipf-like skew (a few categories and owners hold most documents), a
+multi-level file_folders tree and folder_files rows backed by real blob files
+under ``<upload_root>/blobs/``. The same seed always produces the same data.
+
+Rows are written with multi-row INSERTs of ``batch_size`` rows and explicit
+ids (so children can reference parents without a round trip per row), with
+foreign key and unique checks switched off for the loading session. Summary
+counters are rebuilt at the end.
+"""
+import hashlib
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import blob_store
+import counters
+
+SCALES = {
+    "1k": {"users": 50, "categories": 20, "departments": 10, "documents": 1_000,
+           "folder_roots": 2, "folder_depth": 3, "folder_fanout": 3, "files_per_folder": 5, "blobs": 20},
+    "100k": {"users": 2_000, "categories": 100, "departments": 30, "documents": 100_000,
+             "folder_roots": 5, "folder_depth": 4, "folder_fanout": 4, "files_per_folder": 10, "blobs": 500},
+    "1m": {"users": 20_000, "categories": 300, "departments": 60, "documents": 1_000_000,
+           "folder_roots": 10, "folder_depth": 5, "folder_fanout": 5, "files_per_folder": 10, "blobs": 2_000},
+    "10m": {"users": 100_000, "categories": 1_000, "departments": 100, "documents": 10_000_000,
+            "folder_roots": 20, "folder_depth": 6, "folder_fanout": 5, "files_per_folder": 10, "blobs": 5_000},
+}
+
+ROLES = (("admin", 1), ("manager", 9), ("user", 90))
+# every generated user can log in with this password
+DEFAULT_PASSWORD = "password"
+SKEW = 1.1
+UNCATEGORIZED_SHARE = 0.08
+HISTORY_DAYS = 3 * 365
+START_DATE = datetime(2023, 1, 1)
+
+WORDS = (
+    "annual report budget contract invoice policy proposal review summary meeting minutes "
+    "project plan design specification audit compliance training manual guide release notes "
+    "quarterly forecast sales marketing research analysis customer supplier agreement draft "
+    "final approved internal external security incident roadmap strategy onboarding payroll "
+    "inventory procurement legal finance operations engineering support quality assurance "
+    "vendor partner schedule template request order delivery warranty license renewal"
+).split()
+
+
+def _zipf_cum_weights(n):
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** SKEW
+        cum.append(total)
+    return cum
+
+
+def _next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def _phrase(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+class _Loader:
+    """Buffers rows per table and flushes them as multi-row INSERTs."""
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.batch_size = batch_size
+        self._buffers = {}
+        self.counts = {}
+
+    def add(self, table, columns, row):
+        rows = self._buffers.setdefault((table, columns), [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(table, columns)
+
+    def flush(self, table, columns):
+        rows = self._buffers.pop((table, columns), None)
+        if not rows:
+            return
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        self.cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholders] * len(rows)),
+            [value for row in rows for value in row],
+        )
+        self.conn.commit()
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+    def flush_all(self):
+        for table, columns in list(self._buffers):
+            self.flush(table, columns)
+
+
+def _write_blobs(rng, upload_root, count):
+    """Create ``count`` distinct text blobs; returns ``[(sha256, size)]``."""
+    blobs = []
+    for n in range(count):
+        lines = [_phrase(rng, 6, 14) for _ in range(int(rng.lognormvariate(3.5, 1.2)) + 1)]
+        body = (f"Generated file {n}\n" + "\n".join(lines) + "\n").encode()
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = os.path.join(upload_root, blob_store.blob_stored_path(sha256))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+        blobs.append((sha256, len(body)))
+    return blobs
+
+
+def generate(conn, upload_root, spec, seed=42, batch_size=5000, log=print):
+    """Append the rows described by ``spec`` (see SCALES) and return row counts."""
+    rng = random.Random(seed)
+    loader = _Loader(conn, batch_size)
+    cursor = loader.cursor
+    cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+    started = time.monotonic()
+
+    try:
+        first_user = _next_id(cursor, "users")
+        password_hash = generate_password_hash(DEFAULT_PASSWORD)
+        roles, role_weights = zip(*ROLES)
+        for n in range(spec["users"]):
+            user_id = first_user + n
+            role = rng.choices(roles, role_weights)[0]
+            loader.add("users", ("id", "name", "email", "role", "password_hash"),
+                       (user_id, f"User {user_id}", f"user{user_id}@example.test", role, password_hash))
+
+        first_category = _next_id(cursor, "categories")
+        for n in range(spec["categories"]):
+            loader.add("categories", ("id", "name", "description"),
+                       (first_category + n, f"Category {first_category + n}", _phrase(rng, 3, 8)))
+
+        first_department = _next_id(cursor, "departments")
+        for n in range(spec["departments"]):
+            loader.add("departments", ("id", "name", "description"),
+                       (first_department + n, f"Department {first_department + n}", _phrase(rng, 3, 8)))
+        loader.flush_all()
+        log(f"reference data loaded ({time.monotonic() - started:.1f}s)")
+
+        category_ids = range(first_category, first_category + spec["categories"])
+        user_ids = range(first_user, first_user + spec["users"])
+        category_weights = _zipf_cum_weights(len(category_ids))
+        owner_weights = _zipf_cum_weights(len(user_ids))
+        first_document = _next_id(cursor, "documents")
+        step = timedelta(days=HISTORY_DAYS) / max(spec["documents"], 1)
+        columns = ("id", "title", "description", "file_path", "category_id", "owner_id", "created_at")
+        for n in range(spec["documents"]):
+            doc_id = first_document + n
+            category = None
+            if category_ids and rng.random() >= UNCATEGORIZED_SHARE:
+                category = rng.choices(category_ids, cum_weights=category_weights)[0]
+            owner = rng.choices(user_ids, cum_weights=owner_weights)[0] if user_ids else None
+            created = START_DATE + step * n + timedelta(seconds=rng.randint(0, 3600))
+            loader.add("documents", columns, (
+                doc_id, _phrase(rng, 2, 6).capitalize(), _phrase(rng, 8, 30),
+                f"/docs/{doc_id}.pdf", category, owner, created,
+            ))
+            if (n + 1) % 1_000_000 == 0:
+                log(f"{n + 1} documents ({time.monotonic() - started:.1f}s)")
+        loader.flush_all()
+        log(f"{spec['documents']} documents loaded ({time.monotonic() - started:.1f}s)")
+
+        blobs = _write_blobs(rng, upload_root, spec["blobs"]) if spec["blobs"] else []
+        blob_weights = _zipf_cum_weights(len(blobs))
+        references = {}
+        next_folder = _next_id(cursor, "file_folders")
+        next_file = _next_id(cursor, "folder_files")
+        level = [None] * spec["folder_roots"]
+        for depth in range(spec["folder_depth"]):
+            children = []
+            for parent_id in level:
+                for n in range(1 if parent_id is None else rng.randint(1, spec["folder_fanout"])):
+                    folder_id = next_folder
+                    next_folder += 1
+                    loader.add("file_folders", ("id", "name", "parent_id"),
+                               (folder_id, f"{_phrase(rng, 1, 2).title()} {folder_id}", parent_id))
+                    children.append(folder_id)
+                    if not blobs:
+                        continue
+                    for _ in range(rng.randint(0, 2 * spec["files_per_folder"])):
+                        sha256, size = rng.choices(blobs, cum_weights=blob_weights)[0]
+                        references[sha256] = references.get(sha256, 0) + 1
+                        loader.add("folder_files",
+                                   ("id", "folder_id", "title", "filename", "stored_path", "sha256", "size_bytes"),
+                                   (next_file, folder_id, _phrase(rng, 1, 4).capitalize(), f"file{next_file}.txt",
+                                    blob_store.blob_stored_path(sha256), sha256, size))
+                        next_file += 1
+            level = children
+        existing = set()
+        if references:
+            cursor.execute(
+                "SELECT sha256 FROM blobs WHERE sha256 IN (" + ", ".join(["%s"] * len(references)) + ")",
+                list(references),
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+        for sha256, size in blobs:
+            if sha256 in references and sha256 not in existing:
+                existing.add(sha256)
+                loader.add("blobs", ("sha256", "size_bytes", "stored_path"),
+                           (sha256, size, blob_store.blob_stored_path(sha256)))
+        loader.flush_all()
+    finally:
+        cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+
+    # blobs may already have existed; recount from folder_files either way
+    blob_store.recount_references(conn)
+    counters.reconcile(conn, apply=True)
+    log(f"done in {time.monotonic() - started:.1f}s")
+    cursor.close()
+    return loader.counts
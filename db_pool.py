@@ -0,0 +1,199 @@
+"""Thread-safe MySQL connection pool used by get_db_connection() in app.py.
+
+Connections are created lazily up to ``size`` (plus ``max_overflow`` extra
+connections under bursts), checked for liveness when borrowed and recycled
+once they are older than ``recycle`` seconds. The pool remembers the process
+it was created in, so a pre-forking server never shares sockets between
+workers: a forked child simply starts with an empty pool.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+
+class PooledConnection:
+    """Proxy around a pooled connection.
+
+    Routes still call ``conn.close()`` when they are done; for a pooled
+    connection that is a no-op and the connection goes back to the pool in the
+    request teardown hook instead.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        wrapper = self._pool.cursor_wrapper
+        return wrapper(cursor) if wrapper else cursor
+
+    @property
+    def statement_cache(self):
+        """Prepared cursors kept for the life of the physical connection
+        (see repository.py); they go away when the connection is closed."""
+        cache = getattr(self._raw, "_statement_cache", None)
+        if cache is None:
+            cache = self._raw._statement_cache = {}
+        return cache
+
+    def close(self):
+        pass
+
+    def release(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self.created_at)
+
+
+class ConnectionPool:
+    def __init__(self, db_config, size=5, max_overflow=10, timeout=10, recycle=3600, pre_ping=True, cursor_wrapper=None):
+        self.db_config = dict(db_config)
+        self.cursor_wrapper = cursor_wrapper
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._counters = {
+            "created": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+        }
+
+    def _check_pid(self):
+        # After a fork the inherited sockets belong to the parent; drop them
+        # without closing (closing would send COM_QUIT on the parent's socket).
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config)
+        with self._cond:
+            self._counters["created"] += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Error:
+            pass
+
+    def acquire(self):
+        """Borrow a connection, waiting up to ``timeout`` seconds for one to be free."""
+        self._check_pid()
+        deadline = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    raw, created_at = None, None
+                    self._open += 1
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._counters["waits"] += 1
+                    wait_started = time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["wait_time"] += time.monotonic() - wait_started
+                    self._counters["timeouts"] += 1
+                    raise PoolError("Timed out waiting for a database connection")
+                self._cond.wait(remaining)
+            if deadline is not None:
+                self._counters["wait_time"] += time.monotonic() - wait_started
+            self._in_use += 1
+
+        try:
+            raw, created_at = self._validate(raw, created_at)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def _validate(self, raw, created_at):
+        if raw is None:
+            return self._connect()
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            self._discard(raw)
+            with self._cond:
+                self._counters["recycled"] += 1
+            return self._connect()
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Error:
+                self._discard(raw)
+                with self._cond:
+                    self._counters["ping_failures"] += 1
+                return self._connect()
+        return raw, created_at
+
+    def _release(self, raw, created_at):
+        if self._pid != os.getpid():
+            return
+        keep = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Error:
+            keep = False
+        if keep and not raw.is_connected():
+            keep = False
+        with self._cond:
+            self._in_use -= 1
+            if keep and len(self._idle) < self.size:
+                self._idle.append((raw, created_at))
+            else:
+                self._open -= 1
+                self._discard(raw)
+            self._cond.notify()
+
+    def dispose(self):
+        """Close every idle connection (borrowed ones are closed on return)."""
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._open -= 1
+                self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(
+                size=self.size,
+                max_overflow=self.max_overflow,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                pid=self._pid,
+            )
+        stats["wait_time"] = round(stats["wait_time"], 6)
+        return stats
@@ -0,0 +1,289 @@
+"""Background text extraction for file manager uploads.
+
+Uploads only enqueue a row in ``extraction_jobs``; the worker started with
+``flask extraction-worker`` claims pending jobs, runs extract_text() on a
+bounded process pool and stores the result in ``file_texts`` (one row per
+content hash, so identical uploads are extracted once). Failed jobs are
+retried with a growing delay up to a maximum number of attempts; a job that
+runs longer than ``job_timeout`` counts as a failed attempt.
+
+Supported formats are plain text, Office Open XML (.docx, .pptx, .xlsx),
+OpenDocument (.odt, .ods, .odp) and, when the optional ``pypdf`` package is
+installed, PDF.
+"""
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+from mysql.connector import Error
+
+try:
+    import pypdf
+except ImportError:  # optional dependency
+    pypdf = None
+
+MAX_TEXT_CHARS = 1_000_000
+MAX_PLAIN_BYTES = 8 * 1024 * 1024
+MAX_XML_BYTES = 64 * 1024 * 1024  # uncompressed, over all parts of one document
+
+PLAIN_EXTENSIONS = {".txt", ".md", ".csv", ".tsv", ".log", ".json", ".xml", ".html", ".htm", ".rst", ".ini", ".yaml", ".yml"}
+OOXML_PARTS = {
+    ".docx": re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$"),
+    ".pptx": re.compile(r"^ppt/slides/slide\d+\.xml$"),
+    ".xlsx": re.compile(r"^xl/sharedStrings\.xml$"),
+}
+ODF_EXTENSIONS = {".odt", ".ods", ".odp"}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def _xml_text(data):
+    root = ElementTree.fromstring(data)
+    return " ".join(t.strip() for t in root.itertext() if t.strip())
+
+
+def _zip_text(path, pattern):
+    parts = []
+    budget = MAX_XML_BYTES
+    with zipfile.ZipFile(path) as zf:
+        for name in sorted(zf.namelist()):
+            if not pattern.match(name):
+                continue
+            # the declared size rejects most zip bombs up front; the bounded
+            # read catches an archive that understates it
+            if zf.getinfo(name).file_size > budget:
+                raise UnsupportedFormat(f"{name} expands to more than {MAX_XML_BYTES} bytes")
+            with zf.open(name) as f:
+                data = f.read(budget + 1)
+            if len(data) > budget:
+                raise UnsupportedFormat(f"{name} expands to more than {MAX_XML_BYTES} bytes")
+            budget -= len(data)
+            parts.append(_xml_text(data))
+    return "\n".join(parts)
+
+
+def extract_text(path, filename):
+    """Return the text content of one file. Runs inside a pool process."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in PLAIN_EXTENSIONS:
+        with open(path, "rb") as f:
+            data = f.read(MAX_PLAIN_BYTES)
+        text = data.decode("utf-8", "replace")
+    elif ext in OOXML_PARTS:
+        text = _zip_text(path, OOXML_PARTS[ext])
+    elif ext in ODF_EXTENSIONS:
+        text = _zip_text(path, re.compile(r"^content\.xml$"))
+    elif ext == ".pdf":
+        if pypdf is None:
+            raise UnsupportedFormat("PDF extraction needs the pypdf package")
+        reader = pypdf.PdfReader(path)
+        pages = []
+        size = 0
+        for page in reader.pages:
+            page_text = page.extract_text() or ""
+            pages.append(page_text)
+            size += len(page_text)
+            if size >= MAX_TEXT_CHARS:
+                break
+        text = "\n".join(pages)
+    else:
+        raise UnsupportedFormat(f"No text extractor for {ext or 'files without an extension'}")
+    return text[:MAX_TEXT_CHARS]
+
+
+def enqueue(conn, file_id, sha256):
+    """Queue a file for extraction; call in the upload transaction."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM file_texts WHERE sha256 = %s", (sha256,))
+    status = "done" if cursor.fetchone() else "pending"
+    cursor.execute(
+        "INSERT INTO extraction_jobs (file_id, sha256, status) VALUES (%s, %s, %s)",
+        (file_id, sha256, status),
+    )
+    cursor.close()
+
+
+CLAIM_JOBS_SQL = """SELECT j.id, j.sha256, j.attempts, f.filename, f.stored_path
+                    FROM extraction_jobs j
+                    JOIN folder_files f ON f.id = j.file_id
+                    WHERE j.status = 'pending' AND j.available_at <= NOW()
+                    ORDER BY j.id
+                    LIMIT %s
+                    FOR UPDATE OF j SKIP LOCKED"""
+FINISH_CONTENT_JOBS_SQL = """UPDATE extraction_jobs SET status = 'done', last_error = NULL, finished_at = NOW()
+                             WHERE sha256 = %s AND status IN ('pending', 'running')"""
+
+
+def _claim_jobs(conn, limit):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(CLAIM_JOBS_SQL, (limit,))
+    jobs = cursor.fetchall()
+    for job in jobs:
+        cursor.execute(
+            "UPDATE extraction_jobs SET status = 'running', attempts = attempts + 1, started_at = NOW() WHERE id = %s",
+            (job["id"],),
+        )
+    conn.commit()
+    cursor.close()
+    return jobs
+
+
+def _finish_job(conn, job, text=None, error=None, max_attempts=3, retry_delay=60):
+    cursor = conn.cursor()
+    if error is None:
+        cursor.execute(
+            "INSERT INTO file_texts (sha256, text) VALUES (%s, %s) ON DUPLICATE KEY UPDATE text = %s",
+            (job["sha256"], text, text),
+        )
+        # every job for the same content is satisfied by this one extraction
+        cursor.execute(FINISH_CONTENT_JOBS_SQL, (job["sha256"],))
+    elif isinstance(error, UnsupportedFormat) or job["attempts"] + 1 >= max_attempts:
+        status = "unsupported" if isinstance(error, UnsupportedFormat) else "failed"
+        cursor.execute(
+            "UPDATE extraction_jobs SET status = %s, last_error = %s, finished_at = NOW() WHERE id = %s",
+            (status, str(error)[:1000], job["id"]),
+        )
+    else:
+        delay = retry_delay * (2 ** job["attempts"])
+        cursor.execute(
+            """UPDATE extraction_jobs
+               SET status = 'pending', last_error = %s, available_at = NOW() + INTERVAL %s SECOND
+               WHERE id = %s""",
+            (str(error)[:1000], delay, job["id"]),
+        )
+    conn.commit()
+    cursor.close()
+
+
+def requeue_stale(conn, timeout, exclude=()):
+    """Put jobs left 'running' by a crashed worker back in the queue;
+    ``exclude`` holds the ids of the jobs the caller is still running."""
+    sql = """UPDATE extraction_jobs SET status = 'pending'
+             WHERE status = 'running' AND started_at < NOW() - INTERVAL %s SECOND"""
+    params = [timeout]
+    if exclude:
+        sql += f" AND id NOT IN ({', '.join(['%s'] * len(exclude))})"
+        params.extend(exclude)
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    conn.commit()
+    cursor.close()
+
+
+def _release_jobs(conn, job_ids):
+    """Put jobs interrupted by a pool restart back in the queue without
+    counting the attempt against them."""
+    if not job_ids:
+        return
+    cursor = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(job_ids))
+    cursor.execute(
+        f"""UPDATE extraction_jobs SET status = 'pending', attempts = attempts - 1
+            WHERE status = 'running' AND id IN ({placeholders})""",
+        list(job_ids),
+    )
+    conn.commit()
+    cursor.close()
+
+
+def _restart_pool(pool, workers, kill=True):
+    """Replace ``pool`` with a fresh one. A running extraction cannot be
+    cancelled, so with ``kill`` its processes are killed first."""
+    if kill:
+        kill_workers = getattr(pool, "kill_workers", None)  # Python 3.14+
+        if kill_workers is not None:
+            kill_workers()
+        else:
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def run_worker(connect, upload_root, workers=2, max_attempts=3, poll_interval=2.0, job_timeout=600, log=print):
+    """Process the job queue until interrupted.
+
+    ``connect()`` must return a pooled connection (with ``release()``); one
+    is borrowed per polling round so the worker never holds a stale one, and
+    a database error only costs that round (jobs whose result was lost are
+    picked up again by requeue_stale()). A job still running ``job_timeout``
+    seconds after it was submitted fails, and the pool is restarted to stop
+    it; the other jobs the restart interrupts go back to the queue. A pool
+    broken by a crashed process is replaced the same way.
+    """
+    in_flight = {}  # future -> (job, deadline, the pool it runs in)
+    last_requeue = 0.0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            conn = None
+            try:
+                conn = connect()
+                if time.monotonic() - last_requeue > job_timeout:
+                    # this worker's own jobs are not stale, however long they have run
+                    requeue_stale(conn, job_timeout, exclude=[job["id"] for job, _, _ in in_flight.values()])
+                    last_requeue = time.monotonic()
+
+                # no more jobs than processes, so each one starts (and its
+                # deadline runs) as soon as it is submitted
+                free = workers - len(in_flight)
+                if free > 0:
+                    for job in _claim_jobs(conn, free):
+                        path = os.path.join(upload_root, job["stored_path"])
+                        try:
+                            future = pool.submit(extract_text, path, job["filename"])
+                        except BrokenProcessPool:
+                            pool = _restart_pool(pool, workers, kill=False)
+                            future = pool.submit(extract_text, path, job["filename"])
+                        in_flight[future] = (job, time.monotonic() + job_timeout, pool)
+
+                if not in_flight:
+                    conn.release()
+                    conn = None
+                    time.sleep(poll_interval)
+                    continue
+
+                next_deadline = min(deadline for _, deadline, _ in in_flight.values())
+                timeout = max(0.0, min(poll_interval, next_deadline - time.monotonic()))
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job, _, owner = in_flight.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool) and owner is pool:
+                            broken = True
+                        log(f"extraction job {job['id']} failed: {e}")
+                        _finish_job(conn, job, error=e, max_attempts=max_attempts)
+                    else:
+                        _finish_job(conn, job, text=text)
+
+                now = time.monotonic()
+                expired = [future for future, (_, deadline, _) in in_flight.items() if deadline <= now and not future.done()]
+                if expired or broken:
+                    for future in expired:
+                        job = in_flight.pop(future)[0]
+                        log(f"extraction job {job['id']} timed out after {job_timeout}s")
+                        error = TimeoutError(f"Extraction took longer than {job_timeout} seconds")
+                        _finish_job(conn, job, error=error, max_attempts=max_attempts)
+                    interrupted = [future for future, (_, _, owner) in in_flight.items() if owner is pool]
+                    _release_jobs(conn, [in_flight.pop(future)[0]["id"] for future in interrupted])
+                    pool = _restart_pool(pool, workers, kill=not broken)
+            except Error as e:
+                log(f"extraction worker: database error, retrying in {poll_interval}s: {e}")
+                if conn is not None:
+                    conn.release()
+                    conn = None
+                time.sleep(poll_interval)
+            finally:
+                if conn is not None:
+                    conn.release()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
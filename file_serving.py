@@ -0,0 +1,166 @@
+"""Serving stored files with validators, byte ranges and proxy offload.
+
+send_stored_file() is a replacement for send_from_directory() that knows the
+file's content hash. It answers conditional requests (If-None-Match,
+If-Modified-Since) with 304, single and multiple byte ranges with 206, honours
+If-Range, and can hand the transfer to the front proxy with X-Accel-Redirect
+(nginx) or X-Sendfile (Apache, lighttpd) so the worker is released at once.
+"""
+import mimetypes
+import os
+import unicodedata
+import uuid
+from urllib.parse import quote
+
+from flask import Response, abort
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def content_disposition(download_name):
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        return {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    return {"filename": download_name}
+
+
+def _satisfiable_ranges(req, length):
+    """Return the requested ``(start, stop)`` byte ranges, clamped to the file.
+
+    Returns None when the request should get the whole file, and an empty list
+    when it asked only for ranges past the end (416).
+    """
+    rng = req.range
+    if rng is None or rng.units != "bytes" or len(rng.ranges) > MAX_RANGES:
+        return None
+    ranges = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(length + start, 0), length
+        elif stop is None or stop > length:
+            stop = length
+        if start < stop:
+            ranges.append((start, stop))
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _read_ranges(path, parts, chunk_size=CHUNK_SIZE):
+    """Yield the bytes of ``parts``: a list of (prefix bytes, start, stop)."""
+    with open(path, "rb") as f:
+        for prefix, start, stop in parts:
+            if prefix:
+                yield prefix
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+
+def send_stored_file(req, root, stored_path, download_name, sha256=None, sendfile_mode=None, accel_prefix="/protected-uploads/"):
+    path = safe_join(root, stored_path)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    length = stat.st_size
+    mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    etag = sha256
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": "private, no-cache",
+    }
+    rv = Response(status=200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    rv.headers.set("Content-Disposition", "attachment", **content_disposition(download_name))
+    if etag:
+        rv.set_etag(etag)
+
+    # conditional GET; If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if etag and req.if_none_match:
+        not_modified = req.if_none_match.contains(etag)
+    else:
+        not_modified = req.if_modified_since is not None and int(stat.st_mtime) <= req.if_modified_since.timestamp()
+    if not_modified:
+        rv.status_code = 304
+        return rv
+
+    if sendfile_mode == "x-accel-redirect":
+        rv.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(stored_path.replace(os.sep, "/"))
+        return rv
+    if sendfile_mode == "x-sendfile":
+        rv.headers["X-Sendfile"] = path
+        return rv
+
+    ranges = None
+    if req.range is not None:
+        # If-Range must carry our strong ETag (or the exact date) to allow a partial response
+        if_range = req.if_range
+        if if_range.etag is not None:
+            range_ok = bool(etag) and if_range.etag == etag
+        elif if_range.date is not None:
+            range_ok = int(stat.st_mtime) <= if_range.date.timestamp()
+        else:
+            range_ok = True
+        if range_ok:
+            ranges = _satisfiable_ranges(req, length)
+
+    if ranges is None:
+        rv.response = wrap_file(req.environ, open(path, "rb"), CHUNK_SIZE)
+        rv.content_length = length
+        return rv
+
+    if not ranges:
+        rv.status_code = 416
+        rv.headers["Content-Range"] = f"bytes */{length}"
+        rv.response = []
+        rv.content_length = 0
+        return rv
+
+    rv.status_code = 206
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        rv.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+        rv.response = _read_ranges(path, [(b"", start, stop)])
+        rv.content_length = stop - start
+        return rv
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    total = 0
+    for i, (start, stop) in enumerate(ranges):
+        prefix = (
+            ("\r\n" if i else "")
+            + f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((prefix, start, stop))
+        total += len(prefix) + stop - start
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    total += len(closing)
+
+    def body():
+        yield from _read_ranges(path, parts)
+        yield closing
+
+    rv.response = body()
+    rv.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    rv.content_length = total
+    return rv
@@ -0,0 +1,126 @@
+"""Streaming ZIP archives of a file manager folder subtree.
+
+stream_folder_zip() walks the folder tree breadth first and yields the ZIP
+bytes as they are produced: zipfile writes into a small in-memory sink that
+is drained after every chunk, so neither the archive nor a whole file is ever
+held in memory or written to a temp file. Because the output is not
+seekable, zipfile uses data descriptors, and switches an entry to ZIP64 when
+the file is large enough to need it.
+"""
+import logging
+import os
+import time
+import zipfile
+from collections import deque
+
+logger = logging.getLogger("app.folder_zip")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipSink:
+    """Write-only file object that buffers until drain() is called."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _clean_name(name):
+    name = (name or "").replace("/", "_").replace("\\", "_").strip()
+    return name if name not in ("", ".", "..") else "_"
+
+
+def _unique(name, used):
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while f"{stem} ({n}){ext}" in used:
+        n += 1
+    name = f"{stem} ({n}){ext}"
+    used.add(name)
+    return name
+
+
+def _zip_time(value):
+    timestamp = value.timestamp() if value is not None else time.time()
+    return max(time.localtime(timestamp)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def iter_folder_entries(conn, folder_id, folder_name):
+    """Yield ``("dir", arcname, created_at)`` and
+    ``("file", arcname, stored_path, size, uploaded_at)`` for a subtree."""
+    queue = deque([(folder_id, _clean_name(folder_name), None)])
+    cursor = conn.cursor()
+    while queue:
+        current_id, prefix, created_at = queue.popleft()
+        yield ("dir", prefix + "/", created_at)
+
+        used = set()
+        cursor.execute(
+            "SELECT id, name, created_at FROM file_folders WHERE parent_id = %s ORDER BY id",
+            (current_id,),
+        )
+        for child_id, name, child_created_at in cursor.fetchall():
+            queue.append((child_id, f"{prefix}/{_unique(_clean_name(name), used)}", child_created_at))
+
+        cursor.execute(
+            "SELECT filename, stored_path, size_bytes, uploaded_at FROM folder_files WHERE folder_id = %s ORDER BY id",
+            (current_id,),
+        )
+        for filename, stored_path, size, uploaded_at in cursor.fetchall():
+            yield ("file", f"{prefix}/{_unique(_clean_name(filename), used)}", stored_path, size, uploaded_at)
+    cursor.close()
+
+
+def stream_folder_zip(entries, upload_root, chunk_size=CHUNK_SIZE, log=logger.warning):
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    for entry in entries:
+        if entry[0] == "dir":
+            _, arcname, created_at = entry
+            info = zipfile.ZipInfo(arcname, date_time=_zip_time(created_at))
+            info.external_attr = (0o40775 << 16) | 0x10
+            zf.writestr(info, b"")
+        else:
+            _, arcname, stored_path, size, uploaded_at = entry
+            path = os.path.join(upload_root, stored_path)
+            try:
+                src = open(path, "rb")
+            except OSError:
+                log(f"folder zip: skipping missing file {stored_path}")
+                continue
+            with src:
+                info = zipfile.ZipInfo(arcname, date_time=_zip_time(uploaded_at))
+                info.external_attr = 0o644 << 16
+                # a known size lets zipfile decide up front whether ZIP64 is needed
+                info.file_size = size if size is not None else os.fstat(src.fileno()).st_size
+                with zf.open(info, "w") as dest:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+        data = sink.drain()
+        if data:
+            yield data
+
+    zf.close()
+    yield sink.drain()
@@ -0,0 +1,175 @@
+"""Live dashboard updates pushed over Server-Sent Events.
+
+One Broadcaster per process polls the database on a single background thread,
+and only while at least one client is connected. Each round costs two cheap
+queries, whatever the number of clients: the summary counters and any
+documents newer than the last one seen. Changes are fanned out to every
+subscriber as events:
+
+``snapshot``  full totals and per-category counts (first event, and after a
+              client fell behind)
+``counts``    ``{"changes": {name: delta}, "totals": {...}, "categories": {...}}``
+``activity``  ``{"id", "title", "created_at"}`` for each new document
+
+Every subscriber has a bounded buffer. A client that stops reading does not
+hold memory or slow anyone down: when its buffer overflows the buffer is
+dropped and the client gets a fresh snapshot instead.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import counters
+
+logger = logging.getLogger("app.live_updates")
+
+MAX_ACTIVITY_PER_POLL = 50
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, broadcaster, max_buffer):
+        self._broadcaster = broadcaster
+        self._events = deque()
+        self._max_buffer = max_buffer
+        self.needs_snapshot = True
+
+    def _put(self, event, data):
+        # called with the broadcaster's condition held
+        if self.needs_snapshot:
+            return  # the snapshot it is about to get already covers this
+        if len(self._events) >= self._max_buffer:
+            self._events.clear()
+            self.needs_snapshot = True
+            self._broadcaster.overflows += 1
+            return
+        self._events.append((event, data))
+
+    def wait(self, timeout):
+        """Return the buffered events (an empty list after ``timeout`` seconds)."""
+        return self._broadcaster._wait(self, timeout)
+
+    def close(self):
+        self._broadcaster._unsubscribe(self)
+
+
+class Broadcaster:
+    def __init__(self, connect, poll_interval=1.0, max_buffer=100):
+        self.connect = connect
+        self.poll_interval = poll_interval
+        self.max_buffer = max_buffer
+        self._cond = threading.Condition()
+        self._pid = None
+        self._subscribers = set()
+        self._snapshot = None
+        self._last_document_id = None
+        self.polls = 0
+        self.events_sent = 0
+        self.overflows = 0
+
+    def _start(self):
+        # one poller thread per process, (re)started after a fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._subscribers = set()
+            thread = threading.Thread(target=self._run, name="live-updates", daemon=True)
+            thread.start()
+
+    def subscribe(self):
+        with self._cond:
+            self._start()
+            subscriber = Subscriber(self, self.max_buffer)
+            self._subscribers.add(subscriber)
+            self._cond.notify_all()
+            return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def _wait(self, subscriber, timeout):
+        with self._cond:
+            if not subscriber._events and not (subscriber.needs_snapshot and self._snapshot):
+                self._cond.wait(timeout)
+            events = list(subscriber._events)
+            subscriber._events.clear()
+            if subscriber.needs_snapshot and self._snapshot:
+                subscriber.needs_snapshot = False
+                events = [("snapshot", self._snapshot)]
+            self.events_sent += len(events)
+            return events
+
+    def _publish(self, events):
+        with self._cond:
+            for subscriber in self._subscribers:
+                for event, data in events:
+                    subscriber._put(event, data)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._subscribers:
+                    # nobody is listening: forget the state and stop polling
+                    self._snapshot = None
+                    self._last_document_id = None
+                    self._cond.wait()
+            try:
+                self._poll()
+            except Exception:  # keep the thread alive through DB outages
+                logger.warning("live updates poll failed", exc_info=True)
+            time.sleep(self.poll_interval)
+
+    def _poll(self):
+        conn = self.connect()
+        try:
+            totals = counters.read_totals(conn)
+            categories = dict(counters.documents_per_category(conn))
+            cursor = conn.cursor(dictionary=True)
+            if self._last_document_id is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM documents")
+                self._last_document_id = cursor.fetchone()["id"]
+                new_documents = []
+            else:
+                cursor.execute(
+                    "SELECT id, title, created_at FROM documents WHERE id > %s ORDER BY id LIMIT %s",
+                    (self._last_document_id, MAX_ACTIVITY_PER_POLL),
+                )
+                new_documents = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.release()
+        self.polls += 1
+
+        snapshot = {"totals": totals, "categories": categories}
+        previous = self._snapshot
+        events = []
+        if previous is not None and snapshot != previous:
+            changes = {
+                name: value - previous["totals"].get(name, 0)
+                for name, value in totals.items()
+                if value != previous["totals"].get(name, 0)
+            }
+            events.append(("counts", dict(snapshot, changes=changes)))
+        for document in new_documents:
+            events.append(("activity", document))
+            self._last_document_id = document["id"]
+        with self._cond:
+            self._snapshot = snapshot
+        if events or previous is None:
+            self._publish(events)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "subscribers": len(self._subscribers) if self._pid == os.getpid() else 0,
+                "polls": self.polls,
+                "events_sent": self.events_sent,
+                "overflows": self.overflows,
+            }
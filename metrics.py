@@ -0,0 +1,190 @@
+"""Request and query instrumentation exposed in Prometheus text format.
+
+init_app() adds before/after request hooks that time every request and read
+the per-request DB counters collected by TimedCursor, which wraps every
+cursor handed out by the connection pool. Queries slower than the configured
+threshold are logged to the ``app.slow_query`` logger.
+
+Everything here is per process; with a pre-forking server each worker
+reports its own numbers and Prometheus sums them.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+slow_query_log = logging.getLogger("app.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels=(), value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def gauge_lines(name, help_text, label_names, values):
+    """Render a gauge from ``{label values tuple: number}``."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{{{_labels(label_names, labels)}}} {value}")
+    return lines
+
+
+request_latency = Histogram(
+    "app_request_duration_seconds", "Time spent handling a request.", ("endpoint", "method"), LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    "app_request_db_queries", "Database round trips per request.", ("endpoint",), QUERY_COUNT_BUCKETS
+)
+request_db_time = Histogram(
+    "app_request_db_seconds", "Time spent in the database per request.", ("endpoint",), LATENCY_BUCKETS
+)
+requests_total = Counter("app_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+slow_queries_total = Counter("app_slow_queries_total", "Queries slower than the slow query threshold.", ("endpoint",))
+
+METRICS = [request_latency, request_queries, request_db_time, requests_total, slow_queries_total]
+slow_query_threshold = 0.2
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+class TimedCursor:
+    """Cursor wrapper that counts round trips and time for the current request."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    # special methods bypass __getattr__, so ``with conn.cursor() as cursor``
+    # needs these; the block gets the wrapper so its queries are timed too
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._cursor.__exit__(exc_type, exc_value, traceback)
+
+    def _timed(self, method, operation, params):
+        start = time.perf_counter()
+        try:
+            return method(operation, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_request = has_request_context()
+            if in_request:
+                g.db_queries = g.get("db_queries", 0) + 1
+                g.db_time = g.get("db_time", 0.0) + elapsed
+            if elapsed >= slow_query_threshold:
+                endpoint = _endpoint() if in_request else "cli"
+                slow_queries_total.inc((endpoint,))
+                slow_query_log.warning(
+                    "slow query (%.1f ms) in %s: %s", elapsed * 1000, endpoint, " ".join(str(operation).split())[:500]
+                )
+
+    def execute(self, operation, params=None):
+        return self._timed(self._cursor.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        return self._timed(self._cursor.executemany, operation, seq_params)
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def _after_request(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    requests_total.inc((endpoint, request.method, str(response.status_code)))
+    request_latency.observe((endpoint, request.method), time.perf_counter() - started)
+    request_queries.observe((endpoint,), g.get("db_queries", 0))
+    request_db_time.observe((endpoint,), g.get("db_time", 0.0))
+    return response
+
+
+def init_app(app, threshold):
+    global slow_query_threshold
+    slow_query_threshold = threshold
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def render_all(extra_lines=()):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,228 @@
+"""Versioned schema migrations.
+
+schema.sql always describes the current schema and is what a new install
+loads. Databases created from an older schema.sql are brought up to date with
+``flask --app app migrate``, which applies the numbered migrations below that
+are not yet recorded in ``schema_migrations``.
+
+Each migration checks information_schema before adding a table, column or
+index, so it is safe to run against a database that already has some (or all)
+of its changes, e.g. one freshly created from the current schema.sql. MySQL
+commits DDL implicitly, so that idempotency (not a transaction) is what makes
+a migration interrupted half way safe to re-run.
+
+Migrations are called with the connection and a cursor on it; most only need
+the cursor, data migrations may commit on the connection themselves.
+"""
+import time
+
+import counters
+
+LOCK_NAME = "document_db_migrations"
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _table_exists(cursor, table):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,),
+    )
+    return cursor.fetchone() is not None
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(
+        """SELECT 1 FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+        (table, column),
+    )
+    return cursor.fetchone() is not None
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute(
+        """SELECT 1 FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1""",
+        (table, index),
+    )
+    return cursor.fetchone() is not None
+
+
+def create_table(cursor, table, ddl):
+    if not _table_exists(cursor, table):
+        cursor.execute(f"CREATE TABLE {table} ({ddl})")
+
+
+def add_column(cursor, table, column, ddl):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def add_index(cursor, table, index, ddl):
+    """``ddl`` is everything after the index name, e.g. ``(a, b)``."""
+    if not _index_exists(cursor, table, index):
+        kind = ddl.split("(", 1)[0].strip()
+        columns = ddl[len(kind):].strip()
+        cursor.execute(f"ALTER TABLE {table} ADD {kind + ' ' if kind else ''}INDEX {index} {columns}")
+
+
+def _0001_storage_tables(conn, cursor):
+    """Tables and columns added for counters, caches, blobs, uploads and search."""
+    add_column(cursor, "folder_files", "sha256", "CHAR(64) NULL")
+    add_column(cursor, "folder_files", "size_bytes", "BIGINT NULL")
+    add_index(cursor, "folder_files", "ix_folder_files_sha256", "(sha256)")
+    add_index(cursor, "folder_files", "ft_folder_files_title_filename", "FULLTEXT (title, filename)")
+    add_index(cursor, "documents", "ft_documents_title_description", "FULLTEXT (title, description)")
+    create_table(cursor, "summary_counters", """
+        scope VARCHAR(20) NOT NULL,
+        scope_key VARCHAR(100) NOT NULL,
+        name VARCHAR(50) NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_key, name)""")
+    create_table(cursor, "cache_versions", """
+        name VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0""")
+    create_table(cursor, "blobs", """
+        sha256 CHAR(64) PRIMARY KEY,
+        size_bytes BIGINT NOT NULL,
+        stored_path VARCHAR(255) NOT NULL,
+        ref_count INT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP""")
+    create_table(cursor, "upload_sessions", """
+        id CHAR(32) PRIMARY KEY,
+        folder_id INT NOT NULL,
+        user_id INT NOT NULL,
+        title VARCHAR(150) NOT NULL,
+        filename VARCHAR(255) NOT NULL,
+        total_size BIGINT NOT NULL,
+        expected_sha256 CHAR(64) NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'open',
+        file_id INT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (folder_id) REFERENCES file_folders(id) ON DELETE CASCADE""")
+    create_table(cursor, "upload_chunks", """
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        upload_id CHAR(32) NOT NULL,
+        start_offset BIGINT NOT NULL,
+        end_offset BIGINT NOT NULL,
+        FOREIGN KEY (upload_id) REFERENCES upload_sessions(id) ON DELETE CASCADE""")
+    create_table(cursor, "extraction_jobs", """
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        file_id INT NOT NULL,
+        sha256 CHAR(64) NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        last_error VARCHAR(1000) NULL,
+        available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP NULL,
+        finished_at TIMESTAMP NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_extraction_jobs_file (file_id),
+        KEY ix_extraction_jobs_queue (status, available_at),
+        FOREIGN KEY (file_id) REFERENCES folder_files(id) ON DELETE CASCADE""")
+    create_table(cursor, "file_texts", """
+        sha256 CHAR(64) PRIMARY KEY,
+        text MEDIUMTEXT,
+        extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FULLTEXT KEY ft_file_texts_text (text)""")
+
+
+def _0002_hot_path_indexes(conn, cursor):
+    """Indexes for the access paths checked by query_plans.py."""
+    cursor.execute("SELECT email, COUNT(*) FROM users GROUP BY email HAVING COUNT(*) > 1 LIMIT 10")
+    duplicates = cursor.fetchall()
+    if duplicates:
+        listed = ", ".join(f"{email} ({count})" for email, count in duplicates)
+        raise MigrationError(f"Cannot add a unique index on users.email; duplicate emails: {listed}")
+    add_index(cursor, "users", "uq_users_email", "UNIQUE (email)")
+    add_index(cursor, "documents", "ix_documents_owner_id", "(owner_id, id)")
+    add_index(cursor, "documents", "ix_documents_created_at", "(created_at)")
+    add_index(cursor, "file_folders", "ix_file_folders_parent_created", "(parent_id, created_at, name)")
+    add_index(cursor, "folder_files", "ix_folder_files_folder_uploaded", "(folder_id, uploaded_at)")
+    add_index(cursor, "folder_files", "ix_folder_files_stored_path", "(stored_path)")
+    add_index(cursor, "extraction_jobs", "ix_extraction_jobs_sha256", "(sha256, status)")
+    add_index(cursor, "upload_sessions", "ix_upload_sessions_expires", "(expires_at)")
+    add_index(cursor, "upload_chunks", "ix_upload_chunks_upload", "(upload_id, start_offset)")
+
+
+def _0003_maintenance_checkpoints(conn, cursor):
+    """Checkpoints for the incremental storage garbage collector."""
+    create_table(cursor, "maintenance_checkpoints", """
+        name VARCHAR(64) PRIMARY KEY,
+        position VARCHAR(512) NOT NULL DEFAULT '',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP""")
+
+
+def _0004_fill_summary_counters(conn, cursor):
+    """Count existing rows into summary_counters.
+
+    0001 creates the table empty, which on a database that already has data
+    leaves every page reading zeros. Skipped when the table already has rows,
+    i.e. the app has been keeping the counters since the schema was created.
+    """
+    cursor.execute("SELECT 1 FROM summary_counters LIMIT 1")
+    if cursor.fetchone() is None:
+        counters.reconcile(conn)
+
+
+MIGRATIONS = [
+    (1, "storage_tables", _0001_storage_tables),
+    (2, "hot_path_indexes", _0002_hot_path_indexes),
+    (3, "maintenance_checkpoints", _0003_maintenance_checkpoints),
+    (4, "fill_summary_counters", _0004_fill_summary_counters),
+]
+
+
+def _ensure_table(cursor):
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+               version INT PRIMARY KEY,
+               name VARCHAR(100) NOT NULL,
+               applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    _ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def pending(conn):
+    """Return the ``(version, name, fn)`` migrations not applied yet, in order."""
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(conn, log=print, lock_timeout=30):
+    """Apply every pending migration in version order; returns how many ran.
+
+    A named lock keeps two deploys from migrating the same database at once.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, lock_timeout))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise MigrationError("Another migration is running")
+    try:
+        todo = pending(conn)
+        for version, name, fn in todo:
+            started = time.monotonic()
+            log(f"applying {version:04d}_{name} ...")
+            fn(conn, cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            log(f"applied {version:04d}_{name} in {time.monotonic() - started:.1f}s")
+        return len(todo)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchone()
+        cursor.close()
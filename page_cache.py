@@ -0,0 +1,175 @@
+"""Full-page cache for the public pages anonymous visitors see.
+
+A page is served from the cache only for GET/HEAD requests that carry no
+session cookie and no query string, so nothing user-specific can leak into
+or out of it and arbitrary query strings cannot flood it with entries. The
+first such request renders the page normally; a 200 text/html response that
+did not touch the session is stored with gzip and (when the optional
+``brotli`` package is installed) brotli variants compressed once up front,
+and a strong ETag per variant. Later requests get the best variant their
+Accept-Encoding allows, or a 304 when their If-None-Match still matches.
+
+Entries are kept in process memory, so a redeploy (a restart) starts empty.
+The template files' modification times are re-checked at most every
+``check_interval`` seconds; when any template changes the whole cache is
+dropped, along with Jinja's own compiled-template cache.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, request, session
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_COMPRESS_BYTES = 512
+
+
+class CachedPage:
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {None: (body, etag)}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), etag + "-gz")
+            if brotli is not None:
+                self.variants["br"] = (brotli.compress(body, quality=11), etag + "-br")
+
+    @property
+    def size(self):
+        return sum(len(body) for body, _ in self.variants.values())
+
+    def choose(self, accept_encodings):
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return None
+
+
+class PageCache:
+    def __init__(self, max_entries=256, check_interval=2.0, max_age=0):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._stamp = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def _template_stamp(self, app):
+        loader = app.jinja_loader
+        stamp = []
+        for root in getattr(loader, "searchpath", ()):
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stamp.append((path, os.stat(path).st_mtime_ns))
+                    except OSError:
+                        continue
+        return hash(tuple(sorted(stamp)))
+
+    def _check_templates(self, app):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        stamp = self._template_stamp(app)
+        with self._lock:
+            if self._stamp is not None and stamp != self._stamp:
+                self._pages.clear()
+                self.invalidations += 1
+                if app.jinja_env.cache is not None:
+                    app.jinja_env.cache.clear()
+            self._stamp = stamp
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.invalidations += 1
+
+    def _get(self, key):
+        with self._lock:
+            page = self._pages.pop(key, None)
+            if page is not None:
+                self._pages[key] = page  # re-inserted last: the dict doubles as an LRU
+            return page
+
+    def _put(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            while len(self._pages) > self.max_entries:
+                self._pages.pop(next(iter(self._pages)))
+
+    def _respond(self, page):
+        encoding = page.choose(request.accept_encodings)
+        body, etag = page.variants[encoding]
+        rv = Response(body, mimetype=page.mimetype)
+        rv.set_etag(etag)
+        if encoding:
+            rv.headers["Content-Encoding"] = encoding
+        rv.vary.update(("Accept-Encoding", "Cookie"))
+        rv.cache_control.public = True
+        rv.cache_control.max_age = self.max_age
+        if request.if_none_match and request.if_none_match.contains(etag):
+            self.not_modified += 1
+            rv.status_code = 304
+            rv.set_data(b"")
+            rv.headers.pop("Content-Length", None)
+        return rv
+
+    def cached(self, view_func):
+        """Decorator for views whose anonymous response is the same for everyone."""
+
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            app = current_app
+            if (
+                request.method not in ("GET", "HEAD")
+                or request.query_string
+                or app.config["SESSION_COOKIE_NAME"] in request.cookies
+            ):
+                return view_func(*args, **kwargs)
+            self._check_templates(app)
+            key = request.path
+            page = self._get(key)
+            if page is not None:
+                self.hits += 1
+                return self._respond(page)
+            self.misses += 1
+            rv = app.make_response(view_func(*args, **kwargs))
+            if (
+                rv.status_code != 200
+                or rv.mimetype != "text/html"
+                or rv.is_streamed
+                or session.modified
+                or "Set-Cookie" in rv.headers
+            ):
+                return rv
+            page = CachedPage(rv.get_data(), rv.mimetype)
+            self._put(key, page)
+            return self._respond(page)
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            pages = list(self._pages.values())
+        return {
+            "entries": len(pages),
+            "bytes": sum(page.size for page in pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+        }
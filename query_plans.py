@@ -0,0 +1,51 @@
+"""EXPLAIN check for the hot queries.
+
+HOT_QUERIES lists the queries that run on every page view (or in a loop in a
+background job) with representative parameters. The SQL is taken from the
+modules that run it, so the check always sees the statements the app sends.
+check() runs EXPLAIN on each and reports every table access of type ``ALL``,
+i.e. a full table scan. Listings that are meant to read a whole (small) table, such as the reference
+data caches, are deliberately not in the list.
+
+Run it with ``flask --app app check-query-plans``; it exits non-zero when a
+hot query scans a table. Plans depend on table statistics, so check against a
+database with realistic data (see ``generate-data``).
+"""
+
+import counters
+import extraction
+import repository
+import resumable
+
+HOT_QUERIES = [
+    ("login", repository.FIND_USER_BY_EMAIL_SQL, ("user1@example.test",)),
+    ("documents_page", *repository.document_page_query(51, before=1_000_000)),
+    ("owner_documents_page", *repository.document_page_query(51, owner_id=1)),
+    ("activity", repository.RECENT_DOCUMENTS_SQL, (10,)),
+    ("file_manager_root", repository.ROOT_FOLDERS_SQL, ()),
+    ("subfolders", repository.SUBFOLDERS_SQL, (1,)),
+    ("folder_files", repository.FOLDER_FILES_SQL, (1,)),
+    ("counter_scope", counters.READ_SCOPE_SQL, ("owner", "1")),
+    ("extraction_finish_content", extraction.FINISH_CONTENT_JOBS_SQL, ("0" * 64,)),
+    ("extraction_claim", extraction.CLAIM_JOBS_SQL, (10,)),
+    ("upload_chunks", resumable.RECEIVED_RANGES_SQL, ("0" * 32,)),
+    ("expired_uploads", resumable.EXPIRED_SESSIONS_SQL, (100,)),
+]
+
+
+def explain(conn, query, params):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("EXPLAIN " + query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def check(conn, queries=HOT_QUERIES):
+    """Return ``[(query name, table, plan row)]`` for every full table scan."""
+    problems = []
+    for name, query, params in queries:
+        for row in explain(conn, query, params):
+            if (row.get("type") or "").upper() == "ALL":
+                problems.append((name, row.get("table"), row))
+    return problems
@@ -0,0 +1,96 @@
+"""In-process cache for small reference tables (categories, departments, users).
+
+Each cache holds the result of one query. Entries expire after ``ttl``
+seconds and are dropped as soon as the transaction in which a write route
+calls ``invalidate()`` commits.
+Other worker processes notice the change through a version stamp in the
+``cache_versions`` table, which they re-read at most every
+``check_interval`` seconds.
+
+The cached rows are shared between requests, so callers must not modify them.
+"""
+import threading
+import time
+
+import repository
+
+
+class RefCache:
+    def __init__(self, name, query, ttl=300, check_interval=1.0):
+        self.name = name
+        self.query = query
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._rows = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_version(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (self.name,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else 0
+
+    def _is_fresh(self, conn, now):
+        if self._rows is None or now - self._loaded_at > self.ttl:
+            return False
+        if now - self._checked_at < self.check_interval:
+            return True
+        version = self._read_version(conn)
+        self._checked_at = now
+        return version == self._version
+
+    def get(self, conn):
+        """Return the cached rows, loading them with ``conn`` when stale."""
+        with self._lock:
+            now = time.monotonic()
+            if self._is_fresh(conn, now):
+                self.hits += 1
+                return self._rows
+
+            self.misses += 1
+            version = self._read_version(conn)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(self.query)
+            rows = cursor.fetchall()
+            cursor.close()
+            self._rows = rows
+            self._version = version
+            self._loaded_at = self._checked_at = now
+            return rows
+
+    def invalidate(self, conn):
+        """Bump the shared version stamp; call inside the write transaction.
+
+        This process's copy is only dropped after the commit: dropped earlier,
+        a request reloading it in between would cache the old rows again.
+        """
+        cursor = conn.cursor()
+        cursor.execute(
+            """INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+               ON DUPLICATE KEY UPDATE version = version + 1""",
+            (self.name,),
+        )
+        cursor.close()
+        repository.after_commit(conn, self._drop)
+
+    def _drop(self):
+        with self._lock:
+            self._rows = None
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "cached_rows": len(self._rows) if self._rows is not None else 0,
+                "version": self._version,
+            }
@@ -0,0 +1,157 @@
+"""Read replicas for the read-only routes.
+
+A ReplicaSet keeps one ConnectionPool per replica and hands out a
+connection from the healthy replica with the fewest connections in use
+(round-robin between equally busy ones). Health is re-checked lazily, at
+most every ``check_interval`` seconds and by one request at a time: a
+replica that cannot be reached, whose replication threads are stopped, or
+that is more than ``max_lag`` seconds behind is skipped until a later check
+finds it healthy again. A replica that fails while a connection is being
+borrowed is marked down immediately.
+
+acquire() returns None when no replica is usable; callers then read from
+the primary. Replicas that are not configured as MySQL replicas (e.g. two
+independent local instances used for testing), or whose user lacks the
+privilege to read the replica status, report no lag and count as healthy;
+any other error during the check marks the replica down.
+"""
+import itertools
+import threading
+import time
+
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import PoolError
+
+from db_pool import ConnectionPool
+
+
+# errors that mean "may not read the replica status", not "replica broken"
+PRIVILEGE_ERRORS = {
+    errorcode.ER_SPECIFIC_ACCESS_DENIED_ERROR,
+    errorcode.ER_DBACCESS_DENIED_ERROR,
+    errorcode.ER_TABLEACCESS_DENIED_ERROR,
+}
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.lag = None
+        self.last_error = None
+        self.checked_at = 0.0
+        self.failures = 0
+
+
+def replication_lag(conn):
+    """Seconds behind the source, None if replication is stopped, or 0 when
+    the server is not a replica (or the user may not read replica status).
+    Any other error is raised."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error as e:
+            if e.errno != errorcode.ER_PARSE_ERROR:
+                raise
+            cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+        row = cursor.fetchone()
+        cursor.fetchall()
+    except Error as e:
+        if e.errno in PRIVILEGE_ERRORS:
+            return 0
+        raise
+    finally:
+        cursor.close()
+    if not row:
+        return 0
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return None if lag is None else int(lag)
+
+
+class ReplicaSet:
+    def __init__(self, primary_config, replica_configs, check_interval=5.0, max_lag=5, **pool_kwargs):
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.replicas = []
+        for overrides in replica_configs:
+            config = dict(primary_config)
+            config.update(overrides)
+            name = f"{config.get('host', 'localhost')}:{config.get('port', 3306)}"
+            self.replicas.append(Replica(name, ConnectionPool(config, **pool_kwargs)))
+        self._check_lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self.fallbacks = 0
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def _check(self, replica):
+        try:
+            conn = replica.pool.acquire()
+        except PoolError:
+            return  # busy, not down
+        except Error as e:
+            replica.healthy, replica.last_error = False, str(e)
+            replica.failures += 1
+            return
+        try:
+            lag = replication_lag(conn)
+        except Error as e:
+            replica.healthy, replica.last_error = False, str(e)
+            replica.failures += 1
+            return
+        finally:
+            conn.release()
+        replica.lag = lag
+        if lag is None:
+            replica.healthy, replica.last_error = False, "replication stopped"
+        elif self.max_lag is not None and lag > self.max_lag:
+            replica.healthy, replica.last_error = False, f"lagging {lag}s"
+        else:
+            replica.healthy, replica.last_error = True, None
+
+    def check(self, force=False):
+        """Re-check every replica whose last check is older than check_interval."""
+        if not self._check_lock.acquire(blocking=force):
+            return  # another request is checking
+        try:
+            now = time.monotonic()
+            for replica in self.replicas:
+                if force or now - replica.checked_at >= self.check_interval:
+                    replica.checked_at = now
+                    self._check(replica)
+        finally:
+            self._check_lock.release()
+
+    def acquire(self):
+        """Borrow a connection from a healthy replica, or return None."""
+        self.check()
+        turn = next(self._round_robin)
+        candidates = [r for r in self.replicas if r.healthy]
+        # least busy first; the rotating offset spreads ties evenly
+        candidates.sort(key=lambda r: (r.pool.stats()["in_use"], (self.replicas.index(r) - turn) % len(self.replicas)))
+        for replica in candidates:
+            try:
+                return replica.pool.acquire()
+            except PoolError:
+                continue
+            except Error as e:
+                replica.healthy, replica.last_error = False, str(e)
+                replica.failures += 1
+                replica.checked_at = time.monotonic()
+        self.fallbacks += 1
+        return None
+
+    def stats(self):
+        stats = {}
+        for replica in self.replicas:
+            stats[replica.name] = dict(
+                replica.pool.stats(),
+                healthy=replica.healthy,
+                lag=replica.lag,
+                last_error=replica.last_error,
+                failures=replica.failures,
+            )
+        return stats
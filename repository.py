@@ -0,0 +1,363 @@
+"""Data access for users, departments, categories, documents and the file
+manager tables.
+
+Every query runs as a server-side prepared statement. The prepared cursor is
+kept in the connection's ``statement_cache`` (see db_pool.PooledConnection),
+so each distinct statement is parsed once per physical connection and then
+only re-executed. Connections without a cache (e.g. a bare
+mysql.connector connection) get a fresh prepared cursor per call.
+
+Reads return dicts (or lists of dicts). Writes never commit; wrap them, along
+with the matching counters/cache updates, in ``with transaction(conn):``.
+Work that must wait for the commit (e.g. dropping an in-process cache) is
+registered with after_commit().
+"""
+import sys
+from contextlib import contextmanager
+
+MAX_CACHED_STATEMENTS = 64
+
+
+def _close(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+@contextmanager
+def _statement(conn, sql):
+    # the prepared cursor only skips re-preparing when it is handed the very
+    # same string object, so equal SQL built at runtime is interned first
+    sql = sys.intern(sql)
+    cache = getattr(conn, "statement_cache", None)
+    cursor = cache.pop(sql, None) if cache is not None else None
+    if cursor is None:
+        cursor = conn.cursor(prepared=True, dictionary=True)
+    try:
+        yield cursor, sql
+    except BaseException:
+        # the cursor may hold an unread result; never hand it out again
+        _close(cursor)
+        raise
+    if cache is None:
+        _close(cursor)
+        return
+    cache[sql] = cursor  # re-inserted last: the dict doubles as an LRU
+    while len(cache) > MAX_CACHED_STATEMENTS:
+        _close(cache.pop(next(iter(cache))))
+
+
+def _all(conn, sql, params=()):
+    with _statement(conn, sql) as (cursor, sql):
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _one(conn, sql, params=()):
+    # fetchall so the result is fully read before the cursor is reused
+    rows = _all(conn, sql, params)
+    return rows[0] if rows else None
+
+
+def _write(conn, sql, params=()):
+    """Run an INSERT/UPDATE/DELETE; returns ``(lastrowid, rowcount)``."""
+    with _statement(conn, sql) as (cursor, sql):
+        cursor.execute(sql, params)
+        return cursor.lastrowid, cursor.rowcount
+
+
+@contextmanager
+def transaction(conn):
+    """Commit when the block finishes, roll back if it raises."""
+    conn.after_commit_callbacks = callbacks = []
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.after_commit_callbacks = None
+    conn.commit()
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(conn, callback):
+    """Call ``callback()`` once the enclosing transaction() has committed (not
+    at all if it rolls back); right away outside one."""
+    callbacks = getattr(conn, "after_commit_callbacks", None)
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+# users
+
+def get_user(conn, user_id):
+    return _one(conn, "SELECT id, name, email, role FROM users WHERE id = %s", (user_id,))
+
+
+FIND_USER_BY_EMAIL_SQL = "SELECT id, name, email, role, password_hash FROM users WHERE email = %s"
+
+
+def find_user_by_email(conn, email):
+    return _one(conn, FIND_USER_BY_EMAIL_SQL, (email,))
+
+
+def lock_user_role(conn, user_id):
+    """Lock the user row and return its role, or None if it does not exist."""
+    row = _one(conn, "SELECT role FROM users WHERE id = %s FOR UPDATE", (user_id,))
+    return row["role"] if row else None
+
+
+def create_user(conn, name, email, role, password_hash=None):
+    """Raises IntegrityError when the email is already registered."""
+    return _write(
+        conn,
+        "INSERT INTO users (name, email, role, password_hash) VALUES (%s, %s, %s, %s)",
+        (name, email, role, password_hash),
+    )[0]
+
+
+def update_user(conn, user_id, name, email, role):
+    _write(conn, "UPDATE users SET name = %s, email = %s, role = %s WHERE id = %s", (name, email, role, user_id))
+
+
+def delete_user(conn, user_id):
+    _write(conn, "DELETE FROM users WHERE id = %s", (user_id,))
+
+
+# departments
+
+def get_department(conn, dept_id):
+    return _one(conn, "SELECT id, name, description FROM departments WHERE id = %s", (dept_id,))
+
+
+def create_department(conn, name, description):
+    return _write(conn, "INSERT INTO departments (name, description) VALUES (%s, %s)", (name, description))[0]
+
+
+def update_department(conn, dept_id, name, description):
+    _write(conn, "UPDATE departments SET name = %s, description = %s WHERE id = %s", (name, description, dept_id))
+
+
+def delete_department(conn, dept_id):
+    """Returns True if a row was deleted."""
+    return _write(conn, "DELETE FROM departments WHERE id = %s", (dept_id,))[1] > 0
+
+
+# categories
+
+def get_category(conn, cat_id):
+    return _one(conn, "SELECT id, name, description FROM categories WHERE id = %s", (cat_id,))
+
+
+def lock_category(conn, cat_id):
+    """Lock the category row; returns False if it does not exist."""
+    return _one(conn, "SELECT id FROM categories WHERE id = %s FOR UPDATE", (cat_id,)) is not None
+
+
+def create_category(conn, name, description):
+    return _write(conn, "INSERT INTO categories (name, description) VALUES (%s, %s)", (name, description))[0]
+
+
+def update_category(conn, cat_id, name, description):
+    _write(conn, "UPDATE categories SET name = %s, description = %s WHERE id = %s", (name, description, cat_id))
+
+
+def delete_category(conn, cat_id):
+    _write(conn, "DELETE FROM categories WHERE id = %s", (cat_id,))
+
+
+# documents
+
+DOCUMENT_LIST_COLUMNS = """SELECT d.id, d.title, d.description, d.file_path, d.created_at, c.name AS category_name
+                   FROM documents d
+                   LEFT JOIN categories c ON d.category_id = c.id"""
+
+
+def get_document(conn, doc_id):
+    return _one(
+        conn,
+        "SELECT id, title, description, file_path, category_id, owner_id, created_at FROM documents WHERE id = %s",
+        (doc_id,),
+    )
+
+
+def lock_document(conn, doc_id):
+    """Lock the document row; returns ``{category_id, owner_id}`` or None."""
+    return _one(conn, "SELECT category_id, owner_id FROM documents WHERE id = %s FOR UPDATE", (doc_id,))
+
+
+def document_page_query(limit, before=None, after=None, owner_id=None):
+    """``(sql, params)`` for list_documents()."""
+    conditions = []
+    params = []
+    if owner_id is not None:
+        conditions.append("d.owner_id = %s")
+        params.append(owner_id)
+    if after is not None:
+        conditions.append("d.id > %s")
+        params.append(after)
+        order = "ASC"
+    else:
+        if before is not None:
+            conditions.append("d.id < %s")
+            params.append(before)
+        order = "DESC"
+
+    query = DOCUMENT_LIST_COLUMNS
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY d.id {order} LIMIT %s"
+    params.append(limit)
+    return query, params
+
+
+def list_documents(conn, limit, before=None, after=None, owner_id=None):
+    """One keyset page of documents: newest first below ``before``, or
+    oldest first above ``after`` (the caller reverses that page)."""
+    return _all(conn, *document_page_query(limit, before, after, owner_id))
+
+
+RECENT_DOCUMENTS_SQL = "SELECT id, title, created_at FROM documents ORDER BY created_at DESC LIMIT %s"
+
+
+def recent_documents(conn, limit=10):
+    return _all(conn, RECENT_DOCUMENTS_SQL, (limit,))
+
+
+def create_document(conn, title, description, file_path, category_id, owner_id):
+    return _write(
+        conn,
+        "INSERT INTO documents (title, description, file_path, category_id, owner_id) VALUES (%s, %s, %s, %s, %s)",
+        (title, description, file_path, category_id, owner_id),
+    )[0]
+
+
+def update_document(conn, doc_id, title, description, file_path, category_id):
+    _write(
+        conn,
+        "UPDATE documents SET title = %s, description = %s, file_path = %s, category_id = %s WHERE id = %s",
+        (title, description, file_path, category_id, doc_id),
+    )
+
+
+def delete_document(conn, doc_id):
+    _write(conn, "DELETE FROM documents WHERE id = %s", (doc_id,))
+
+
+def _document_conditions(category_id=None, uncategorized=False, owner_id=None, created_before=None):
+    conditions = []
+    params = []
+    if uncategorized:
+        conditions.append("category_id IS NULL")
+    elif category_id is not None:
+        conditions.append("category_id = %s")
+        params.append(category_id)
+    if owner_id is not None:
+        conditions.append("owner_id = %s")
+        params.append(owner_id)
+    if created_before is not None:
+        conditions.append("created_at < %s")
+        params.append(created_before)
+    return conditions, params
+
+
+def _in_list(ids):
+    return "(" + ", ".join(["%s"] * len(ids)) + ")"
+
+
+def list_document_ids(conn, limit, after=0, **filters):
+    """Ids of the documents matching ``filters`` (see _document_conditions)
+    above ``after``, in id order."""
+    conditions, params = _document_conditions(**filters)
+    query = "SELECT id FROM documents WHERE " + " AND ".join(conditions + ["id > %s"]) + " ORDER BY id LIMIT %s"
+    return [row["id"] for row in _all(conn, query, params + [after, limit])]
+
+
+def lock_documents(conn, ids, **filters):
+    """Lock the listed documents that (still) match ``filters``; returns
+    ``[{id, category_id, owner_id}]``."""
+    conditions, params = _document_conditions(**filters)
+    query = "SELECT id, category_id, owner_id FROM documents WHERE " + " AND ".join(
+        conditions + ["id IN " + _in_list(ids)]
+    )
+    return _all(conn, query + " ORDER BY id FOR UPDATE", params + list(ids))
+
+
+def delete_documents(conn, ids):
+    """Returns the number of rows deleted."""
+    return _write(conn, "DELETE FROM documents WHERE id IN " + _in_list(ids), ids)[1]
+
+
+def set_documents_category(conn, ids, category_id):
+    return _write(conn, "UPDATE documents SET category_id = %s WHERE id IN " + _in_list(ids), [category_id] + list(ids))[1]
+
+
+def set_documents_owner(conn, ids, owner_id):
+    return _write(conn, "UPDATE documents SET owner_id = %s WHERE id IN " + _in_list(ids), [owner_id] + list(ids))[1]
+
+
+# file manager
+
+def get_folder(conn, folder_id):
+    return _one(conn, "SELECT id, name, parent_id, created_at FROM file_folders WHERE id = %s", (folder_id,))
+
+
+ROOT_FOLDERS_SQL = "SELECT id, name, parent_id, created_at FROM file_folders WHERE parent_id IS NULL ORDER BY created_at DESC"
+SUBFOLDERS_SQL = "SELECT id, name, parent_id, created_at FROM file_folders WHERE parent_id = %s ORDER BY created_at DESC"
+
+
+def list_root_folders(conn):
+    return _all(conn, ROOT_FOLDERS_SQL)
+
+
+def list_subfolders(conn, parent_id):
+    return _all(conn, SUBFOLDERS_SQL, (parent_id,))
+
+
+def create_folder(conn, name, parent_id):
+    return _write(conn, "INSERT INTO file_folders (name, parent_id) VALUES (%s, %s)", (name, parent_id))[0]
+
+
+FOLDER_FILES_SQL = """SELECT f.id, f.title, f.filename, f.stored_path, f.sha256, f.uploaded_at,
+                             j.status AS extraction_status
+                      FROM folder_files f
+                      LEFT JOIN extraction_jobs j ON j.file_id = f.id
+                      WHERE f.folder_id = %s
+                      ORDER BY f.uploaded_at DESC"""
+
+
+def list_folder_files(conn, folder_id):
+    return _all(conn, FOLDER_FILES_SQL, (folder_id,))
+
+
+def get_folder_file(conn, file_id):
+    return _one(conn, "SELECT id, folder_id, title, filename, stored_path, sha256 FROM folder_files WHERE id = %s", (file_id,))
+
+
+def lock_folder_file(conn, file_id):
+    """Lock the file row; returns ``{folder_id, sha256}`` or None."""
+    return _one(conn, "SELECT folder_id, sha256 FROM folder_files WHERE id = %s FOR UPDATE", (file_id,))
+
+
+def create_folder_file(conn, folder_id, title, filename, stored_path, sha256, size):
+    return _write(
+        conn,
+        """INSERT INTO folder_files (folder_id, title, filename, stored_path, sha256, size_bytes)
+           VALUES (%s, %s, %s, %s, %s, %s)""",
+        (folder_id, title, filename, stored_path, sha256, size),
+    )[0]
+
+
+def delete_folder_file(conn, file_id):
+    _write(conn, "DELETE FROM folder_files WHERE id = %s", (file_id,))
+
+
+def get_blob_path(conn, sha256):
+    """Stored path of a blob relative to the upload root, or None."""
+    row = _one(conn, "SELECT stored_path FROM blobs WHERE sha256 = %s", (sha256,))
+    return row["stored_path"] if row else None
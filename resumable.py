@@ -0,0 +1,258 @@
+"""Resumable, chunked uploads for large files.
+
+A client creates an upload session with the final size, then PUTs chunks at
+byte offsets (in any order, in parallel if it likes), can ask which bytes the
+server already has, and finally completes the session. Chunks are written
+into a preallocated file under the blob directory, and every received range
+is recorded in ``upload_chunks`` so a restarted client can resume from the
+last contiguous offset.
+
+No database lock is held while a chunk body streams in. Instead each chunk
+holds a shared flock() on the session file, and completing the session takes
+it exclusively (failing with a 409 while chunks are still being written)
+before it hashes the file and moves it into the blob store. A chunk that
+gets its lock afterwards finds the file gone and is refused, so it can never
+write into a stored blob. Without fcntl (Windows) the files are not locked.
+
+Sessions that see no activity for their TTL are removed by expire_sessions().
+"""
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+
+from blob_store import hash_file
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class UploadSessionError(Exception):
+    status_code = 400
+
+
+class SessionNotFound(UploadSessionError):
+    status_code = 404
+
+
+class ChunkOutOfRange(UploadSessionError):
+    status_code = 416
+
+
+class SessionIncomplete(UploadSessionError):
+    status_code = 409
+
+
+class SessionClosed(UploadSessionError):
+    status_code = 409
+
+
+class ChecksumMismatch(UploadSessionError):
+    status_code = 422
+
+
+def session_temp_path(temp_dir, upload_id):
+    return os.path.join(temp_dir, f".session-{upload_id}")
+
+
+def _lock(f, exclusive=False):
+    """flock() the session file; returns False when an exclusive lock is
+    not free right away (a shared lock is waited for)."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _is_current(f, path):
+    """Whether ``path`` still names the open file ``f`` (it has not been
+    moved into the blob store or removed by expire_sessions())."""
+    try:
+        return os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def create_session(conn, temp_dir, folder_id, user_id, title, filename, total_size, ttl, sha256=None):
+    upload_id = uuid.uuid4().hex
+    with open(session_temp_path(temp_dir, upload_id), "wb") as f:
+        f.truncate(total_size)
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """INSERT INTO upload_sessions
+               (id, folder_id, user_id, title, filename, total_size, expected_sha256, expires_at)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, NOW() + INTERVAL %s SECOND)""",
+        (upload_id, folder_id, user_id, title, filename, total_size, sha256, ttl),
+    )
+    conn.commit()
+    cursor.close()
+    return upload_id
+
+
+def get_session(conn, upload_id, user_id, for_update=False):
+    cursor = conn.cursor(dictionary=True)
+    query = "SELECT * FROM upload_sessions WHERE id = %s AND user_id = %s"
+    if for_update:
+        query += " FOR UPDATE"
+    cursor.execute(query, (upload_id, user_id))
+    upload = cursor.fetchone()
+    cursor.close()
+    if not upload:
+        raise SessionNotFound("Upload session not found")
+    return upload
+
+
+RECEIVED_RANGES_SQL = "SELECT start_offset, end_offset FROM upload_chunks WHERE upload_id = %s ORDER BY start_offset"
+EXPIRED_SESSIONS_SQL = "SELECT id, status FROM upload_sessions WHERE expires_at < NOW() ORDER BY expires_at LIMIT %s"
+
+
+def received_ranges(conn, upload_id):
+    """Return the merged ``[start, stop)`` ranges received so far."""
+    cursor = conn.cursor()
+    cursor.execute(RECEIVED_RANGES_SQL, (upload_id,))
+    merged = []
+    for start, stop in cursor.fetchall():
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    cursor.close()
+    return merged
+
+
+def session_status(conn, upload):
+    ranges = received_ranges(conn, upload["id"])
+    offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+    return {
+        "upload_id": upload["id"],
+        "status": upload["status"],
+        "total_size": upload["total_size"],
+        "offset": offset,
+        "received": ranges,
+        "file_id": upload["file_id"],
+        "expires_at": upload["expires_at"].isoformat() if upload["expires_at"] else None,
+    }
+
+
+def write_chunk(conn, temp_dir, upload, offset, length, stream, ttl, chunk_size=64 * 1024):
+    """Copy ``length`` bytes from ``stream`` into the session file at ``offset``."""
+    if upload["status"] != "open":
+        raise SessionClosed("Upload session is already completed")
+    if offset < 0 or length <= 0 or offset + length > upload["total_size"]:
+        raise ChunkOutOfRange("Chunk does not fit in the declared file size")
+    conn.commit()  # end the read; no row lock is kept while the body streams
+
+    path = session_temp_path(temp_dir, upload["id"])
+    written = 0
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        raise SessionClosed("Upload session is no longer open")
+    with f:
+        _lock(f)  # released when the file is closed
+        if not _is_current(f, path):
+            raise SessionClosed("Upload session is no longer open")
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(chunk_size, length - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+        if not written:
+            raise UploadSessionError("Empty chunk")
+        f.flush()
+
+        # only the bytes that actually arrived count; the client can resend
+        # the rest. Recorded while the file lock is still held, so a
+        # completion cannot check the ranges in between.
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO upload_chunks (upload_id, start_offset, end_offset) VALUES (%s, %s, %s)",
+            (upload["id"], offset, offset + written),
+        )
+        conn.commit()
+        # separately: the insert's foreign key check holds a shared lock on
+        # the session row, so two chunks updating it in the same transaction
+        # would deadlock
+        cursor.execute(
+            "UPDATE upload_sessions SET expires_at = NOW() + INTERVAL %s SECOND WHERE id = %s",
+            (ttl, upload["id"]),
+        )
+        conn.commit()
+        cursor.close()
+    return written
+
+
+@contextmanager
+def finish_session(conn, temp_dir, upload):
+    """Check the session is complete and yield ``(temp_path, sha256, size)``.
+
+    ``upload`` must have been read with ``for_update=True``. The session file
+    is held exclusively for the block, in which the caller moves it into the
+    blob store; it then calls mark_completed() in the same transaction.
+    """
+    temp_path = session_temp_path(temp_dir, upload["id"])
+    try:
+        f = open(temp_path, "rb")
+    except FileNotFoundError:
+        raise SessionClosed("Upload session is no longer open")
+    with f:
+        if not _lock(f, exclusive=True):
+            raise SessionIncomplete("Chunks are still being uploaded")
+        ranges = received_ranges(conn, upload["id"])
+        total = upload["total_size"]
+        if total and ranges != [[0, total]]:
+            raise SessionIncomplete("Not all bytes have been uploaded yet")
+
+        if total:
+            sha256, size = hash_file(temp_path)
+        else:
+            sha256, size = hashlib.sha256().hexdigest(), 0
+        expected = upload["expected_sha256"]
+        if expected and expected.lower() != sha256:
+            raise ChecksumMismatch("Uploaded bytes do not match the declared SHA-256")
+        yield temp_path, sha256, size
+
+
+def mark_completed(conn, upload_id, file_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE upload_sessions SET status = 'completed', file_id = %s WHERE id = %s",
+        (file_id, upload_id),
+    )
+    cursor.execute("DELETE FROM upload_chunks WHERE upload_id = %s", (upload_id,))
+    cursor.close()
+
+
+def expire_sessions(conn, temp_dir, batch_size=500):
+    """Delete sessions past their expiry together with their partial files.
+
+    Completed sessions are kept until they expire so a retried complete call
+    still gets its file id back. Returns the number of sessions removed.
+    """
+    removed = 0
+    cursor = conn.cursor()
+    while True:
+        cursor.execute(EXPIRED_SESSIONS_SQL, (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for upload_id, status in rows:
+            path = session_temp_path(temp_dir, upload_id)
+            if status == "open" and os.path.exists(path):
+                os.remove(path)
+        ids = [upload_id for upload_id, _ in rows]
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"DELETE FROM upload_chunks WHERE upload_id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM upload_sessions WHERE id IN ({placeholders})", ids)
+        conn.commit()
+        removed += len(ids)
+    cursor.close()
+    return removed
@@ -18,7 +18,8 @@ CREATE TABLE IF NOT EXISTS users (
     name VARCHAR(100) NOT NULL,
     email VARCHAR(150) NOT NULL,
     role VARCHAR(50) NOT NULL,
-    password_hash VARCHAR(255)
+    password_hash VARCHAR(255),
+    UNIQUE KEY uq_users_email (email)
 );
 
 CREATE TABLE IF NOT EXISTS documents (
@@ -29,6 +30,9 @@ CREATE TABLE IF NOT EXISTS documents (
     category_id INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     owner_id INT NULL,
+    KEY ix_documents_owner_id (owner_id, id),
+    KEY ix_documents_created_at (created_at),
+    FULLTEXT KEY ft_documents_title_description (title, description),
     FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL,
     FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL
 );
@@ -38,15 +42,113 @@ CREATE TABLE IF NOT EXISTS file_folders (
     name VARCHAR(150) NOT NULL,
     parent_id INT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY ix_file_folders_parent_created (parent_id, created_at, name),
     FOREIGN KEY (parent_id) REFERENCES file_folders(id) ON DELETE CASCADE
 );
 
+-- Content-addressed file bodies shared by folder_files rows (see blob_store.py)
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size_bytes BIGINT NOT NULL,
+    stored_path VARCHAR(255) NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS folder_files (
     id INT AUTO_INCREMENT PRIMARY KEY,
     folder_id INT NOT NULL,
     title VARCHAR(150) NOT NULL,
     filename VARCHAR(255) NOT NULL,
     stored_path VARCHAR(255) NOT NULL,
+    sha256 CHAR(64) NULL,
+    size_bytes BIGINT NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY ix_folder_files_sha256 (sha256),
+    KEY ix_folder_files_folder_uploaded (folder_id, uploaded_at),
+    KEY ix_folder_files_stored_path (stored_path),
+    FULLTEXT KEY ft_folder_files_title_filename (title, filename),
+    FOREIGN KEY (folder_id) REFERENCES file_folders(id) ON DELETE CASCADE
+);
+
+-- Summary counters maintained by the create/edit/delete routes (see counters.py).
+-- Rebuild with: flask --app app reconcile-counters
+CREATE TABLE IF NOT EXISTS summary_counters (
+    scope VARCHAR(20) NOT NULL,
+    scope_key VARCHAR(100) NOT NULL,
+    name VARCHAR(50) NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, scope_key, name)
+);
+
+-- Version stamps for the in-process reference-data caches (see ref_cache.py)
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Resumable chunked uploads (see resumable.py)
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    folder_id INT NOT NULL,
+    user_id INT NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    total_size BIGINT NOT NULL,
+    expected_sha256 CHAR(64) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    file_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    KEY ix_upload_sessions_expires (expires_at),
     FOREIGN KEY (folder_id) REFERENCES file_folders(id) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    upload_id CHAR(32) NOT NULL,
+    start_offset BIGINT NOT NULL,
+    end_offset BIGINT NOT NULL,
+    KEY ix_upload_chunks_upload (upload_id, start_offset),
+    FOREIGN KEY (upload_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+);
+
+-- Background text extraction for uploaded files (see extraction.py)
+CREATE TABLE IF NOT EXISTS extraction_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    file_id INT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(1000) NULL,
+    available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_extraction_jobs_file (file_id),
+    KEY ix_extraction_jobs_queue (status, available_at),
+    KEY ix_extraction_jobs_sha256 (sha256, status),
+    FOREIGN KEY (file_id) REFERENCES folder_files(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS file_texts (
+    sha256 CHAR(64) PRIMARY KEY,
+    text MEDIUMTEXT,
+    extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FULLTEXT KEY ft_file_texts_text (text)
+);
+
+-- Resume positions of incremental maintenance scans (see storage_gc.py)
+CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+    name VARCHAR(64) PRIMARY KEY,
+    position VARCHAR(512) NOT NULL DEFAULT '',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Applied migrations (see migrations.py). A database created from this file
+-- already has every change; `flask --app app migrate` just records them.
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
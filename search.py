@@ -0,0 +1,62 @@
+"""Full-text search over documents and file manager uploads.
+
+Backed by InnoDB FULLTEXT indexes on ``documents(title, description)``,
+``folder_files(title, filename)`` and the extracted file contents in
+``file_texts(text)``. InnoDB updates those indexes as part of every
+INSERT/UPDATE/DELETE, so the existing create/edit/delete and upload routes
+keep the index current without extra code.
+"""
+import re
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TERMS = 10
+
+
+def boolean_query(text):
+    """Turn free text into a BOOLEAN MODE query: every word required, prefix-matched.
+
+    Operators typed by the user are dropped, so input can never produce a
+    malformed query.
+    """
+    terms = WORD_RE.findall(text or "")[:MAX_TERMS]
+    return " ".join(f"+{term}*" for term in terms)
+
+
+def search(conn, text, page=1, page_size=20):
+    """Return ``(results, has_next)`` for one page of ranked matches."""
+    query = boolean_query(text)
+    if not query:
+        return [], False
+    offset = (max(page, 1) - 1) * page_size
+
+    cursor = conn.cursor(dictionary=True)
+    # a file can match on its name and on its contents; sum both scores
+    cursor.execute(
+        """SELECT kind, id, MAX(title) AS title, MAX(snippet) AS snippet, MAX(folder_id) AS folder_id,
+                  MAX(created_at) AS created_at, SUM(score) AS score
+           FROM (
+               SELECT 'document' AS kind, d.id, d.title, d.description AS snippet, NULL AS folder_id,
+                      d.created_at AS created_at,
+                      MATCH(d.title, d.description) AGAINST (%s IN BOOLEAN MODE) AS score
+               FROM documents d
+               WHERE MATCH(d.title, d.description) AGAINST (%s IN BOOLEAN MODE)
+               UNION ALL
+               SELECT 'file', f.id, f.title, f.filename, f.folder_id, f.uploaded_at,
+                      MATCH(f.title, f.filename) AGAINST (%s IN BOOLEAN MODE)
+               FROM folder_files f
+               WHERE MATCH(f.title, f.filename) AGAINST (%s IN BOOLEAN MODE)
+               UNION ALL
+               SELECT 'file', f.id, f.title, f.filename, f.folder_id, f.uploaded_at,
+                      MATCH(t.text) AGAINST (%s IN BOOLEAN MODE)
+               FROM file_texts t
+               JOIN folder_files f ON f.sha256 = t.sha256
+               WHERE MATCH(t.text) AGAINST (%s IN BOOLEAN MODE)
+           ) matches
+           GROUP BY kind, id
+           ORDER BY score DESC, created_at DESC
+           LIMIT %s OFFSET %s""",
+        (query,) * 6 + (page_size + 1, offset),
+    )
+    results = cursor.fetchall()
+    cursor.close()
+    return results[:page_size], len(results) > page_size
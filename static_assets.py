@@ -0,0 +1,150 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask --app app build-static`` copies every file under ``static/`` to
+``static/dist/`` with a content hash in its name (``css/site.css`` becomes
+``dist/css/site.3f2a1b9c0d4e.css``), writes ``.gz`` and, with the optional
+``brotli`` package, ``.br`` siblings for compressible types, and records the
+mapping in ``static/dist/manifest.json``. Files from earlier builds are kept
+(pages rendered by workers still on the old release may reference them)
+unless ``--prune`` is given.
+
+init_app() loads the manifest once at startup, so restart the app after a
+build. From then on ``url_for('static', filename='css/site.css')`` returns
+the fingerprinted URL, which is served with a one-year immutable
+Cache-Control and, when the client accepts it, from the precompressed
+sibling. Files missing from the manifest keep their plain URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+BUILD_DIR = "dist"
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".json", ".svg", ".html", ".txt", ".map", ".xml"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _write_if_missing(path, data):
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def build(static_folder, prune=False, log=print):
+    """Fingerprint and precompress everything under ``static_folder``;
+    returns the manifest (``{source: fingerprinted}``, both relative to it)."""
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if os.path.abspath(dirpath) == os.path.abspath(static_folder) and BUILD_DIR in dirnames:
+            dirnames.remove(BUILD_DIR)
+        for filename in sorted(filenames):
+            source = os.path.join(dirpath, filename)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(relative)
+            target = f"{BUILD_DIR}/{stem}.{_file_hash(source)}{ext}"
+            target_path = os.path.join(static_folder, *target.split("/"))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            if not os.path.exists(target_path):
+                shutil.copyfile(source, target_path + ".tmp")
+                os.replace(target_path + ".tmp", target_path)
+                log(f"{relative} -> {target}")
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source, "rb") as f:
+                    data = f.read()
+                _write_if_missing(target_path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write_if_missing(target_path + ".br", brotli.compress(data, quality=11))
+            manifest[relative] = target
+
+    os.makedirs(build_root, exist_ok=True)
+    manifest_path = os.path.join(build_root, MANIFEST)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    if prune:
+        keep = {os.path.join(static_folder, *target.split("/")) for target in manifest.values()}
+        keep.add(manifest_path)
+        for dirpath, _, filenames in os.walk(build_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                base = path[:-3] if path.endswith((".gz", ".br")) else path
+                if base not in keep:
+                    os.remove(path)
+                    log(f"removed {os.path.relpath(path, static_folder)}")
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class StaticAssets:
+    def __init__(self, app):
+        self.static_folder = app.static_folder
+        self.manifest = load_manifest(self.static_folder)
+        self.fingerprinted = set(self.manifest.values())
+        app.url_defaults(self._url_defaults)
+        app.before_request(self._serve_precompressed)
+        app.after_request(self._cache_headers)
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = self.manifest.get(values["filename"], values["filename"])
+
+    def _is_fingerprinted(self):
+        return request.endpoint == "static" and (request.view_args or {}).get("filename") in self.fingerprinted
+
+    def _serve_precompressed(self):
+        if not self._is_fingerprinted():
+            return None
+        filename = request.view_args["filename"]
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if not request.accept_encodings[encoding]:
+                continue
+            if not os.path.isfile(os.path.join(self.static_folder, *(filename + suffix).split("/"))):
+                continue
+            rv = send_from_directory(
+                self.static_folder,
+                filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            )
+            rv.headers["Content-Encoding"] = encoding
+            return rv
+        return None
+
+    def _cache_headers(self, response):
+        if self._is_fingerprinted():
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+def init_app(app):
+    return StaticAssets(app)
@@ -0,0 +1,222 @@
+"""Orphaned-upload garbage collection and storage consistency checks.
+
+Two incremental scans, each resumed from a checkpoint row in
+``maintenance_checkpoints`` so a large tree is covered a bounded batch at a
+time, across runs:
+
+``files``  walks the upload root in sorted order and looks up every file's
+           relative path in ``folder_files.stored_path``. A file no row
+           points at (e.g. left behind when a folder delete cascaded through
+           ``folder_files``) and older than the grace period is deleted; for
+           a blob the ``blobs`` row is locked and re-checked first, so an
+           upload that is taking a new reference on it either wins or waits.
+``rows``   walks ``folder_files`` by id and reports rows whose file is
+           missing, and with ``verify`` also rows whose file no longer
+           matches the recorded sha256 (legacy uploads overwritten in place).
+
+When a scan reaches the end its checkpoint goes back to the start, so
+repeated runs keep cycling through the whole store. The grace period keeps
+files of uploads that are still being committed out of reach.
+"""
+import os
+import time
+
+from blob_store import BLOB_DIR, hash_file
+
+FILES_SCAN = "storage_gc.files"
+ROWS_SCAN = "storage_gc.rows"
+SESSION_PREFIX = ".session-"  # resumable upload temp files; expire-upload-sessions owns them
+
+
+def read_checkpoint(conn, name):
+    cursor = conn.cursor()
+    cursor.execute("SELECT position FROM maintenance_checkpoints WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else ""
+
+
+def save_checkpoint(conn, name, position):
+    cursor = conn.cursor()
+    cursor.execute(
+        """INSERT INTO maintenance_checkpoints (name, position) VALUES (%s, %s)
+           ON DUPLICATE KEY UPDATE position = VALUES(position)""",
+        (name, position),
+    )
+    cursor.close()
+    conn.commit()
+
+
+def iter_files(root, after=""):
+    """Yield ``(relative path, DirEntry)`` for files under ``root`` in sorted
+    order, starting after the relative path ``after``.
+
+    Paths are compared component by component (the order of a sorted
+    depth-first walk), so whole directories before ``after`` are skipped
+    without being listed.
+    """
+    after_parts = tuple(after.split("/")) if after else ()
+
+    def walk(directory, parts):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            entry_parts = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if after_parts and entry_parts < after_parts[: len(entry_parts)]:
+                    continue
+                yield from walk(entry.path, entry_parts)
+            elif entry.is_file(follow_symlinks=False) and entry_parts > after_parts:
+                yield "/".join(entry_parts), entry
+
+    yield from walk(root, ())
+
+
+class Sweeper:
+    """Runs both scans a batch at a time; ``connect()`` must return a pooled
+    connection, which is borrowed for one batch and then released."""
+
+    def __init__(self, connect, upload_root, batch_size=1000, grace_period=86400, dry_run=False, verify=False, log=print):
+        self.connect = connect
+        self.upload_root = upload_root
+        self.batch_size = batch_size
+        self.grace_period = grace_period
+        self.dry_run = dry_run
+        self.verify = verify
+        self.log = log
+        # a dry run never saves checkpoints, so it keeps its positions here
+        self.positions = None
+
+    def _advance(self, conn, name, position):
+        self.positions[name] = position
+        if not self.dry_run:
+            save_checkpoint(conn, name, position)
+
+    def _referenced(self, conn, paths):
+        if not paths:
+            return set()
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(paths))
+        cursor.execute(f"SELECT DISTINCT stored_path FROM folder_files WHERE stored_path IN ({placeholders})", paths)
+        referenced = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+        conn.commit()  # end the read snapshot before the per-file transactions
+        return referenced
+
+    def _remove_file(self, path):
+        try:
+            os.remove(os.path.join(self.upload_root, path))
+        except FileNotFoundError:
+            return
+        directory = os.path.dirname(path)
+        # the blob shard directories are left in place even when empty: an
+        # upload may have just created one and be about to move its file in
+        if directory and directory != BLOB_DIR and not directory.startswith(BLOB_DIR + "/"):
+            try:
+                os.rmdir(os.path.join(self.upload_root, directory))  # legacy <folder_id>/ once empty
+            except OSError:
+                pass
+
+    def _delete_orphan(self, conn, path):
+        """Delete an unreferenced file, re-checking under the blob row lock;
+        returns False if it turned out to be in use."""
+        cursor = conn.cursor()
+        try:
+            blob_row = None
+            if path.startswith(BLOB_DIR + "/"):
+                sha256 = os.path.basename(path)
+                cursor.execute("SELECT stored_path FROM blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+                blob_row = cursor.fetchone()
+            cursor.execute("SELECT 1 FROM folder_files WHERE stored_path = %s LIMIT 1", (path,))
+            if cursor.fetchone() is not None:
+                conn.rollback()
+                return False
+            if blob_row and blob_row[0] == path:
+                cursor.execute("DELETE FROM blobs WHERE sha256 = %s", (sha256,))
+            # while the row lock is still held: once it is released an upload
+            # of the same content can re-create the row, find the file and
+            # reference it. Should the commit then fail, the row is merely
+            # left without a file, which add_reference() puts back.
+            self._remove_file(path)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return True
+
+    def sweep_files(self, conn, report):
+        cutoff = time.time() - self.grace_period
+        batch = []
+        for path, entry in iter_files(self.upload_root, self.positions[FILES_SCAN]):
+            batch.append((path, entry))
+            if len(batch) >= self.batch_size:
+                break
+        report["files_scanned"] += len(batch)
+
+        referenced = self._referenced(conn, [path for path, _ in batch])
+        for path, entry in batch:
+            if path in referenced or os.path.basename(path).startswith(SESSION_PREFIX):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > cutoff:
+                report["recent_unreferenced"] += 1
+                continue
+            report["orphans"] += 1
+            report["orphan_bytes"] += stat.st_size
+            if self.dry_run:
+                self.log(f"orphan: {path} ({stat.st_size} bytes)")
+            elif self._delete_orphan(conn, path):
+                report["deleted"] += 1
+                self.log(f"deleted: {path} ({stat.st_size} bytes)")
+
+        finished = len(batch) < self.batch_size
+        self._advance(conn, FILES_SCAN, "" if finished else batch[-1][0])
+        return finished
+
+    def check_rows(self, conn, report):
+        last_id = int(self.positions[ROWS_SCAN] or 0)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, stored_path, sha256 FROM folder_files WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, self.batch_size),
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.commit()
+        report["rows_checked"] += len(rows)
+
+        for file_id, stored_path, sha256 in rows:
+            full_path = os.path.join(self.upload_root, stored_path)
+            if not os.path.isfile(full_path):
+                report["missing"] += 1
+                self.log(f"missing: folder_files.id={file_id} {stored_path}")
+            elif self.verify and sha256 and hash_file(full_path)[0] != sha256:
+                report["changed"] += 1
+                self.log(f"changed: folder_files.id={file_id} {stored_path} no longer matches its sha256")
+
+        finished = len(rows) < self.batch_size
+        self._advance(conn, ROWS_SCAN, "" if finished else str(rows[-1][0]))
+        return finished
+
+    def run_batch(self):
+        """One batch of each scan; returns a report dict."""
+        report = dict.fromkeys(
+            ("files_scanned", "orphans", "orphan_bytes", "deleted", "recent_unreferenced", "rows_checked", "missing", "changed"),
+            0,
+        )
+        conn = self.connect()
+        try:
+            if self.positions is None:
+                self.positions = {name: read_checkpoint(conn, name) for name in (FILES_SCAN, ROWS_SCAN)}
+            report["files_pass_complete"] = self.sweep_files(conn, report)
+            report["rows_pass_complete"] = self.check_rows(conn, report)
+        finally:
+            conn.release()
+        return report
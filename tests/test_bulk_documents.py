@@ -0,0 +1,221 @@
+from collections import defaultdict
+
+import pytest
+
+import bulk_documents
+import counters
+import repository
+from bulk_documents import BulkOperationError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeStore:
+    """In-memory documents, categories, users and summary counters standing
+    in for the repository and counters SQL."""
+
+    def __init__(self, monkeypatch, documents, categories=(1, 2, 3), users=(10, 11)):
+        self.documents = {doc["id"]: dict(doc) for doc in documents}
+        self.categories = set(categories)
+        self.users = set(users)
+        self.locked_chunks = []
+        self.counters = self.expected_counters()
+        for name in ("list_document_ids", "lock_documents", "lock_category", "lock_user_role",
+                     "delete_documents", "set_documents_category", "set_documents_owner"):
+            monkeypatch.setattr(repository, name, getattr(self, name))
+        monkeypatch.setattr(counters, "bump", self.bump)
+
+    def _matches(self, doc, category_id=None, uncategorized=False, owner_id=None, created_before=None):
+        if uncategorized and doc["category_id"] is not None:
+            return False
+        if category_id is not None and doc["category_id"] != category_id:
+            return False
+        return owner_id is None or doc["owner_id"] == owner_id
+
+    def list_document_ids(self, conn, limit, after=0, **filters):
+        ids = [i for i in sorted(self.documents) if i > after and self._matches(self.documents[i], **filters)]
+        return ids[:limit]
+
+    def lock_documents(self, conn, ids, **filters):
+        self.locked_chunks.append(list(ids))
+        return [dict(self.documents[i]) for i in sorted(ids) if i in self.documents and self._matches(self.documents[i], **filters)]
+
+    def lock_category(self, conn, cat_id):
+        return cat_id in self.categories
+
+    def lock_user_role(self, conn, user_id):
+        return "user" if user_id in self.users else None
+
+    def delete_documents(self, conn, ids):
+        for i in ids:
+            del self.documents[i]
+        return len(ids)
+
+    def set_documents_category(self, conn, ids, category_id):
+        for i in ids:
+            self.documents[i]["category_id"] = category_id
+        return len(ids)
+
+    def set_documents_owner(self, conn, ids, owner_id):
+        for i in ids:
+            self.documents[i]["owner_id"] = owner_id
+        return len(ids)
+
+    def bump(self, conn, scope, scope_key, name, delta, fetch=False):
+        key = (scope, str(scope_key), name)
+        self.counters[key] += delta
+        return self.counters[key]
+
+    def expected_counters(self):
+        """The document counters counters.compute_expected() would produce."""
+        expected = defaultdict(int)
+        docs = list(self.documents.values())
+        expected[("total", "", "documents")] = len(docs)
+        expected[("total", "", "uncategorized_documents")] = sum(d["category_id"] is None for d in docs)
+        for cat_id in self.categories:
+            count = sum(d["category_id"] == cat_id for d in docs)
+            expected[("category", str(cat_id), "documents")] = count
+            expected[("total", "", "empty_categories")] += count == 0
+        for d in docs:
+            if d["owner_id"]:
+                expected[("owner", str(d["owner_id"]), "documents")] += 1
+                expected[("owner", str(d["owner_id"]), "uncategorized_documents")] += d["category_id"] is None
+        return expected
+
+    def assert_counters_consistent(self):
+        actual = {key: value for key, value in self.counters.items() if value}
+        expected = {key: value for key, value in self.expected_counters().items() if value}
+        assert actual == expected
+
+
+def make_documents(count):
+    return [
+        {"id": i, "category_id": (i % 3) or None, "owner_id": 10 if i % 2 else 11}
+        for i in range(1, count + 1)
+    ]
+
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+
+def test_delete_by_ids_runs_one_transaction_per_chunk(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(10))
+    summary = bulk_documents.run(conn, "delete", ids=[1, 2, 3, 4, 5, 99], chunk_size=2)
+
+    assert store.locked_chunks == [[1, 2], [3, 4], [5, 99]]
+    assert conn.commits == 3 and conn.rollbacks == 0
+    assert summary == {
+        "action": "delete", "matched": 5, "affected": 5, "chunks": 3,
+        "requested": 6, "unchanged": 0, "not_found": 1,
+    }
+    assert sorted(store.documents) == [6, 7, 8, 9, 10]
+    store.assert_counters_consistent()
+
+
+def test_recategorize_by_filter_walks_every_match(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(20))
+    summary = bulk_documents.run(conn, "recategorize", filters={"uncategorized": True}, value="2", chunk_size=4)
+
+    assert summary["matched"] == summary["affected"] == 6
+    assert summary["chunks"] == 2
+    assert all(doc["category_id"] is not None for doc in store.documents.values())
+    store.assert_counters_consistent()
+
+
+def test_recategorize_to_uncategorized_and_unchanged_rows(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(9))
+    summary = bulk_documents.run(conn, "recategorize", ids=[1, 3, 4], value=None)
+
+    # document 3 is already uncategorized
+    assert summary["affected"] == 2 and summary["unchanged"] == 1
+    store.assert_counters_consistent()
+
+
+def test_emptying_and_filling_a_category_updates_empty_categories(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(6))
+    bulk_documents.run(conn, "recategorize", filters={"category_id": 1}, value=3)
+    assert store.counters[("total", "", "empty_categories")] == 1
+    store.assert_counters_consistent()
+
+    bulk_documents.run(conn, "recategorize", ids=[1], value=1)
+    assert store.counters[("total", "", "empty_categories")] == 0
+    store.assert_counters_consistent()
+
+
+def test_reassign_moves_owner_counters_only(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(8))
+    totals_before = {k: v for k, v in store.counters.items() if k[0] != "owner"}
+    summary = bulk_documents.run(conn, "reassign", filters={"owner_id": 11}, value=10, chunk_size=3)
+
+    assert summary["affected"] == 4
+    assert {doc["owner_id"] for doc in store.documents.values()} == {10}
+    assert {k: v for k, v in store.counters.items() if k[0] != "owner"} == totals_before
+    store.assert_counters_consistent()
+
+
+def test_missing_target_rolls_back_the_chunk(monkeypatch, conn):
+    store = FakeStore(monkeypatch, make_documents(4))
+    with pytest.raises(BulkOperationError, match="Owner not found") as excinfo:
+        bulk_documents.run(conn, "reassign", ids=[1, 2], value=99)
+    assert conn.rollbacks == 1 and conn.commits == 0
+    assert excinfo.value.summary["chunks"] == 0
+    assert store.documents[1]["owner_id"] == 10
+
+    with pytest.raises(BulkOperationError, match="Category not found"):
+        bulk_documents.run(conn, "recategorize", ids=[1], value=42)
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"action": "archive", "ids": [1]}, "Unknown action"),
+        ({"action": "delete"}, "either document ids or a filter"),
+        ({"action": "delete", "ids": [1], "filters": {"owner_id": 10}}, "either document ids or a filter"),
+        ({"action": "delete", "ids": list(range(1, 6)), "max_ids": 4}, "Too many ids"),
+        ({"action": "reassign", "ids": [1]}, "owner_id is required"),
+        ({"action": "reassign", "ids": [1], "value": "abc"}, "Invalid owner_id"),
+        ({"action": "recategorize", "ids": [1], "value": "abc"}, "Invalid category_id"),
+        ({"action": "recategorize", "ids": [1], "value": 0}, "Invalid category_id"),
+        ({"action": "recategorize", "ids": [1], "value": [2]}, "Invalid category_id"),
+    ],
+)
+def test_run_rejects_invalid_input(monkeypatch, conn, kwargs, message):
+    FakeStore(monkeypatch, make_documents(4))
+    action = kwargs.pop("action")
+    with pytest.raises(BulkOperationError, match=message):
+        bulk_documents.run(conn, action, **kwargs)
+    assert conn.commits == 0
+
+
+def test_parse_ids():
+    assert bulk_documents.parse_ids("3, 1 2,,3") == [1, 2, 3]
+    assert bulk_documents.parse_ids([5, "4"]) == [4, 5]
+    assert bulk_documents.parse_ids(None) == []
+    for bad in (5, {"a": 1}, ["x"], [True], [0], [-1], [1.5]):
+        with pytest.raises(BulkOperationError):
+            bulk_documents.parse_ids(bad)
+
+
+def test_parse_filters():
+    assert bulk_documents.parse_filters({}) == {}
+    assert bulk_documents.parse_filters({"category_id": "none", "owner_id": "7"}) == {
+        "uncategorized": True,
+        "owner_id": 7,
+    }
+    assert bulk_documents.parse_filters({"created_before": "2024-01-01"})["created_before"].year == 2024
+    for bad in ("x", ["category_id"], {"category_id": "abc"}, {"owner_id": 0}, {"created_before": 20240101},
+                {"created_before": "yesterday"}):
+        with pytest.raises(BulkOperationError):
+            bulk_documents.parse_filters(bad)
@@ -0,0 +1,119 @@
+import pytest
+
+import circuit
+from circuit import CLOSED, HALF_OPEN, OPEN, AdmissionLimiter, CircuitBreaker, CircuitOpen, Overloaded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit, "time", clock)
+    return clock
+
+
+def tripped():
+    breaker = CircuitBreaker("db", failure_threshold=3, reset_timeout=10.0)
+    for _ in range(3):
+        breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("db", failure_threshold=3, reset_timeout=10.0)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("db", failure_threshold=3)
+    for outcome in ("failure", "failure", "success", "failure", "failure"):
+        breaker.allow()
+        getattr(breaker, f"record_{outcome}")()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["consecutive_failures"] == 2
+
+
+def test_open_rejects_with_time_left(clock):
+    breaker = tripped()
+    clock.now += 4
+    with pytest.raises(CircuitOpen) as excinfo:
+        breaker.allow()
+    assert excinfo.value.retry_after == 6
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_after_reset_timeout_lets_probes_through(clock):
+    breaker = tripped()
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    breaker.allow()
+    with pytest.raises(CircuitOpen) as excinfo:
+        breaker.allow()  # only one probe at a time
+    assert excinfo.value.retry_after == 1
+
+
+def test_successful_probe_closes(clock):
+    breaker = tripped()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = tripped()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 2
+    clock.now += 9
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_cancel_frees_the_probe_slot(clock):
+    breaker = tripped()
+    clock.now += 10
+    breaker.allow()
+    breaker.cancel()
+    assert breaker.state == HALF_OPEN
+    breaker.allow()
+
+
+def test_limiter_sheds_beyond_the_queue():
+    limiter = AdmissionLimiter(max_concurrent=1, max_queue=0)
+    limiter.acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    limiter.release()
+    limiter.acquire()
+    assert limiter.stats()["admitted"] == 2
+    assert limiter.stats()["shed"] == 1
+
+
+def test_limiter_times_out_waiting_for_a_slot():
+    limiter = AdmissionLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+    limiter.acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    stats = limiter.stats()
+    assert stats["timeouts"] == 1
+    assert stats["waiting"] == 0
+    assert stats["in_flight"] == 1
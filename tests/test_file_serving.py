@@ -0,0 +1,128 @@
+import os
+import re
+
+import pytest
+from flask import Flask, request
+from werkzeug.http import http_date
+
+from file_serving import MAX_RANGES, content_disposition, send_stored_file
+
+CONTENT = b"abcdefghijklmnopqrstuvwxyz"
+SHA256 = "0" * 64
+MTIME = 1_700_000_000
+
+
+@pytest.fixture
+def serve(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(CONTENT)
+    os.utime(path, (MTIME, MTIME))
+    app = Flask(__name__)
+
+    def serve(**headers):
+        with app.test_request_context(headers=headers):
+            rv = send_stored_file(request, str(tmp_path), "file.bin", "file.bin", sha256=SHA256)
+            body = b"".join(rv.response)
+            if hasattr(rv.response, "close"):
+                rv.response.close()
+        return rv, body
+
+    return serve
+
+
+def test_whole_file_without_range(serve):
+    rv, body = serve()
+    assert rv.status_code == 200
+    assert body == CONTENT
+    assert rv.headers["Accept-Ranges"] == "bytes"
+
+
+def test_single_range(serve):
+    rv, body = serve(Range="bytes=2-5")
+    assert rv.status_code == 206
+    assert rv.headers["Content-Range"] == "bytes 2-5/26"
+    assert body == b"cdef"
+    assert rv.content_length == 4
+
+
+def test_suffix_range(serve):
+    rv, body = serve(Range="bytes=-3")
+    assert rv.status_code == 206
+    assert rv.headers["Content-Range"] == "bytes 23-25/26"
+    assert body == b"xyz"
+
+
+def test_range_past_the_end_is_clamped(serve):
+    rv, body = serve(Range="bytes=20-100")
+    assert rv.headers["Content-Range"] == "bytes 20-25/26"
+    assert body == b"uvwxyz"
+
+
+def test_unsatisfiable_range(serve):
+    rv, body = serve(Range="bytes=100-200")
+    assert rv.status_code == 416
+    assert rv.headers["Content-Range"] == "bytes */26"
+    assert body == b""
+
+
+def test_multiple_ranges(serve):
+    rv, body = serve(Range="bytes=0-1,10-12")
+    assert rv.status_code == 206
+    boundary = re.fullmatch(r"multipart/byteranges; boundary=(\w+)", rv.headers["Content-Type"]).group(1)
+    assert rv.content_length == len(body)
+    parts = body.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert parts[1].endswith(b"Content-Range: bytes 0-1/26\r\n\r\nab\r\n")
+    assert parts[2].endswith(b"Content-Range: bytes 10-12/26\r\n\r\nklm\r\n")
+
+
+def test_adjacent_ranges_are_merged(serve):
+    rv, body = serve(Range="bytes=0-3,4-8")
+    assert rv.status_code == 206
+    assert rv.headers["Content-Range"] == "bytes 0-8/26"
+    assert body == CONTENT[:9]
+
+
+def test_overlapping_ranges_get_the_whole_file(serve):
+    # werkzeug rejects the header, so it is treated as absent
+    rv, body = serve(Range="bytes=4-6,0-3,5-8")
+    assert rv.status_code == 200
+    assert body == CONTENT
+
+
+def test_too_many_ranges_get_the_whole_file(serve):
+    ranges = ",".join(f"{i * 2}-{i * 2}" for i in range(MAX_RANGES + 1))
+    rv, body = serve(Range=f"bytes={ranges}")
+    assert rv.status_code == 200
+    assert body == CONTENT
+
+
+def test_if_range_with_current_etag(serve):
+    rv, body = serve(Range="bytes=0-2", **{"If-Range": f'"{SHA256}"'})
+    assert rv.status_code == 206
+    assert body == b"abc"
+
+
+def test_if_range_with_stale_etag_sends_whole_file(serve):
+    rv, body = serve(Range="bytes=0-2", **{"If-Range": '"stale"'})
+    assert rv.status_code == 200
+    assert body == CONTENT
+
+
+def test_if_range_with_date(serve):
+    rv, _ = serve(Range="bytes=0-2", **{"If-Range": http_date(MTIME)})
+    assert rv.status_code == 206
+    rv, body = serve(Range="bytes=0-2", **{"If-Range": http_date(MTIME - 60)})
+    assert rv.status_code == 200
+    assert body == CONTENT
+
+
+def test_not_modified_wins_over_range(serve):
+    rv, body = serve(Range="bytes=0-2", **{"If-None-Match": f'"{SHA256}"'})
+    assert rv.status_code == 304
+    assert body == b""
+
+
+def test_content_disposition_non_ascii_name():
+    assert content_disposition("report.pdf") == {"filename": "report.pdf"}
+    assert content_disposition("résumé.pdf") == {"filename": "resume.pdf", "filename*": "UTF-8''r%C3%A9sum%C3%A9.pdf"}
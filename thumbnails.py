@@ -0,0 +1,212 @@
+"""Thumbnail and first-page preview cache for file manager uploads.
+
+Renders are keyed by content hash, so each distinct file is rendered once no
+matter how many folders it appears in, and the result never changes. They
+are produced on a small per-process thread pool: a request for a missing
+render queues it (at most once per key) and waits briefly, so a folder page
+with a thousand images only ever has THUMBNAIL_WORKERS renders running.
+
+The on-disk cache is capped in size. A cache hit refreshes the file's mtime,
+and eviction removes the least recently used files first.
+
+Images need Pillow; PDF previews additionally need pypdfium2. Both are
+optional: without them no preview is offered.
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:  # optional dependency
+    pypdfium2 = None
+
+SIZES = {"thumb": (256, 256), "preview": (1024, 1024)}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+
+logger = logging.getLogger("app.thumbnails")
+
+
+class NoPreview(Exception):
+    pass
+
+
+def can_preview(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return Image is not None
+    if ext == ".pdf":
+        return Image is not None and pypdfium2 is not None
+    return False
+
+
+def _fit(image, kind):
+    image.thumbnail(SIZES[kind])
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _render_pdf(src_path, kind):
+    if pypdfium2 is None:
+        raise NoPreview("pypdfium2 is not installed")
+    try:
+        pdf = pypdfium2.PdfDocument(src_path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            scale = max(SIZES[kind]) / max(width, height, 1)
+            image = page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+    except pypdfium2.PdfiumError as e:
+        raise NoPreview(str(e))
+    return _fit(image, kind)
+
+
+def _render_image(src_path, kind):
+    # Pillow decodes lazily, so a corrupt or truncated file can fail anywhere
+    # up to the final convert(), not just in open()
+    try:
+        image = Image.open(src_path)
+        image.draft("RGB", SIZES[kind])
+        return _fit(ImageOps.exif_transpose(image), kind)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise NoPreview(str(e))
+
+
+def render(src_path, dest_path, kind):
+    """Render ``src_path`` into a JPEG at ``dest_path``.
+
+    Raises NoPreview when the content cannot be previewed (no decoder for it,
+    or the decoder rejects it); anything else is an error of the moment.
+    """
+    if Image is None:
+        raise NoPreview("Pillow is not installed")
+    with open(src_path, "rb") as f:
+        is_pdf = f.read(5) == b"%PDF-"
+
+    image = _render_pdf(src_path, kind) if is_pdf else _render_image(src_path, kind)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), prefix=".render-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, "JPEG", quality=82, optimize=True)
+        os.replace(temp_path, dest_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes, workers=2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._pending = {}
+        self._size = None
+
+    def path(self, sha256, kind):
+        return os.path.join(self.cache_dir, f"{sha256}-{kind}.jpg")
+
+    def _marker(self, sha256, kind):
+        # remembers "this content has no preview" so it is not retried
+        return os.path.join(self.cache_dir, f"{sha256}-{kind}.none")
+
+    def _executor(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thumbnail")
+            self._pending = {}
+        return self._pool
+
+    def lookup(self, sha256, kind):
+        """Return the cached render path, None when there is no preview, or
+        False when it has not been rendered yet."""
+        path = self.path(sha256, kind)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+        if os.path.exists(self._marker(sha256, kind)):
+            return None
+        return False
+
+    def request(self, sha256, kind, src_path):
+        """Queue a render (once per key) and return its future."""
+        key = (sha256, kind)
+        with self._lock:
+            pool = self._executor()
+            future = self._pending.get(key)
+            if future is None:
+                future = pool.submit(self._render, sha256, kind, src_path)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._pending.pop(key, None))
+            return future
+
+    def _render(self, sha256, kind, src_path):
+        dest = self.path(sha256, kind)
+        try:
+            render(src_path, dest, kind)
+        except NoPreview as e:
+            # content that cannot be previewed is remembered, so it is not
+            # re-rendered on every page view; any other failure (a full disk,
+            # the blob missing for a moment) propagates to the waiting request
+            # and is retried on the next one
+            logger.info("No %s for %s: %s", kind, sha256, e)
+            try:
+                open(self._marker(sha256, kind), "w").close()
+            except OSError:
+                logger.warning("Could not write the no-%s marker for %s", kind, sha256, exc_info=True)
+            return None
+        self._account(os.path.getsize(dest))
+        return dest
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            self._size += added
+            if self._size <= self.max_bytes:
+                return
+        self.evict()
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file())
+
+    def evict(self):
+        """Delete least recently used renders until the cache is under 90% of its cap."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
@@ -0,0 +1,120 @@
+"""Streaming multipart upload handling for the file manager.
+
+receive_upload() reads the request body in fixed-size chunks and writes the
+file part straight into a temporary file next to its final location, hashing
+and counting the bytes on the way. Nothing is buffered in memory beyond one
+chunk, and the size limit is enforced while the body is still arriving.
+"""
+import hashlib
+import os
+import tempfile
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class ReceivedFile:
+    def __init__(self, field_name, filename, temp_path):
+        self.field_name = field_name
+        self.filename = filename
+        self.temp_path = temp_path
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def discard(self):
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def move_to(self, final_path):
+        """Atomically rename the received bytes into place."""
+        os.replace(self.temp_path, final_path)
+        self.temp_path = None
+
+
+def receive_upload(req, temp_dir, max_bytes, chunk_size=64 * 1024, file_field="file"):
+    """Stream a multipart/form-data request body to disk.
+
+    Returns ``(fields, received)`` where ``fields`` maps form field names to
+    strings and ``received`` is a ReceivedFile (or None when the request had no
+    file part). The caller must ``move_to()`` or ``discard()`` the file.
+    """
+    mimetype, options = parse_options_header(req.headers.get("Content-Type", ""))
+    boundary = options.get("boundary")
+    if mimetype != "multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data upload")
+    content_length = req.content_length
+    if content_length is not None and content_length > max_bytes + MAX_FIELD_BYTES:
+        raise UploadTooLarge("Upload exceeds the maximum allowed size")
+
+    decoder = MultipartDecoder(boundary.encode("latin-1"))
+    stream = req.stream
+    fields = {}
+    received = None
+    current = None  # ("field", name, parts) or ("file", ReceivedFile, file object)
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    current = ("field", event.name, [])
+                elif isinstance(event, File):
+                    if event.name != file_field or received is not None:
+                        current = ("skip", None, None)
+                    else:
+                        fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix=".upload-")
+                        received = ReceivedFile(event.name, event.filename, temp_path)
+                        current = ("file", received, os.fdopen(fd, "wb"))
+                elif isinstance(event, Data):
+                    kind, target, sink = current
+                    if kind == "field":
+                        sink.append(event.data)
+                        if sum(len(part) for part in sink) > MAX_FIELD_BYTES:
+                            raise UploadError(f"Form field {target!r} is too large")
+                    elif kind == "file":
+                        target.size += len(event.data)
+                        if target.size > max_bytes:
+                            raise UploadTooLarge("Upload exceeds the maximum allowed size")
+                        target._sha256.update(event.data)
+                        sink.write(event.data)
+                    if not event.more_data:
+                        if kind == "field":
+                            fields[target] = b"".join(sink).decode("utf-8", "replace")
+                        elif kind == "file":
+                            sink.close()
+                        current = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except Exception as e:
+        if current and current[0] == "file":
+            current[2].close()
+        if received is not None:
+            received.discard()
+        if isinstance(e, ValueError):
+            # the decoder's way of rejecting a body that ends early or breaks
+            # the multipart syntax
+            raise UploadError("Upload was truncated or malformed") from e
+        raise
+
+    if current and current[0] == "file":
+        current[2].close()
+        received.discard()
+        raise UploadError("Upload was truncated")
+    return fields, received